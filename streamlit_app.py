@@ -4,9 +4,18 @@ Alle Features | E-Mail/SMS Fix | User-Registrierung | Vollständig
 """
 import streamlit as st
 import hashlib
+import re
 import io
 import json
+import html
 import zipfile
+import time
+import threading
+import copy
+import tempfile
+import heapq
+import itertools
+import os
 import calendar as cal_module
 from datetime import datetime, timedelta, date
 from email.mime.multipart import MIMEMultipart
@@ -20,11 +29,18 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
 from twilio.rest import Client
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
 from google.cloud import firestore
 from google.oauth2 import service_account
 from collections import Counter
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # ===== PAGE CONFIG =====
 st.set_page_config(
@@ -45,13 +61,37 @@ WEEKLY_SLOTS = [
     {"id": 3, "day": "saturday", "day_name": "Samstag", "start": "14:00", "end": "17:00"},
 ]
 
-BAVARIA_HOLIDAYS = {
-    "2025": ["2025-01-01", "2025-01-06", "2025-04-18", "2025-04-21", "2025-05-01", 
-             "2025-05-29", "2025-06-09", "2025-06-19", "2025-08-15", "2025-10-03", 
-             "2025-11-01", "2025-12-25", "2025-12-26"],
-    "2026": ["2026-01-01", "2026-01-06", "2026-04-03", "2026-04-06", "2026-05-01", 
-             "2026-05-14", "2026-05-25", "2026-06-04", "2026-08-15", "2026-10-03", 
-             "2026-11-01", "2026-12-25", "2026-12-26"]
+MONATSNAMEN = ["Januar", "Februar", "März", "April", "Mai", "Juni", "Juli",
+               "August", "September", "Oktober", "November", "Dezember"]
+WOCHENTAGE_KURZ = ["Mo", "Di", "Mi", "Do", "Fr", "Sa", "So"]
+DAY_NAMES_DE = {"monday": "Montag", "tuesday": "Dienstag", "wednesday": "Mittwoch", "thursday": "Donnerstag",
+                "friday": "Freitag", "saturday": "Samstag", "sunday": "Sonntag"}
+
+# Helfer pro Schicht, wenn der Slot keine 'capacity' angibt
+DEFAULT_SLOT_CAPACITY = 1
+MAX_SLOT_CAPACITY = 10
+
+# Fallback-Schichtplan, wenn in 'slot_schedules' für ein Datum nichts hinterlegt ist
+DEFAULT_SCHEDULE = {"id": "default", "name": "Standard", "valid_from": "", "valid_to": "",
+                    "slots": WEEKLY_SLOTS, "summer_break": True, "version": 0, "active": True}
+
+# Saison = Oktober bis Mai (Juni-September ist Sommerpause, siehe _slot_calendar)
+SEASON_START_MONTH = 10
+SEASON_END_MONTH = 5
+
+# Feiertage Bayern: feste Termine (Monat, Tag, Name) und Abstand zum Ostersonntag (Tage, Name)
+BAVARIA_FIXED_HOLIDAYS = [
+    (1, 1, "Neujahr"), (1, 6, "Heilige Drei Könige"), (5, 1, "Tag der Arbeit"),
+    (8, 15, "Mariä Himmelfahrt"), (10, 3, "Tag der Deutschen Einheit"), (11, 1, "Allerheiligen"),
+    (12, 25, "1. Weihnachtsfeiertag"), (12, 26, "2. Weihnachtsfeiertag"),
+]
+BAVARIA_EASTER_HOLIDAYS = [
+    (-2, "Karfreitag"), (1, "Ostermontag"), (39, "Christi Himmelfahrt"),
+    (50, "Pfingstmontag"), (60, "Fronleichnam"),
+]
+# Optionale lokale Feiertage, aktivierbar über das Secret LOCAL_HOLIDAYS (kommagetrennt)
+LOCAL_HOLIDAYS = {
+    "augsburger_friedensfest": (8, 8, "Augsburger Friedensfest"),
 }
 
 COLORS = {
@@ -99,9 +139,14 @@ def week_start(d=None):
         d = d.date()
     return d - timedelta(days=d.weekday())
 
+WEEKDAY_INDEX = {"monday":0,"tuesday":1,"wednesday":2,"thursday":3,"friday":4,"saturday":5,"sunday":6}
+
+def slot_capacity(slot_config):
+    """Anzahl Helfer pro Schicht (Standard: DEFAULT_SLOT_CAPACITY)"""
+    return int(slot_config.get('capacity') or DEFAULT_SLOT_CAPACITY)
+
 def slot_date(ws, day):
-    days = {"monday":0,"tuesday":1,"wednesday":2,"thursday":3,"friday":4,"saturday":5,"sunday":6}
-    return (ws + timedelta(days=days.get(day,0))).strftime("%Y-%m-%d")
+    return (ws + timedelta(days=WEEKDAY_INDEX.get(day,0))).strftime("%Y-%m-%d")
 
 def fmt_de(d):
     try:
@@ -111,28 +156,166 @@ def fmt_de(d):
     except:
         return str(d)
 
-def is_holiday(d):
-    if isinstance(d, date):
-        d = d.strftime("%Y-%m-%d")
-    return d in BAVARIA_HOLIDAYS.get(d[:4], [])
-
-def is_summer(d):
+def as_date(d):
+    """'YYYY-MM-DD', datetime oder date -> date"""
+    if isinstance(d, str):
+        return date.fromisoformat(d[:10])
+    if isinstance(d, datetime):
+        return d.date()
+    return d
+
+def easter_sunday(year):
+    """Ostersonntag (gregorianisch, anonymer Algorithmus nach Meeus/Jones/Butcher)"""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return date(year, month, day)
+
+def configured_local_holidays():
+    """Aktive lokale Feiertage aus dem Secret LOCAL_HOLIDAYS, z.B. 'augsburger_friedensfest'"""
     try:
-        if isinstance(d, str):
-            d = datetime.strptime(d, "%Y-%m-%d")
-        return 6 <= d.month <= 9
-    except:
-        return False
+        names = str(st.secrets.get("LOCAL_HOLIDAYS", ""))
+    except Exception:
+        return ()
+    return tuple(sorted(n.strip() for n in names.split(",") if n.strip() in LOCAL_HOLIDAYS))
+
+ACTIVE_LOCAL_HOLIDAYS = configured_local_holidays()
+
+@lru_cache(maxsize=None)
+def holiday_names(year, local=ACTIVE_LOCAL_HOLIDAYS):
+    """Feiertage eines Jahres als {date: Name} - pro Jahr gecacht, nicht verändern"""
+    names = {date(year, m, d): name for m, d, name in BAVARIA_FIXED_HOLIDAYS}
+    easter = easter_sunday(year)
+    for offset, name in BAVARIA_EASTER_HOLIDAYS:
+        names[easter + timedelta(days=offset)] = name
+    for key in local:
+        m, d, name = LOCAL_HOLIDAYS[key]
+        names[date(year, m, d)] = name
+    return names
+
+@lru_cache(maxsize=None)
+def holidays(year, local=ACTIVE_LOCAL_HOLIDAYS):
+    """Feiertage eines Jahres als frozenset[date] für O(1)-Lookups"""
+    return frozenset(holiday_names(year, local))
+
+SEARCH_PREFIX_MAX_LEN = 20
+
+def stats_user_key(email):
+    """Stabiler, feldpfad-sicherer Schlüssel pro Helfer für Statistik-Maps"""
+    return hashlib.md5(normalize_search(email).encode()).hexdigest()[:16]
+
+# Buchungslimits pro Helfer und Zeitraum (0 = unbegrenzt), Einstellung 'booking_limits'
+LIMIT_PERIODS = {'day': 'Tag', 'week': 'Woche', 'month': 'Monat'}
+DEFAULT_BOOKING_LIMITS = {'day': 0, 'week': 0, 'month': 0}
+
+def booking_periods(slot_date):
+    """Zählperioden einer Buchung: {'day': '2025-11-04', 'week': '2025-W45', 'month': '2025-11'}"""
+    d = as_date(slot_date)
+    year, week, _ = d.isocalendar()
+    return {'day': d.strftime("%Y-%m-%d"), 'week': f"{year}-W{week:02d}", 'month': d.strftime("%Y-%m")}
+
+def normalize_search(text):
+    """Suchbegriff normalisieren (klein, ohne Rand-Leerzeichen)"""
+    return (text or '').strip().lower()
+
+def user_search_fields(name, email):
+    """
+    Normalisierte Suchfelder für User-Dokumente:
+    - name_lower / email_lower für Sortierung
+    - search_prefixes: alle Präfixe von Namensteilen und E-Mail für array_contains-Suche
+    """
+    name_lower = normalize_search(name)
+    email_lower = normalize_search(email)
+    tokens = [t for t in re.split(r'[\s\-_.+@]+', f"{name_lower} {email_lower.split('@')[0]}") if t]
+    tokens += name_lower.split() + [email_lower]
+    prefixes = set()
+    for token in tokens:
+        for i in range(1, min(len(token), SEARCH_PREFIX_MAX_LEN) + 1):
+            prefixes.add(token[:i])
+    return {
+        'name_lower': name_lower,
+        'email_lower': email_lower,
+        'search_prefixes': sorted(prefixes)
+    }
 
-def is_blocked(d):
-    return is_holiday(d) or is_summer(d)
+# ===== ARCHIV-BUNDLES (KOMPAKTES MONATSFORMAT) =====
+ARCHIVE_BUNDLE_MAX_BYTES = 900_000  # Firestore-Limit 1 MiB pro Dokument, mit Reserve
+ARCHIVE_BUNDLE_FIELDS = ['slot_date', 'slot_time', 'user_email', 'user_name', 'status', 'created_at', 'cancelled_at']
+ARCHIVE_STATUS_CODES = ['confirmed', 'cancelled']
 
-def block_reason(d):
-    if is_holiday(d):
-        return "Feiertag"
-    elif is_summer(d):
-        return "Sommerpause"
-    return None
+def encode_archive_bundles(month, bookings):
+    """
+    Buchungen eines Monats in kompakte Bundle-Dokumente packen:
+    - Spalten-Arrays ids/day/slot/member/status/created/cancelled (ein Eintrag pro Buchung)
+    - Lookup-Tabellen slots/members, damit Strings nur einmal gespeichert werden
+    - emails: alle Mitglieder des Bundles (für array_contains-Abfragen pro Mitglied)
+    Teilt in mehrere Teile, sobald ARCHIVE_BUNDLE_MAX_BYTES überschritten würde
+    Returns: Liste von Dokument-Dicts (part 0, 1, ...)
+    """
+    chunks, current, size = [], [], 0
+    for b in sorted(bookings, key=lambda b: (b.get('slot_date', ''), b.get('slot_time', ''), b['id'])):
+        # Konservative Schätzung: ID + 4 Integer + 2 Zeitstempel + Mitgliedseintrag (als wäre er jedes Mal neu)
+        entry_size = len(b['id']) + 1 + 4 * 8 + 2 * 33 + 2 * len(b.get('user_email', '')) + len(b.get('user_name', '')) + 16
+        if current and size + entry_size > ARCHIVE_BUNDLE_MAX_BYTES:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(b)
+        size += entry_size
+    if current:
+        chunks.append(current)
+    
+    docs = []
+    for part, chunk in enumerate(chunks):
+        slots, members = {}, {}
+        doc = {'month': month, 'part': part, 'count': len(chunk),
+               'ids': [], 'day': [], 'slot': [], 'member': [], 'status': [], 'created': [], 'cancelled': []}
+        for b in chunk:
+            doc['ids'].append(b['id'])
+            doc['day'].append(int(b['slot_date'][8:10]))
+            doc['slot'].append(slots.setdefault(b.get('slot_time', ''), len(slots)))
+            doc['member'].append(members.setdefault((b.get('user_email', ''), b.get('user_name', '')), len(members)))
+            doc['status'].append(0 if b.get('status') == 'confirmed' else 1)
+            doc['created'].append(bundle_timestamp(b.get('created_at')))
+            doc['cancelled'].append(bundle_timestamp(b.get('cancelled_at')))
+        doc['slots'] = list(slots)
+        doc['members'] = [{'e': e, 'n': n} for e, n in members]
+        doc['emails'] = sorted({e for e, _ in members if e})
+        docs.append(doc)
+    return docs
+
+def bundle_timestamp(value):
+    """Zeitstempel für die Bundle-Spalten created/cancelled als ISO-String (None bleibt None)"""
+    if value is None:
+        return None
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+def decode_archive_bundle(data):
+    """Bundle-Dokument zurück in Buchungs-Dicts (Felder wie in 'archive')"""
+    month, slots, members = data['month'], data.get('slots', []), data.get('members', [])
+    count = len(data.get('ids', []))
+    # Ältere Bundles ohne Zeitstempel-Spalten -> None
+    created = data.get('created') or [None] * count
+    cancelled = data.get('cancelled') or [None] * count
+    return [{
+        'id': doc_id,
+        'slot_date': f"{month}-{day:02d}",
+        'slot_time': slots[slot],
+        'user_email': members[member]['e'],
+        'user_name': members[member]['n'],
+        'status': ARCHIVE_STATUS_CODES[status],
+        'created_at': datetime.fromisoformat(created_at) if created_at else None,
+        'cancelled_at': datetime.fromisoformat(cancelled_at) if cancelled_at else None,
+    } for doc_id, day, slot, member, status, created_at, cancelled_at in zip(
+        data.get('ids', []), data.get('day', []), data.get('slot', []), data.get('member', []), data.get('status', []),
+        created, cancelled
+    )]
 
 def generate_random_password(length=8):
     """Generiert ein sicheres, zufälliges Passwort (nur Buchstaben + Zahlen)"""
@@ -516,7 +699,68 @@ def inject_css(dark=False):
         color: {text_muted};
         border: 1.5px solid {text_muted};
     }}
-    
+
+    /* ===== MONATS- & SAISON-ÜBERSICHT (EINE TABELLE) ===== */
+    .cal-grid {{
+        width: 100%;
+        border-collapse: separate;
+        border-spacing: 3px;
+        table-layout: fixed;
+        font-size: 0.8rem;
+    }}
+
+    .cal-grid th {{
+        background-color: {bg_surface};
+        color: {text_secondary};
+        font-weight: 600;
+        padding: 0.3rem;
+        text-align: center;
+        border-radius: 6px;
+    }}
+
+    .cal-grid td {{
+        background-color: {bg_secondary};
+        border: 1px solid {border_color};
+        border-radius: 6px;
+        padding: 0.25rem;
+        vertical-align: top;
+    }}
+
+    .cal-grid td.outside {{
+        opacity: 0.35;
+    }}
+
+    .cal-grid .cal-day {{
+        font-weight: 700;
+        color: {text_secondary};
+    }}
+
+    .cal-chip {{
+        display: block;
+        margin-top: 2px;
+        padding: 1px 4px;
+        border-radius: 4px;
+        white-space: nowrap;
+        overflow: hidden;
+        text-overflow: ellipsis;
+    }}
+
+    .cal-chip.free {{
+        background-color: {slot_free_bg};
+        border-left: 3px solid {slot_free_border};
+    }}
+
+    .cal-chip.booked {{
+        background-color: {slot_booked_bg};
+        border-left: 3px solid {slot_booked_border};
+    }}
+
+    .cal-chip.blocked {{
+        background-color: {slot_blocked_bg};
+        border-left: 3px solid {slot_blocked_border};
+        opacity: 0.7;
+    }}
+
     /* ===== TYPOGRAPHY ===== */
     h1, h2, h3, h4, h5, h6 {{
         color: {text_primary} !important;
@@ -632,10 +876,65 @@ def inject_css(dark=False):
     </style>
     """, unsafe_allow_html=True)
 
+# ===== REQUEST-COALESCING (SINGLE-FLIGHT) =====
+class SingleFlight:
+    """
+    Prozessweites Request-Coalescing:
+    Gleichzeitige identische Lesezugriffe (über alle Sessions/Threads) teilen sich EINEN Firestore-Call
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.stats = Counter()
+    
+    def do(self, key, fn):
+        """Führt fn() aus - oder wartet auf den bereits laufenden Call mit gleichem Key"""
+        kind = key[0]
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = {'event': threading.Event(), 'result': None, 'error': None}
+                self._inflight[key] = call
+                self.stats[(kind, 'executed')] += 1
+            else:
+                self.stats[(kind, 'coalesced')] += 1
+        
+        if leader:
+            try:
+                call['result'] = fn()
+            except Exception as e:
+                call['error'] = e
+            finally:
+                with self._lock:
+                    del self._inflight[key]
+                call['event'].set()
+        else:
+            call['event'].wait()
+        
+        if call['error'] is not None:
+            raise call['error']
+        # Jeder Aufrufer bekommt eine eigene Kopie (Session-State wird teils mutiert)
+        return copy.deepcopy(call['result'])
+    
+    def report(self):
+        """Zähler pro Read-Typ: ausgeführt / zusammengelegt"""
+        kinds = sorted({kind for kind, _ in self.stats})
+        return [{
+            'Read': kind,
+            'Ausgeführt': self.stats[(kind, 'executed')],
+            'Zusammengelegt': self.stats[(kind, 'coalesced')],
+        } for kind in kinds]
+
+@st.cache_resource
+def get_single_flight():
+    return SingleFlight()
+
 # ===== DATABASE CLASS =====
 class WasserwachtDB:
     def __init__(self):
         self.db = db
+        self.flight = get_single_flight()
         self._init_admin()
     
     def _init_admin(self):
@@ -653,13 +952,18 @@ class WasserwachtDB:
                         'email_notifications':True,
                         'sms_notifications':False,
                         'sms_booking_confirmation':True,
-                        'created_at':firestore.SERVER_TIMESTAMP
+                        'created_at':firestore.SERVER_TIMESTAMP,
+                        'updated_at':firestore.SERVER_TIMESTAMP,
+                        **user_search_fields('Admin',email)
                     })
                     print(f"✅ Admin erstellt: {email}")
                 except Exception as e:
                     print(f"Admin-Erstellung fehlgeschlagen: {e}")
     
     def get_user(self,email):
+        return self.flight.do(('get_user',email),lambda: self._get_user(email))
+    
+    def _get_user(self,email):
         try:
             for doc in self.db.collection('users').where('email','==',email).limit(1).stream():
                 data = doc.to_dict()
@@ -682,8 +986,11 @@ class WasserwachtDB:
                 'email_notifications':True,
                 'sms_notifications':False,
                 'sms_booking_confirmation':True,
-                'created_at':firestore.SERVER_TIMESTAMP
+                'created_at':firestore.SERVER_TIMESTAMP,
+                'updated_at':firestore.SERVER_TIMESTAMP,
+                **user_search_fields(name,email)
             })
+            load_user_directory.clear()
             print(f"✅ User erstellt: {email}")
             return True,"Registrierung erfolgreich"
         except Exception as e:
@@ -694,11 +1001,14 @@ class WasserwachtDB:
         u = self.get_user(email)
         if not u or not u.get('active',True):
             return False,None
-        if u['password_hash'] == hash_pw(password):
+        if u.get('password_hash') == hash_pw(password):
             return True,u
         return False,None
     
     def get_all_users(self):
+        return self.flight.do(('get_all_users',),self._get_all_users)
+    
+    def _get_all_users(self):
         try:
             users = []
             for doc in self.db.collection('users').stream():
@@ -710,18 +1020,145 @@ class WasserwachtDB:
             print(f"❌ get_all_users Fehler: {e}")
             return []
     
+    def count_users(self):
+        """Anzahl User per Aggregation-Query (ohne Dokumente zu laden)"""
+        try:
+            return self.db.collection('users').count().get()[0][0].value
+        except Exception as e:
+            print(f"❌ count_users Fehler: {e}")
+            return 0
+    
+    def search_users(self,term='',role=None,cursor=None,page_size=25):
+        """
+        Indexierte Präfix-Suche über search_prefixes, sortiert nach Name
+        Returns: (users, next_cursor) - next_cursor ist None auf der letzten Seite
+        """
+        try:
+            q = self.db.collection('users')
+            tokens = [t for t in re.split(r'\s+', normalize_search(term)) if t]
+            if tokens:
+                # Längsten Begriff serverseitig suchen, restliche Begriffe auf der Seite filtern
+                tokens.sort(key=len, reverse=True)
+                q = q.where('search_prefixes','array_contains',tokens[0][:SEARCH_PREFIX_MAX_LEN])
+            if role:
+                q = q.where('role','==',role)
+            q = q.order_by('name_lower')
+            
+            # Weitere Begriffe filtern lokal -> so lange nachladen, bis die Seite voll ist
+            # (plus ein Treffer Vorschau, damit es keine leere Folgeseite gibt) oder die Query erschöpft ist
+            matches = []
+            while len(matches) <= page_size:
+                page_q = q.start_after(cursor) if cursor is not None else q
+                docs = list(page_q.limit(page_size+1).stream())
+                for doc in docs:
+                    cursor = doc
+                    data = doc.to_dict()
+                    data['id'] = doc.id
+                    prefixes = set(data.get('search_prefixes',[]))
+                    if all(t[:SEARCH_PREFIX_MAX_LEN] in prefixes for t in tokens[1:]):
+                        matches.append((doc,data))
+                        if len(matches) > page_size:
+                            break
+                if len(docs) <= page_size:
+                    break
+            users = [data for _,data in matches[:page_size]]
+            next_cursor = matches[page_size-1][0] if len(matches) > page_size else None
+            return users,next_cursor
+        except Exception as e:
+            print(f"❌ search_users Fehler: {e}")
+            return [],None
+    
+    def backfill_search_fields(self):
+        """Suchfelder für User ohne (aktuelle) search_prefixes nachtragen"""
+        try:
+            count = 0
+            batch = self.db.batch()
+            for doc in self.db.collection('users').stream():
+                data = doc.to_dict()
+                fields = user_search_fields(data.get('name',''),data.get('email',''))
+                if data.get('search_prefixes') != fields['search_prefixes'] or data.get('name_lower') != fields['name_lower']:
+                    batch.update(doc.reference,{**fields,'updated_at':firestore.SERVER_TIMESTAMP})
+                    count += 1
+                    if count % 400 == 0:
+                        batch.commit()
+                        batch = self.db.batch()
+            if count % 400:
+                batch.commit()
+            if count > 0:
+                load_user_directory.clear()
+                print(f"✅ Suchfelder für {count} User aktualisiert")
+            return count
+        except Exception as e:
+            print(f"❌ backfill_search_fields Fehler: {e}")
+            return 0
+    
     def update_user(self,uid,**kwargs):
         try:
+            if 'name' in kwargs or 'email' in kwargs:
+                # Suchfelder synchron halten
+                if 'name' in kwargs and 'email' in kwargs:
+                    current = {}
+                else:
+                    snap = self.db.collection('users').document(uid).get()
+                    current = snap.to_dict() or {}
+                kwargs.update(user_search_fields(
+                    kwargs.get('name',current.get('name','')),
+                    kwargs.get('email',current.get('email',''))
+                ))
+            kwargs['updated_at'] = firestore.SERVER_TIMESTAMP
             self.db.collection('users').document(uid).update(kwargs)
+            load_user_directory.clear()
+            if 'name' in kwargs or 'email' in kwargs:
+                # Verfügbarkeits-Dokument (falls vorhanden) mitziehen
+                try:
+                    self.db.collection('availability').document(uid).update(
+                        {k:kwargs[k] for k in ('name','email') if k in kwargs})
+                except Exception:
+                    pass
             print(f"✅ User geupdatet: {uid}")
             return True
         except Exception as e:
             print(f"❌ update_user Fehler: {e}")
             return False
     
+    def get_availability(self,uid):
+        """Verfügbarkeit eines Users (weekdays-Bitmaske, extra-Tage, away-Zeiträume) oder {}"""
+        try:
+            snap = self.db.collection('availability').document(uid).get()
+            return snap.to_dict() if snap.exists else {}
+        except Exception as e:
+            print(f"❌ get_availability Fehler: {e}")
+            return {}
+    
+    def save_availability(self,uid,email,name,weekdays,extra,away):
+        """
+        Verfügbarkeit kompakt speichern: ein Dokument pro User in 'availability'
+        weekdays: Bitmaske (Bit 0 = Montag), extra: ['YYYY-MM-DD'], away: [{'from','to'}]
+        Vergangene Einträge werden dabei verworfen
+        """
+        try:
+            today = date.today().strftime("%Y-%m-%d")
+            self.db.collection('availability').document(uid).set({
+                'email':email,'name':name,
+                'weekdays':int(weekdays),
+                'extra':sorted(d for d in set(extra) if d >= today),
+                'away':sorted((a for a in away if a['to'] >= today),key=lambda a: a['from']),
+                'updated_at':firestore.SERVER_TIMESTAMP
+            })
+            print(f"✅ Verfügbarkeit gespeichert: {email}")
+            return True
+        except Exception as e:
+            print(f"❌ save_availability Fehler: {e}")
+            return False
+    
     def delete_user(self,uid):
         try:
-            self.db.collection('users').document(uid).delete()
+            batch = self.db.batch()
+            batch.delete(self.db.collection('users').document(uid))
+            batch.delete(self.db.collection('availability').document(uid))
+            self._record_deletion(batch,'users',uid)
+            batch.commit()
+            load_user_directory.clear()
             print(f"✅ User gelöscht: {uid}")
             return True
         except Exception as e:
@@ -739,7 +1176,8 @@ class WasserwachtDB:
             new_password = generate_random_password(8)
             self.db.collection('users').document(uid).update({
                 'password_hash': hash_pw(new_password),
-                'password_reset_at': firestore.SERVER_TIMESTAMP
+                'password_reset_at': firestore.SERVER_TIMESTAMP,
+                'updated_at': firestore.SERVER_TIMESTAMP
             })
             print(f"✅ Password Reset triggered für User: {uid}")
             return True, new_password
@@ -750,49 +1188,634 @@ class WasserwachtDB:
     
     def get_week_bookings(self, ws):
         """Alle Buchungen für eine Woche laden"""
+        we = (datetime.strptime(ws,'%Y-%m-%d')+timedelta(days=6)).strftime('%Y-%m-%d')
+        return self.get_range_bookings(ws, we)
+
+    def get_range_bookings(self, start, end):
+        """Alle bestätigten Buchungen zwischen start und end (inkl.) mit EINER Query laden"""
+        return self.flight.do(('get_range_bookings',start,end),lambda: self._get_range_bookings(start,end))
+    
+    def _get_range_bookings(self, start, end):
         try:
-            we = (datetime.strptime(ws,'%Y-%m-%d')+timedelta(days=6)).strftime('%Y-%m-%d')
             result = []
             for doc in self.db.collection('bookings')\
-                    .where('slot_date','>=',ws)\
-                    .where('slot_date','<=',we)\
+                    .where('slot_date','>=',start)\
+                    .where('slot_date','<=',end)\
                     .where('status','==','confirmed').stream():
                 data = doc.to_dict()
                 data['id'] = doc.id
                 result.append(data)
             return result
         except Exception as e:
-            print(f"❌ get_week_bookings Fehler: {e}")
+            print(f"❌ get_range_bookings Fehler: {e}")
             # Fallback
             try:
                 result = []
                 for doc in self.db.collection('bookings').where('status','==','confirmed').stream():
                     b = doc.to_dict()
-                    if ws <= b.get('slot_date','') <= we:
+                    if start <= b.get('slot_date','') <= end:
                         b['id'] = doc.id
                         result.append(b)
                 return result
             except:
                 return []
     
-    def create_booking(self,slot_date,slot_time,user_email,user_name,user_phone):
+    def _occupancy_ref(self,slot_date,slot_time):
+        """Belegungs-Dokument eines Slots, z.B. slot_occupancy/2025-11-04_1700"""
+        return self.db.collection('slot_occupancy').document(f"{slot_date}_{slot_time[:5].replace(':','')}")
+    
+    def _read_slot_state(self,txn,slot_date,slot_time):
+        """
+        Belegung (E-Mails) und komplettes Belegungs-Dokument eines Slots innerhalb einer Transaktion lesen
+        Ohne Belegungs-Dokument (Altbestand) wird einmalig per Query gezählt
+        Returns: (members, daten)
+        """
+        snap = self._occupancy_ref(slot_date,slot_time).get(transaction=txn)
+        if snap.exists:
+            data = snap.to_dict()
+            return list(data.get('members',[])),data
+        docs = self.db.collection('bookings')\
+            .where('slot_date','==',slot_date)\
+            .where('slot_time','==',slot_time)\
+            .where('status','==','confirmed').get(transaction=txn)
+        return [d.to_dict().get('user_email','') for d in docs],{}
+    
+    def _read_occupancy(self,txn,slot_date,slot_time):
+        """Aktuelle Belegung (E-Mails) eines Slots innerhalb einer Transaktion lesen"""
+        return self._read_slot_state(txn,slot_date,slot_time)[0]
+    
+    def _write_occupancy(self,txn,slot_date,slot_time,members,capacity=None,**extra):
+        data = {
+            'slot_date':slot_date,'slot_time':slot_time,
+            'members':members,'booked':len(members),
+            'updated_at':firestore.SERVER_TIMESTAMP,
+            **extra
+        }
+        if capacity is not None:
+            data['capacity'] = capacity
+        txn.set(self._occupancy_ref(slot_date,slot_time),data,merge=True)
+    
+    def get_slot_occupancy(self,slot_date,slot_time):
+        """Belegung eines Slots mit EINEM Dokument-Read - Returns: {'booked','capacity','members'} oder None"""
         try:
-            existing = self.get_booking(slot_date,slot_time)
-            if existing:
-                return False,"Slot bereits gebucht"
-            
-            self.db.collection('bookings').add({
-                'slot_date':slot_date,'slot_time':slot_time,
-                'user_email':user_email,'user_name':user_name,
-                'user_phone':user_phone,'status':'confirmed',
-                'created_at':firestore.SERVER_TIMESTAMP
-            })
-            print(f"✅ Buchung erstellt: {user_name} | {slot_date} {slot_time}")
-            return True,"Buchung erfolgreich"
+            snap = self._occupancy_ref(slot_date,slot_time).get()
+            return snap.to_dict() if snap.exists else None
+        except Exception as e:
+            print(f"❌ get_slot_occupancy Fehler: {e}")
+            return None
+    
+    def create_booking(self,slot_date,slot_time,user_email,user_name,user_phone,capacity=None,enforce_limits=True):
+        """
+        Buchung anlegen, solange der Slot noch Plätze hat und die Limits des Helfers es erlauben
+        Belegung, Buchung, Limit-Zähler und Statistik werden in EINER Transaktion geschrieben -
+        gleichzeitige Buchungen können weder Kapazität noch Limits überschreiten
+        """
+        try:
+            capacity = capacity or slot_capacity_for(slot_date,slot_time)
+            limits = self.get_booking_limits() if enforce_limits else {}
+            booking_ref = self.db.collection('bookings').document()
+            
+            @firestore.transactional
+            def _book(txn):
+                members,slot = self._read_slot_state(txn,slot_date,slot_time)
+                counts = self._read_counters(txn,[(user_email,slot_date)],limits)
+                waitlist = slot.get('waitlist',[])
+                if user_email in members:
+                    return False,"Du bist für diesen Slot bereits eingetragen"
+                if len(members) >= capacity:
+                    return False,"Slot bereits gebucht" if capacity == 1 else f"Slot bereits voll ({len(members)}/{capacity})"
+                # Frei gewordene Plätze gehören zuerst der Warteliste, solange das Nachrücken aussteht.
+                # Konnte niemand nachrücken (z.B. alle Wartenden am Limit), ist der Platz wieder frei buchbar
+                if slot.get('promote_pending') and user_email not in [w['email'] for w in waitlist]:
+                    return False,"Freier Platz ist für die Warteliste reserviert"
+                violation = self._limit_violation(counts,user_email,slot_date,limits)
+                if violation:
+                    return False,violation
+                txn.set(booking_ref,{
+                    'slot_date':slot_date,'slot_time':slot_time,
+                    'user_email':user_email,'user_name':user_name,
+                    'user_phone':user_phone,'status':'confirmed',
+                    'created_at':firestore.SERVER_TIMESTAMP,
+                    'updated_at':firestore.SERVER_TIMESTAMP
+                })
+                extra = {}
+                if waitlist:
+                    remaining = [w for w in waitlist if w['email'] != user_email]
+                    extra = {'waitlist':remaining,'waitlist_emails':[w['email'] for w in remaining]}
+                self._write_occupancy(txn,slot_date,slot_time,members+[user_email],capacity,**extra)
+                self._counters_apply(txn,user_email,slot_date,1)
+                self._stats_apply(txn,slot_date,user_email,user_name,1)
+                self._bump_bookings_version(txn)
+                return True,"Buchung erfolgreich"
+            
+            success,msg = _book(self.db.transaction())
+            if success:
+                print(f"✅ Buchung erstellt: {user_name} | {slot_date} {slot_time}")
+            return success,msg
         except Exception as e:
             print(f"❌ create_booking Fehler: {e}")
             return False,str(e)
     
+    def create_bookings_bulk(self,assignments,slots_per_txn=40,progress=None,enforce_limits=True):
+        """
+        Viele Buchungen gebündelt anlegen (z.B. Dienstplan-Vorschlag)
+        assignments: Liste von {'slot_date','slot_time','capacity','user_email','user_name','user_phone'}
+        Pro Transaktion bis zu slots_per_txn Slots: Belegungen und Limit-Zähler lesen, prüfen, alles schreiben
+        Returns: (angelegte Buchungen, übersprungene Einträge mit Grund)
+        """
+        limits = self.get_booking_limits() if enforce_limits else {}
+        by_slot = {}
+        for a in assignments:
+            by_slot.setdefault((a['slot_date'],a['slot_time']),[]).append(a)
+        slot_keys = sorted(by_slot)
+        created,skipped = [],[]
+        
+        for i in range(0,len(slot_keys),slots_per_txn):
+            chunk = slot_keys[i:i+slots_per_txn]
+            
+            @firestore.transactional
+            def _commit(txn):
+                done,rejected = [],[]
+                # Erst alle Belegungen lesen (Transaktionen: Reads vor Writes)
+                states = {key:self._read_slot_state(txn,*key) for key in chunk}
+                occupancy = {key:members for key,(members,_) in states.items()}
+                counts = self._read_counters(txn,[(a['user_email'],a['slot_date']) for key in chunk for a in by_slot[key]],limits)
+                stats = []
+                for key in chunk:
+                    members = occupancy[key]
+                    booked_before = len(members)
+                    for a in by_slot[key]:
+                        violation = self._limit_violation(counts,a['user_email'],a['slot_date'],limits)
+                        if a['user_email'] in members:
+                            rejected.append((a,"bereits eingetragen"))
+                        elif len(members) >= a['capacity']:
+                            rejected.append((a,"Slot inzwischen voll"))
+                        elif states[key][1].get('promote_pending'):
+                            rejected.append((a,"für die Warteliste reserviert"))
+                        elif violation:
+                            rejected.append((a,violation))
+                        else:
+                            members.append(a['user_email'])
+                            self._count_in_memory(counts,a['user_email'],a['slot_date'],1)
+                            txn.set(self.db.collection('bookings').document(),{
+                                'slot_date':a['slot_date'],'slot_time':a['slot_time'],
+                                'user_email':a['user_email'],'user_name':a['user_name'],
+                                'user_phone':a.get('user_phone',''),'status':'confirmed',
+                                'created_at':firestore.SERVER_TIMESTAMP,
+                                'updated_at':firestore.SERVER_TIMESTAMP
+                            })
+                            stats.append((a['slot_date'],a['user_email'],a['user_name'],1))
+                            done.append(a)
+                    if len(members) > booked_before:
+                        self._write_occupancy(txn,key[0],key[1],members,by_slot[key][0]['capacity'])
+                self._counters_apply_many(txn,[(email,slot_date,delta) for slot_date,email,_,delta in stats])
+                self._stats_apply_many(txn,stats)
+                if done:
+                    self._bump_bookings_version(txn)
+                return done,rejected
+            
+            try:
+                done,rejected = _commit(self.db.transaction())
+                created += done
+                skipped += rejected
+            except Exception as e:
+                print(f"❌ create_bookings_bulk Fehler: {e}")
+                skipped += [(a,str(e)) for key in chunk for a in by_slot[key]]
+            if progress:
+                progress(min(i+slots_per_txn,len(slot_keys)),len(slot_keys))
+        
+        print(f"✅ {len(created)} Buchungen gebündelt angelegt, {len(skipped)} übersprungen")
+        return created,skipped
+    
+    # ----- Warteliste (im Belegungs-Dokument) & Outbox -----
+    def join_waitlist(self,slot_date,slot_time,user):
+        """
+        User auf die Warteliste eines vollen Slots setzen
+        Returns: (ok, Meldung)
+        """
+        try:
+            ref = self._occupancy_ref(slot_date,slot_time)
+            
+            @firestore.transactional
+            def _join(txn):
+                members,slot = self._read_slot_state(txn,slot_date,slot_time)
+                waitlist = list(slot.get('waitlist',[]))
+                if user['email'] in members:
+                    return False,"Du bist für diesen Slot bereits eingetragen"
+                if any(w['email'] == user['email'] for w in waitlist):
+                    return False,"Du stehst bereits auf der Warteliste"
+                if len(members) < (slot.get('capacity') or slot_capacity_for(slot_date,slot_time)):
+                    return False,"Slot hat freie Plätze - bitte direkt buchen"
+                waitlist.append({
+                    'email':user['email'],'name':user.get('name',''),'phone':user.get('phone',''),
+                    'sms':bool(user.get('sms_notifications_booking')),
+                    'joined_at':datetime.now(TZ).isoformat()
+                })
+                self._write_waitlist(txn,ref,slot_date,slot_time,members,waitlist)
+                return True,f"Auf der Warteliste (Platz {len(waitlist)})"
+            
+            return _join(self.db.transaction())
+        except Exception as e:
+            print(f"❌ join_waitlist Fehler: {e}")
+            return False,str(e)
+    
+    def leave_waitlist(self,slot_date,slot_time,email):
+        try:
+            ref = self._occupancy_ref(slot_date,slot_time)
+            
+            @firestore.transactional
+            def _leave(txn):
+                snap = ref.get(transaction=txn)
+                if not snap.exists:
+                    return False
+                slot = snap.to_dict()
+                waitlist = [w for w in slot.get('waitlist',[]) if w['email'] != email]
+                if len(waitlist) == len(slot.get('waitlist',[])):
+                    return False
+                self._write_waitlist(txn,ref,slot_date,slot_time,slot.get('members',[]),waitlist)
+                return True
+            
+            return _leave(self.db.transaction())
+        except Exception as e:
+            print(f"❌ leave_waitlist Fehler: {e}")
+            return False
+    
+    def _write_waitlist(self,txn,ref,slot_date,slot_time,members,waitlist,**extra):
+        # waitlist_emails zusätzlich als Array für array_contains-Abfragen pro User
+        txn.set(ref,{
+            'slot_date':slot_date,'slot_time':slot_time,
+            'members':members,'booked':len(members),
+            'waitlist':waitlist,
+            'waitlist_emails':[w['email'] for w in waitlist],
+            'updated_at':firestore.SERVER_TIMESTAMP,
+            **extra
+        },merge=True)
+    
+    def get_user_waitlist(self,email,from_date=None):
+        """Slots, auf deren Warteliste der User steht - Returns: [{'slot_date','slot_time','position'}]"""
+        try:
+            from_date = from_date or date.today().strftime("%Y-%m-%d")
+            result = []
+            for doc in self.db.collection('slot_occupancy').where('waitlist_emails','array_contains',email).stream():
+                slot = doc.to_dict()
+                if slot.get('slot_date','') < from_date:
+                    continue
+                result.append({
+                    'slot_date':slot['slot_date'],'slot_time':slot['slot_time'],
+                    'position':slot['waitlist_emails'].index(email)+1
+                })
+            return sorted(result,key=lambda w: (w['slot_date'],w['slot_time']))
+        except Exception as e:
+            print(f"❌ get_user_waitlist Fehler: {e}")
+            return []
+    
+    def promote_waitlist(self,slot_date,slot_time):
+        """
+        Freie Plätze eines Slots an die Warteliste vergeben (in Reihenfolge)
+        Wer sein Buchungslimit erreicht hat, wird übersprungen und bleibt auf der Liste;
+        danach endet die Reservierung (promote_pending=False) - übrige Plätze sind frei buchbar
+        Buchung, Belegung, Zähler, Statistik und Outbox-Eintrag in EINER Transaktion
+        Returns: Liste der nachgerückten Warteliste-Einträge
+        """
+        try:
+            ref = self._occupancy_ref(slot_date,slot_time)
+            limits = self.get_booking_limits()
+            
+            @firestore.transactional
+            def _promote(txn):
+                members,slot = self._read_slot_state(txn,slot_date,slot_time)
+                waitlist = list(slot.get('waitlist',[]))
+                counts = self._read_counters(txn,[(w['email'],slot_date) for w in waitlist],limits)
+                capacity = slot.get('capacity') or slot_capacity_for(slot_date,slot_time)
+                promoted,kept = [],[]
+                # Vergangene Slots nicht mehr besetzen
+                while waitlist and len(members) < capacity and slot_date >= date.today().strftime("%Y-%m-%d"):
+                    entry = waitlist.pop(0)
+                    if entry['email'] in members:
+                        continue
+                    if self._limit_violation(counts,entry['email'],slot_date,limits):
+                        kept.append(entry)
+                        continue
+                    members.append(entry['email'])
+                    txn.set(self.db.collection('bookings').document(),{
+                        'slot_date':slot_date,'slot_time':slot_time,
+                        'user_email':entry['email'],'user_name':entry.get('name',''),
+                        'user_phone':entry.get('phone',''),'status':'confirmed',
+                        'source':'waitlist',
+                        'created_at':firestore.SERVER_TIMESTAMP,
+                        'updated_at':firestore.SERVER_TIMESTAMP
+                    })
+                    promoted.append(entry)
+                waitlist = kept+waitlist
+                if promoted:
+                    self._counters_apply_many(txn,[(e['email'],slot_date,1) for e in promoted])
+                    self._stats_apply_many(txn,[(slot_date,e['email'],e.get('name',''),1) for e in promoted])
+                    self._bump_bookings_version(txn)
+                    self._enqueue_outbox(txn,'waitlist_promoted',promoted,slot_date=slot_date,slot_time=slot_time)
+                self._write_waitlist(txn,ref,slot_date,slot_time,members,waitlist,promote_pending=False)
+                return promoted
+            
+            promoted = _promote(self.db.transaction())
+            for entry in promoted:
+                print(f"✅ Nachgerückt: {entry['email']} | {slot_date} {slot_time}")
+            return promoted
+        except Exception as e:
+            print(f"❌ promote_waitlist Fehler: {e}")
+            return []
+    
+    def get_pending_promotions(self):
+        """Slots mit freigewordenem Platz und Warteliste, deren Nachrücken noch aussteht"""
+        try:
+            return [(d.to_dict()['slot_date'],d.to_dict()['slot_time'])
+                    for d in self.db.collection('slot_occupancy').where('promote_pending','==',True).stream()]
+        except Exception as e:
+            print(f"❌ get_pending_promotions Fehler: {e}")
+            return []
+    
+    def _enqueue_outbox(self,writer,kind,recipients,**data):
+        """Benachrichtigung im selben Batch/Transaktion vormerken - Versand übernimmt dispatch_outbox()"""
+        writer.set(self.db.collection('outbox').document(),{
+            'type':kind,
+            'recipients':recipients,
+            **data,
+            'status':'pending',
+            'attempts':0,
+            'created_at':firestore.SERVER_TIMESTAMP,
+            'updated_at':firestore.SERVER_TIMESTAMP
+        })
+    
+    def get_outbox_pending(self,limit=50):
+        """Offene Outbox-Einträge - inkl. 'sending'-Einträgen, deren Claim abgelaufen ist (abgestürzter Lauf)"""
+        try:
+            result = []
+            outbox = self.db.collection('outbox')
+            for q in (outbox.where('status','==','pending'),
+                      outbox.where('status','==','sending').where('claimed_until','<',datetime.now(TZ))):
+                for doc in q.limit(limit-len(result)).stream():
+                    data = doc.to_dict()
+                    data['id'] = doc.id
+                    result.append(data)
+                if len(result) >= limit:
+                    break
+            return result
+        except Exception as e:
+            print(f"❌ get_outbox_pending Fehler: {e}")
+            return []
+    
+    def claim_outbox(self,oid,lease_minutes=10):
+        """
+        Outbox-Eintrag transaktional übernehmen (pending -> sending), damit sich überlappende
+        Läufe nicht doppelt versenden. Abgelaufene Claims dürfen neu übernommen werden.
+        Returns: aktueller Eintrag (mit 'delivered') oder None, wenn ein anderer Lauf ihn hat
+        """
+        try:
+            ref = self.db.collection('outbox').document(oid)
+            
+            @firestore.transactional
+            def _claim(txn):
+                snap = ref.get(transaction=txn)
+                if not snap.exists:
+                    return None
+                item = snap.to_dict()
+                now = datetime.now(TZ)
+                if item.get('status') == 'sending' and item.get('claimed_until') and item['claimed_until'] > now:
+                    return None
+                if item.get('status') not in ('pending','sending'):
+                    return None
+                txn.update(ref,{
+                    'status':'sending',
+                    'claimed_until':now+timedelta(minutes=lease_minutes),
+                    'updated_at':firestore.SERVER_TIMESTAMP
+                })
+                item['id'] = oid
+                return item
+            
+            return _claim(self.db.transaction())
+        except Exception as e:
+            print(f"❌ claim_outbox Fehler: {e}")
+            return None
+    
+    def mark_outbox_delivered(self,oid,key):
+        """Einzelnen Empfänger als zugestellt vermerken - wird bei einem erneuten Versuch übersprungen"""
+        try:
+            self.db.collection('outbox').document(oid).update({
+                'delivered':firestore.ArrayUnion([key]),
+                'updated_at':firestore.SERVER_TIMESTAMP
+            })
+        except Exception as e:
+            print(f"❌ mark_outbox_delivered Fehler: {e}")
+    
+    def mark_outbox(self,oid,success,msg='',max_attempts=3):
+        """Versandergebnis festhalten und Claim freigeben - nach max_attempts Fehlversuchen 'failed'"""
+        try:
+            ref = self.db.collection('outbox').document(oid)
+            snap = ref.get()
+            attempts = (snap.to_dict() or {}).get('attempts',0)+1 if snap.exists else 1
+            ref.update({
+                'status':'sent' if success else ('failed' if attempts >= max_attempts else 'pending'),
+                'attempts':attempts,
+                'claimed_until':None,
+                'last_result':msg,
+                'updated_at':firestore.SERVER_TIMESTAMP
+            })
+        except Exception as e:
+            print(f"❌ mark_outbox Fehler: {e}")
+    
+    # ----- Umbuchung & Tausch (Admin) -----
+    def _rebooking_doc(self,b,user,source_id):
+        return {
+            'slot_date':b['slot_date'],'slot_time':b['slot_time'],
+            'user_email':user['email'],'user_name':user.get('name',''),
+            'user_phone':user.get('phone',''),'status':'confirmed',
+            'reassigned_from':source_id,
+            'created_at':firestore.SERVER_TIMESTAMP,
+            'updated_at':firestore.SERVER_TIMESTAMP
+        }
+    
+    def _retire_booking(self,txn,ref,changed_by,new_email):
+        txn.update(ref,{
+            'status':'cancelled',
+            'cancelled_by':changed_by,
+            'reassigned_to':new_email,
+            'cancelled_at':firestore.SERVER_TIMESTAMP,
+            'updated_at':firestore.SERVER_TIMESTAMP
+        })
+    
+    def reassign_booking(self,bid,new_user,changed_by,comment='',notify=True,enforce_limits=True):
+        """
+        Buchung atomar auf einen anderen User übertragen - der Platz ist zu keinem Zeitpunkt frei
+        Alte Buchung -> storniert (reassigned_to), neue Buchung, Belegung, Zähler, Statistik
+        und EIN Outbox-Eintrag für beide User in EINER Transaktion
+        Returns: (ok, Meldung)
+        """
+        try:
+            ref = self.db.collection('bookings').document(bid)
+            new_ref = self.db.collection('bookings').document()
+            limits = self.get_booking_limits() if enforce_limits else {}
+            
+            @firestore.transactional
+            def _reassign(txn):
+                snap = ref.get(transaction=txn)
+                if not snap.exists or snap.to_dict().get('status') != 'confirmed':
+                    return False,"Buchung nicht (mehr) vorhanden"
+                b = snap.to_dict()
+                members = self._read_occupancy(txn,b['slot_date'],b['slot_time'])
+                counts = self._read_counters(txn,[(new_user['email'],b['slot_date'])],limits)
+                if new_user['email'] in members:
+                    return False,f"{new_user.get('name','')} ist für diesen Slot bereits eingetragen"
+                violation = self._limit_violation(counts,new_user['email'],b['slot_date'],limits)
+                if violation:
+                    return False,f"{new_user.get('name','')}: {violation}"
+                
+                self._retire_booking(txn,ref,changed_by,new_user['email'])
+                txn.set(new_ref,self._rebooking_doc(b,new_user,bid))
+                members = [new_user['email'] if m == b['user_email'] else m for m in members]
+                if new_user['email'] not in members:
+                    members.append(new_user['email'])
+                self._write_occupancy(txn,b['slot_date'],b['slot_time'],members)
+                self._counters_apply_many(txn,[(b['user_email'],b['slot_date'],-1),(new_user['email'],b['slot_date'],1)])
+                self._stats_apply_many(txn,[(b['slot_date'],b['user_email'],b.get('user_name',''),-1),
+                                            (b['slot_date'],new_user['email'],new_user.get('name',''),1)])
+                self._bump_bookings_version(txn)
+                if notify:
+                    shift = {'slot_date':b['slot_date'],'slot_time':b['slot_time']}
+                    self._enqueue_outbox(txn,'rebooking',[
+                        {'email':b['user_email'],'name':b.get('user_name',''),'old':shift,'new':None},
+                        {'email':new_user['email'],'name':new_user.get('name',''),'old':None,'new':shift},
+                    ],comment=comment)
+                return True,f"Slot von {b.get('user_name','')} auf {new_user.get('name','')} übertragen"
+            
+            success,msg = _reassign(self.db.transaction())
+            if success:
+                print(f"✅ Umbuchung: {bid} -> {new_user['email']}")
+            return success,msg
+        except Exception as e:
+            print(f"❌ reassign_booking Fehler: {e}")
+            return False,str(e)
+    
+    def swap_bookings(self,bid_a,bid_b,changed_by,comment='',notify=True,enforce_limits=True):
+        """
+        Zwei Buchungen verschiedener User atomar tauschen (A übernimmt B's Slot und umgekehrt)
+        Beide Belegungen, Zähler, Statistik und EIN Outbox-Eintrag in EINER Transaktion
+        Returns: (ok, Meldung)
+        """
+        try:
+            refs = [self.db.collection('bookings').document(bid) for bid in (bid_a,bid_b)]
+            new_refs = [self.db.collection('bookings').document() for _ in refs]
+            limits = self.get_booking_limits() if enforce_limits else {}
+            
+            @firestore.transactional
+            def _swap(txn):
+                snaps = [r.get(transaction=txn) for r in refs]
+                if not all(sn.exists and sn.to_dict().get('status') == 'confirmed' for sn in snaps):
+                    return False,"Buchung nicht (mehr) vorhanden"
+                a,b = [sn.to_dict() for sn in snaps]
+                if a['user_email'] == b['user_email']:
+                    return False,"Beide Buchungen gehören demselben User"
+                if (a['slot_date'],a['slot_time']) == (b['slot_date'],b['slot_time']):
+                    return False,"Beide Buchungen liegen im selben Slot"
+                members_a = self._read_occupancy(txn,a['slot_date'],a['slot_time'])
+                members_b = self._read_occupancy(txn,b['slot_date'],b['slot_time'])
+                counts = self._read_counters(txn,[(a['user_email'],b['slot_date']),(b['user_email'],a['slot_date'])],limits)
+                if a['user_email'] in members_b:
+                    return False,f"{a.get('user_name','')} ist im Slot {fmt_de(b['slot_date'])} bereits eingetragen"
+                if b['user_email'] in members_a:
+                    return False,f"{b.get('user_name','')} ist im Slot {fmt_de(a['slot_date'])} bereits eingetragen"
+                # Limits nach dem Tausch prüfen: eigenen alten Dienst abziehen, neuen prüfen
+                self._count_in_memory(counts,a['user_email'],a['slot_date'],-1)
+                self._count_in_memory(counts,b['user_email'],b['slot_date'],-1)
+                for user,target in ((a,b),(b,a)):
+                    violation = self._limit_violation(counts,user['user_email'],target['slot_date'],limits)
+                    if violation:
+                        return False,f"{user.get('user_name','')}: {violation}"
+                
+                user_a = {'email':a['user_email'],'name':a.get('user_name',''),'phone':a.get('user_phone','')}
+                user_b = {'email':b['user_email'],'name':b.get('user_name',''),'phone':b.get('user_phone','')}
+                self._retire_booking(txn,refs[0],changed_by,b['user_email'])
+                self._retire_booking(txn,refs[1],changed_by,a['user_email'])
+                txn.set(new_refs[0],self._rebooking_doc(a,user_b,bid_a))
+                txn.set(new_refs[1],self._rebooking_doc(b,user_a,bid_b))
+                self._write_occupancy(txn,a['slot_date'],a['slot_time'],
+                                      [b['user_email'] if m == a['user_email'] else m for m in members_a])
+                self._write_occupancy(txn,b['slot_date'],b['slot_time'],
+                                      [a['user_email'] if m == b['user_email'] else m for m in members_b])
+                self._counters_apply_many(txn,[
+                    (a['user_email'],a['slot_date'],-1),(a['user_email'],b['slot_date'],1),
+                    (b['user_email'],b['slot_date'],-1),(b['user_email'],a['slot_date'],1),
+                ])
+                self._stats_apply_many(txn,[
+                    (a['slot_date'],a['user_email'],user_a['name'],-1),(b['slot_date'],a['user_email'],user_a['name'],1),
+                    (b['slot_date'],b['user_email'],user_b['name'],-1),(a['slot_date'],b['user_email'],user_b['name'],1),
+                ])
+                self._bump_bookings_version(txn)
+                if notify:
+                    shift_a = {'slot_date':a['slot_date'],'slot_time':a['slot_time']}
+                    shift_b = {'slot_date':b['slot_date'],'slot_time':b['slot_time']}
+                    self._enqueue_outbox(txn,'rebooking',[
+                        {'email':user_a['email'],'name':user_a['name'],'old':shift_a,'new':shift_b},
+                        {'email':user_b['email'],'name':user_b['name'],'old':shift_b,'new':shift_a},
+                    ],comment=comment)
+                return True,f"{user_a['name']} und {user_b['name']} getauscht"
+            
+            success,msg = _swap(self.db.transaction())
+            if success:
+                print(f"✅ Tausch: {bid_a} <-> {bid_b}")
+            return success,msg
+        except Exception as e:
+            print(f"❌ swap_bookings Fehler: {e}")
+            return False,str(e)
+    
+    def rebuild_slot_occupancy(self,from_date=None):
+        """
+        Belegung (members/booked) ab from_date aus den bestätigten Buchungen neu zählen (z.B. nach Restore)
+        Warteliste, promote_pending und Kapazität bleiben erhalten; Wartende mit Buchung werden ausgetragen.
+        Dokumente ohne Belegung und ohne Warteliste werden gelöscht.
+        Returns: Anzahl geschriebener Dokumente
+        """
+        try:
+            members = {}
+            q = self.db.collection('bookings').where('status','==','confirmed')
+            if from_date:
+                q = q.where('slot_date','>=',from_date)
+            for doc in q.select(['slot_date','slot_time','user_email']).stream():
+                b = doc.to_dict()
+                key = (b['slot_date'],b['slot_time'])
+                members.setdefault(key,[]).append(b.get('user_email',''))
+            
+            q = self.db.collection('slot_occupancy')
+            if from_date:
+                q = q.where('slot_date','>=',from_date)
+            existing = {}
+            for doc in q.stream():
+                data = doc.to_dict()
+                existing[(data.get('slot_date',''),data.get('slot_time',''))] = (doc.reference,data)
+            
+            count,batch = 0,self.db.batch()
+            for key in set(members) | set(existing):
+                emails = members.get(key,[])
+                ref,data = existing.get(key,(self._occupancy_ref(*key),{}))
+                waitlist = [w for w in data.get('waitlist',[]) if w['email'] not in emails]
+                if not emails and not waitlist and not data.get('promote_pending'):
+                    batch.delete(ref)
+                else:
+                    batch.set(ref,{
+                        'slot_date':key[0],'slot_time':key[1],
+                        'members':emails,'booked':len(emails),
+                        'waitlist':waitlist,
+                        'waitlist_emails':[w['email'] for w in waitlist],
+                        'updated_at':firestore.SERVER_TIMESTAMP
+                    },merge=True)
+                count += 1
+                if count % 400 == 0:
+                    batch.commit()
+                    batch = self.db.batch()
+            if count % 400:
+                batch.commit()
+            return count
+        except Exception as e:
+            print(f"❌ rebuild_slot_occupancy Fehler: {e}")
+            return 0
+    
     def get_booking(self,slot_date,slot_time):
         try:
             for doc in self.db.collection('bookings')\
@@ -826,55 +1849,856 @@ class WasserwachtDB:
             print(f"❌ get_user_bookings Fehler: {e}")
             return []
     
-    def cancel_booking(self,bid,cancelled_by):
+    def count_user_bookings(self,email):
+        """Anzahl bestätigter Buchungen eines Users per Aggregation-Query"""
         try:
-            self.db.collection('bookings').document(bid).update({
-                'status':'cancelled',
-                'cancelled_by':cancelled_by,
-                'cancelled_at':firestore.SERVER_TIMESTAMP
-            })
-            print(f"✅ Buchung storniert: {bid}")
-            return True
+            return self.db.collection('bookings')\
+                .where('user_email','==',email)\
+                .where('status','==','confirmed')\
+                .count().get()[0][0].value
         except Exception as e:
-            print(f"❌ cancel_booking Fehler: {e}")
-            return False
+            print(f"❌ count_user_bookings Fehler: {e}")
+            return 0
     
-    def get_setting(self,key,default=''):
+    def get_user_future_bookings(self,email):
+        """Zukünftige Buchungen eines Users - serverseitig nach Datum sortiert"""
         try:
-            doc = self.db.collection('settings').document(key).get()
-            return doc.to_dict().get('value',default) if doc.exists else default
-        except:
-            return default
+            today = datetime.now().strftime("%Y-%m-%d")
+            bookings = []
+            for doc in self.db.collection('bookings')\
+                    .where('user_email','==',email)\
+                    .where('status','==','confirmed')\
+                    .where('slot_date','>=',today)\
+                    .order_by('slot_date').stream():
+                data = doc.to_dict()
+                data['id'] = doc.id
+                bookings.append(data)
+            return bookings
+        except Exception as e:
+            print(f"❌ get_user_future_bookings Fehler: {e}")
+            return []
     
-    def set_setting(self,key,value):
+    def get_user_past_bookings_page(self,email,collection='bookings',cursor=None,page_size=20):
+        """
+        Eine Seite vergangener Buchungen (neueste zuerst) aus 'bookings', 'archive' oder 'archive_bundles'
+        Returns: (bookings, next_cursor) - next_cursor ist None, wenn die Collection erschöpft ist
+        """
         try:
-            self.db.collection('settings').document(key).set({
-                'value':value,
-                'updated_at':firestore.SERVER_TIMESTAMP
-            },merge=True)
-            return True
-        except:
-            return False
+            if collection == 'archive_bundles':
+                return self._user_bundle_page(email,cursor,page_size)
+            q = self.db.collection(collection)\
+                .where('user_email','==',email)\
+                .where('status','==','confirmed')
+            if collection == 'bookings':
+                q = q.where('slot_date','<',datetime.now().strftime("%Y-%m-%d"))
+            q = q.order_by('slot_date',direction=firestore.Query.DESCENDING)
+            if cursor is not None:
+                q = q.start_after(cursor)
+            
+            # Ein Dokument mehr laden, um ohne Extra-Query zu wissen, ob es weitergeht
+            docs = list(q.limit(page_size+1).stream())
+            bookings = []
+            for doc in docs[:page_size]:
+                data = doc.to_dict()
+                data['id'] = doc.id
+                bookings.append(data)
+            next_cursor = docs[page_size-1] if len(docs) > page_size else None
+            return bookings,next_cursor
+        except Exception as e:
+            print(f"❌ get_user_past_bookings_page Fehler: {e}")
+            return [],None
     
-    def archive_old(self):
-        """Alte Buchungen archivieren"""
+    def _user_bundle_page(self,email,cursor=None,page_size=20):
+        """
+        Eigene Buchungen aus 'archive_bundles' seitenweise (neueste zuerst)
+        Nur Bundles mit dem Mitglied im emails-Array werden gelesen; Cursor ist das letzte
+        gelesene Bundle - eine Seite enthält immer ganze Bundles (ggf. etwas mehr als page_size)
+        """
+        q = self.db.collection('archive_bundles')\
+            .where('emails','array_contains',email)\
+            .order_by('month',direction=firestore.Query.DESCENDING)\
+            .order_by('part',direction=firestore.Query.DESCENDING)
+        bookings = []
+        while len(bookings) < page_size:
+            page_q = q.start_after(cursor) if cursor is not None else q
+            docs = list(page_q.limit(page_size).stream())
+            for doc in docs:
+                own = [b for b in decode_archive_bundle(doc.to_dict())
+                       if b['user_email'] == email and b['status'] == 'confirmed']
+                bookings.extend(sorted(own,key=lambda b:(b['slot_date'],b['slot_time']),reverse=True))
+                cursor = doc
+                if len(bookings) >= page_size:
+                    break
+            if len(docs) < page_size and (not docs or cursor == docs[-1]):
+                return bookings,None
+        return bookings,cursor
+    
+    def archive_query(self,start=None,end=None,email=None):
+        """Archiv-Query mit Zeitraum- und Mitgliedsfilter (serverseitig ausgewertet)"""
+        q = self.db.collection('archive')
+        if email:
+            q = q.where('user_email','==',email)
+        if start:
+            q = q.where('slot_date','>=',start.strftime("%Y-%m-%d"))
+        if end:
+            q = q.where('slot_date','<=',end.strftime("%Y-%m-%d"))
+        return q
+    
+    def count_archive(self,start=None,end=None,email=None):
+        """Anzahl archivierter Buchungen im Filter per Aggregation-Query"""
         try:
-            months = 12
-            archive_date = (datetime.now()-timedelta(days=30*months)).strftime("%Y-%m-%d")
-            count = 0
-            for doc in self.db.collection('bookings').where('slot_date','<',archive_date).stream():
-                self.db.collection('archive').add(doc.to_dict())
-                doc.reference.delete()
-                count += 1
-            if count > 0:
-                print(f"✅ {count} Buchungen archiviert")
-            return count
+            return self.archive_query(start,end,email).count().get()[0][0].value
         except Exception as e:
-            print(f"❌ archive_old Fehler: {e}")
+            print(f"❌ count_archive Fehler: {e}")
             return 0
-
-ww_db = WasserwachtDB()
-
+    
+    def get_archive_page(self,start=None,end=None,email=None,cursor=None,page_size=50):
+        """
+        Eine Seite archivierter Buchungen (neueste zuerst)
+        Returns: (bookings, next_cursor) - next_cursor ist None auf der letzten Seite
+        """
+        try:
+            q = self.archive_query(start,end,email)\
+                .order_by('slot_date',direction=firestore.Query.DESCENDING)
+            if cursor is not None:
+                q = q.start_after(cursor)
+            docs = list(q.limit(page_size+1).stream())
+            bookings = []
+            for doc in docs[:page_size]:
+                data = doc.to_dict()
+                data['id'] = doc.id
+                bookings.append(data)
+            next_cursor = docs[page_size-1] if len(docs) > page_size else None
+            return bookings,next_cursor
+        except Exception as e:
+            print(f"❌ get_archive_page Fehler: {e}")
+            return [],None
+    
+    def cancel_booking(self,bid,cancelled_by):
+        try:
+            ref = self.db.collection('bookings').document(bid)
+            
+            @firestore.transactional
+            def _cancel(txn):
+                snap = ref.get(transaction=txn)
+                if not snap.exists:
+                    return False
+                b = snap.to_dict()
+                confirmed = b.get('status') == 'confirmed'
+                waiting = False
+                if confirmed:
+                    members,slot = self._read_slot_state(txn,b.get('slot_date',''),b.get('slot_time',''))
+                    waiting = bool(slot.get('waitlist'))
+                txn.update(ref,{
+                    'status':'cancelled',
+                    'cancelled_by':cancelled_by,
+                    'cancelled_at':firestore.SERVER_TIMESTAMP,
+                    'updated_at':firestore.SERVER_TIMESTAMP
+                })
+                self._bump_bookings_version(txn)
+                if confirmed:
+                    self._release_occupancy(txn,b,members,waiting)
+                    self._counters_apply(txn,b.get('user_email',''),b.get('slot_date',''),-1)
+                    self._stats_apply(txn,b.get('slot_date',''),b.get('user_email',''),b.get('user_name',''),-1)
+                return b if waiting else True
+            
+            result = _cancel(self.db.transaction())
+            if not result:
+                return False
+            if isinstance(result,dict):
+                # Nachrücken läuft im Hintergrund - keine Wartezeit für den Stornierenden
+                schedule_waitlist_promotion(result.get('slot_date',''),result.get('slot_time',''))
+            print(f"✅ Buchung storniert: {bid}")
+            return True
+        except Exception as e:
+            print(f"❌ cancel_booking Fehler: {e}")
+            return False
+    
+    def _release_occupancy(self,txn,b,members,waiting=False):
+        """
+        Platz eines (bisher bestätigten) Buchungs-Dicts im Belegungs-Dokument freigeben
+        waiting: Warteliste vorhanden -> Slot für das Nachrücken markieren (falls der Job ausfällt, holt der Sweep es nach)
+        """
+        if b.get('user_email','') in members:
+            members.remove(b.get('user_email',''))
+        extra = {'promote_pending':True} if waiting else {}
+        self._write_occupancy(txn,b.get('slot_date',''),b.get('slot_time',''),members,**extra)
+    
+    def delete_booking(self,bid):
+        """Buchung endgültig löschen (Admin) - Statistik wird mitgeführt"""
+        try:
+            ref = self.db.collection('bookings').document(bid)
+            
+            @firestore.transactional
+            def _delete(txn):
+                snap = ref.get(transaction=txn)
+                if not snap.exists:
+                    return False
+                b = snap.to_dict()
+                confirmed = b.get('status') == 'confirmed'
+                waiting = False
+                if confirmed:
+                    members,slot = self._read_slot_state(txn,b.get('slot_date',''),b.get('slot_time',''))
+                    waiting = bool(slot.get('waitlist'))
+                txn.delete(ref)
+                self._record_deletion(txn,'bookings',bid)
+                self._bump_bookings_version(txn)
+                if confirmed:
+                    self._release_occupancy(txn,b,members,waiting)
+                    self._counters_apply(txn,b.get('user_email',''),b.get('slot_date',''),-1)
+                    self._stats_apply(txn,b.get('slot_date',''),b.get('user_email',''),b.get('user_name',''),-1)
+                return b if waiting else True
+            
+            result = _delete(self.db.transaction())
+            if not result:
+                return False
+            if isinstance(result,dict):
+                schedule_waitlist_promotion(result.get('slot_date',''),result.get('slot_time',''))
+            print(f"✅ Buchung gelöscht: {bid}")
+            return True
+        except Exception as e:
+            print(f"❌ delete_booking Fehler: {e}")
+            return False
+    
+    # ----- Löschungen für Delta-Backups (Collection 'deletions') -----
+    def _record_deletion(self,writer,collection,doc_id):
+        """Tombstone schreiben, damit Delta-Backups auch Löschungen enthalten"""
+        writer.set(self.db.collection('deletions').document(f"{collection}_{doc_id}"),{
+            'collection':collection,'doc_id':doc_id,
+            'deleted_at':firestore.SERVER_TIMESTAMP,
+            'updated_at':firestore.SERVER_TIMESTAMP
+        })
+    
+    # ----- Buchungs-Version (Cache-Key für Statistik-Caches) -----
+    def _bump_bookings_version(self,writer):
+        """Versionszähler im selben Batch/Transaktion wie die Buchungsänderung erhöhen"""
+        writer.set(self.db.collection('settings').document('bookings_version'),{
+            'value':firestore.Increment(1),
+            'updated_at':firestore.SERVER_TIMESTAMP
+        },merge=True)
+    
+    def get_slot_schedules(self):
+        """Alle Schichtpläne (inkl. inaktiver) für die Verwaltung, nach Gültigkeitsbeginn sortiert"""
+        try:
+            schedules = []
+            for doc in self.db.collection('slot_schedules').stream():
+                data = doc.to_dict()
+                data['id'] = doc.id
+                schedules.append(data)
+            return sorted(schedules,key=lambda s:s.get('valid_from') or '')
+        except Exception as e:
+            print(f"❌ get_slot_schedules Fehler: {e}")
+            return []
+    
+    def save_slot_schedule(self,schedule_id,data,updated_by):
+        """
+        Schichtplan anlegen/ändern (versioniert): die bisherige Fassung wird
+        in 'revisions' abgelegt, die Version hochgezählt - alles in einer Transaktion
+        Returns: (success, message)
+        """
+        try:
+            ref = self.db.collection('slot_schedules').document(schedule_id) if schedule_id \
+                else self.db.collection('slot_schedules').document()
+            
+            @firestore.transactional
+            def _save(txn):
+                snap = ref.get(transaction=txn)
+                version = 1
+                if snap.exists:
+                    old = snap.to_dict()
+                    version = int(old.get('version',0)) + 1
+                    txn.set(ref.collection('revisions').document(str(old.get('version',0))),old)
+                txn.set(ref,{
+                    **data,'version':version,
+                    'updated_by':updated_by,'updated_at':firestore.SERVER_TIMESTAMP
+                })
+                return version
+            
+            version = _save(self.db.transaction())
+            return True,f"Schichtplan gespeichert (Version {version})"
+        except Exception as e:
+            print(f"❌ save_slot_schedule Fehler: {e}")
+            return False,str(e)
+    
+    def get_bookings_version(self):
+        """Aktuelle Buchungs-Version (1 Dokument-Read)"""
+        try:
+            return int(self.get_setting('bookings_version',0) or 0)
+        except (TypeError,ValueError):
+            return 0
+    
+    # ----- Statistik-Rollups (Collection 'stats') -----
+    # ----- Buchungslimits (Zähler-Dokumente je Helfer und Periode) -----
+    def get_booking_limits(self):
+        """Konfigurierte Limits {'day','week','month'} (0 = unbegrenzt)"""
+        try:
+            limits = json.loads(self.get_setting('booking_limits','') or '{}')
+        except ValueError:
+            limits = {}
+        return {p:int(limits.get(p,0) or 0) for p in DEFAULT_BOOKING_LIMITS}
+    
+    def _counter_ids(self,email,slot_date):
+        key = stats_user_key(email)
+        return {p:f"{key}_{period}" for p,period in booking_periods(slot_date).items()}
+    
+    def _read_counters(self,txn,entries,limits):
+        """
+        Zähler für [(email, slot_date)] mit EINEM Batch-Read lesen - nur Perioden mit aktivem Limit
+        Returns: {counter_id: count}
+        """
+        ids = {cid for email,slot_date in entries
+               for p,cid in self._counter_ids(email,slot_date).items() if limits.get(p)}
+        counts = dict.fromkeys(ids,0)
+        if ids:
+            refs = [self.db.collection('member_counters').document(cid) for cid in ids]
+            for snap in self.db.get_all(refs,transaction=txn):
+                if snap.exists:
+                    # Nie unter 0 zählen (z.B. Stornierung einer Buchung aus der Zeit vor den Zählern)
+                    counts[snap.id] = max(snap.to_dict().get('count',0),0)
+        return counts
+    
+    def _limit_violation(self,counts,email,slot_date,limits):
+        """Fehlermeldung, falls eine weitere Buchung ein Limit überschreitet, sonst None"""
+        for p,cid in self._counter_ids(email,slot_date).items():
+            if limits.get(p) and counts.get(cid,0) >= limits[p]:
+                if p == 'day' and limits[p] == 1:
+                    return "Du hast an diesem Tag bereits einen Dienst"
+                return f"Limit erreicht: maximal {limits[p]} Dienst(e) pro {LIMIT_PERIODS[p]}"
+        return None
+    
+    def _count_in_memory(self,counts,email,slot_date,delta):
+        """Gelesene Zählerstände für weitere Prüfungen in derselben Transaktion mitführen"""
+        for cid in self._counter_ids(email,slot_date).values():
+            if cid in counts:
+                counts[cid] += delta
+    
+    def _counters_apply(self,writer,email,slot_date,delta):
+        """Tages-, Wochen- und Monatszähler des Helfers anpassen"""
+        self._counters_apply_many(writer,[(email,slot_date,delta)])
+    
+    def _counters_apply_many(self,writer,entries):
+        """Wie _counters_apply für viele Buchungen - je Zähler-Dokument nur EIN Write"""
+        deltas,emails = Counter(),{}
+        for email_addr,slot_date,delta in entries:
+            for cid in self._counter_ids(email_addr,slot_date).values():
+                deltas[cid] += delta
+                emails[cid] = email_addr
+        for cid,delta in deltas.items():
+            if delta:
+                writer.set(self.db.collection('member_counters').document(cid),{
+                    'email':emails[cid],'period':cid.split('_',1)[1],
+                    'count':firestore.Increment(delta),
+                    'updated_at':firestore.SERVER_TIMESTAMP
+                },merge=True)
+    
+    def ensure_member_counters(self):
+        """Limit-Zähler einmalig aus den Bestandsbuchungen aufbauen, falls das noch nie geschehen ist"""
+        if self.get_setting('member_counters_built',''):
+            return 0
+        total = self.rebuild_member_counters()
+        if total is None:
+            return 0
+        self.set_setting('member_counters_built',datetime.now(TZ).isoformat())
+        return total
+    
+    def rebuild_member_counters(self):
+        """Limit-Zähler ab Beginn des laufenden Monats bzw. der laufenden Woche neu aus 'bookings' aufbauen"""
+        try:
+            today = date.today()
+            since = min(today.replace(day=1),week_start(today)).strftime("%Y-%m-%d")
+            for docs in iter_query_pages(self.db.collection('member_counters')):
+                batch = self.db.batch()
+                for doc in docs:
+                    batch.delete(doc.reference)
+                batch.commit()
+            counts,emails = Counter(),{}
+            q = self.db.collection('bookings')\
+                .where('slot_date','>=',since)\
+                .where('status','==','confirmed')\
+                .select(['slot_date','user_email'])
+            for doc in q.stream():
+                b = doc.to_dict()
+                for cid in self._counter_ids(b.get('user_email',''),b['slot_date']).values():
+                    counts[cid] += 1
+                    emails[cid] = b.get('user_email','')
+            items = list(counts.items())
+            for i in range(0,len(items),RESTORE_BATCH_SIZE):
+                batch = self.db.batch()
+                for cid,n in items[i:i+RESTORE_BATCH_SIZE]:
+                    batch.set(self.db.collection('member_counters').document(cid),{
+                        'email':emails[cid],'period':cid.split('_',1)[1],'count':n,
+                        'updated_at':firestore.SERVER_TIMESTAMP
+                    })
+                batch.commit()
+            print(f"✅ Limit-Zähler neu aufgebaut: {len(items)} Dokumente")
+            return len(items)
+        except Exception as e:
+            print(f"❌ rebuild_member_counters Fehler: {e}")
+            return None
+    
+    def _stats_apply(self,writer,slot_date,email,name,delta):
+        """Monats- und Helfer-Zähler inkrementell anpassen (writer = Batch oder Transaktion)"""
+        self._stats_apply_many(writer,[(slot_date,email,name,delta)])
+    
+    def _stats_apply_many(self,writer,entries):
+        """Wie _stats_apply für viele Buchungen - je Rollup-Dokument nur EIN Write"""
+        months,counts,names = Counter(),Counter(),{}
+        for slot_date,email_addr,name,delta in entries:
+            key = stats_user_key(email_addr)
+            months[slot_date[:7]] += delta
+            counts[key] += delta
+            names[key] = name
+        if not counts:
+            return
+        writer.set(self.db.collection('stats').document('monthly'),{
+            'months':{m:firestore.Increment(n) for m,n in months.items()},
+            'updated_at':firestore.SERVER_TIMESTAMP
+        },merge=True)
+        writer.set(self.db.collection('stats').document('helpers'),{
+            'counts':{k:firestore.Increment(n) for k,n in counts.items()},
+            'names':names,
+            'updated_at':firestore.SERVER_TIMESTAMP
+        },merge=True)
+    
+    def get_helper_counts(self):
+        """Bisherige Dienste pro Helfer aus dem Rollup - Returns: {stats_user_key: n}"""
+        try:
+            doc = self.db.collection('stats').document('helpers').get()
+            return dict(doc.to_dict().get('counts',{})) if doc.exists else {}
+        except Exception as e:
+            print(f"❌ get_helper_counts Fehler: {e}")
+            return {}
+    
+    def get_user_service_counts(self,email):
+        """
+        Eigene Dienste ohne Buchungs-Frame: Gesamtzahl aus dem Helfer-Rollup,
+        geplante per Aggregation-Query auf 'bookings'
+        Returns: (geleistet, geplant)
+        """
+        try:
+            total = self.get_helper_counts().get(stats_user_key(email),0)
+            planned = self.db.collection('bookings')\
+                .where('user_email','==',email)\
+                .where('status','==','confirmed')\
+                .where('slot_date','>=',datetime.now().strftime("%Y-%m-%d"))\
+                .count().get()[0][0].value
+            return max(total-planned,0),planned
+        except Exception as e:
+            print(f"❌ get_user_service_counts Fehler: {e}")
+            return 0,0
+    
+    def get_stats_rollups(self):
+        """
+        Statistik aus 2 Rollup-Dokumenten lesen
+        Returns: (months: {YYYY-MM: n}, archived: {YYYY-MM: n}, helpers: [(name, n)]) oder None wenn noch nie aufgebaut
+        """
+        try:
+            monthly = self.db.collection('stats').document('monthly').get()
+            helpers = self.db.collection('stats').document('helpers').get()
+            if not monthly.exists or not helpers.exists:
+                return None
+            m = monthly.to_dict()
+            h = helpers.to_dict()
+            names = h.get('names',{})
+            top = [(names.get(k,'N/A'),n) for k,n in h.get('counts',{}).items() if n > 0]
+            top.sort(key=lambda x:x[1],reverse=True)
+            months = {k:n for k,n in m.get('months',{}).items() if n > 0}
+            return months,m.get('archived',{}),top
+        except Exception as e:
+            print(f"❌ get_stats_rollups Fehler: {e}")
+            return None
+    
+    def rebuild_stats(self):
+        """Rollups komplett neu aus 'bookings' + 'archive' + 'archive_bundles' berechnen (Reparatur)"""
+        try:
+            months,archived,counts,names = Counter(),Counter(),Counter(),{}
+            for collection in ('bookings','archive'):
+                q = self.db.collection(collection)\
+                    .where('status','==','confirmed')\
+                    .select(['slot_date','user_email','user_name'])
+                for doc in q.stream():
+                    b = doc.to_dict()
+                    month = b.get('slot_date','')[:7]
+                    key = stats_user_key(b.get('user_email',''))
+                    months[month] += 1
+                    if collection == 'archive':
+                        archived[month] += 1
+                    counts[key] += 1
+                    names[key] = b.get('user_name','N/A')
+            for b in self.get_archive_bundles():
+                if b['status'] != 'confirmed':
+                    continue
+                month = b['slot_date'][:7]
+                key = stats_user_key(b['user_email'])
+                months[month] += 1
+                archived[month] += 1
+                counts[key] += 1
+                names[key] = b['user_name'] or 'N/A'
+            
+            batch = self.db.batch()
+            batch.set(self.db.collection('stats').document('monthly'),{
+                'months':dict(months),'archived':dict(archived),
+                'updated_at':firestore.SERVER_TIMESTAMP
+            })
+            batch.set(self.db.collection('stats').document('helpers'),{
+                'counts':dict(counts),'names':names,
+                'updated_at':firestore.SERVER_TIMESTAMP
+            })
+            self._bump_bookings_version(batch)
+            batch.commit()
+            print(f"✅ Statistik neu aufgebaut: {sum(months.values())} Buchungen")
+            return sum(months.values())
+        except Exception as e:
+            print(f"❌ rebuild_stats Fehler: {e}")
+            return None
+    
+    def ensure_stats_rollups(self):
+        """
+        Rollups einmalig aus dem Bestand aufbauen, falls das noch nie geschehen ist
+        Nicht an der Existenz der Dokumente festmachen: die erste Buchung legt sie per Increment an
+        """
+        if self.get_setting('stats_rollups_built',''):
+            return 0
+        total = self.rebuild_stats()
+        if total is None:
+            return 0
+        self.set_setting('stats_rollups_built',datetime.now(TZ).isoformat())
+        return total
+    
+    def get_setting(self,key,default=''):
+        try:
+            doc = self.db.collection('settings').document(key).get()
+            return doc.to_dict().get('value',default) if doc.exists else default
+        except:
+            return default
+    
+    def set_setting(self,key,value):
+        try:
+            self.db.collection('settings').document(key).set({
+                'value':value,
+                'updated_at':firestore.SERVER_TIMESTAMP
+            },merge=True)
+            return True
+        except:
+            return False
+    
+    def archive_old(self):
+        """Alte Buchungen archivieren"""
+        try:
+            months = 12
+            archive_date = (datetime.now()-timedelta(days=30*months)).strftime("%Y-%m-%d")
+            count = 0
+            batch = self.db.batch()
+            archived = Counter()
+            
+            def _commit(batch,archived):
+                # Gesamtzähler bleiben (Historie), nur der Archiv-Anteil wird mitgezählt
+                if archived:
+                    batch.set(self.db.collection('stats').document('monthly'),{
+                        'archived':{m:firestore.Increment(n) for m,n in archived.items()}
+                    },merge=True)
+                self._bump_bookings_version(batch)
+                batch.commit()
+            
+            for doc in self.db.collection('bookings').where('slot_date','<',archive_date).stream():
+                b = doc.to_dict()
+                batch.set(self.db.collection('archive').document(),{**b,'updated_at':firestore.SERVER_TIMESTAMP})
+                batch.delete(doc.reference)
+                self._record_deletion(batch,'bookings',doc.id)
+                if b.get('status') == 'confirmed':
+                    archived[b.get('slot_date','')[:7]] += 1
+                count += 1
+                if count % 150 == 0:
+                    _commit(batch,archived)
+                    batch,archived = self.db.batch(),Counter()
+            if count % 150:
+                _commit(batch,archived)
+            if count > 0:
+                print(f"✅ {count} Buchungen archiviert")
+            return count
+        except Exception as e:
+            print(f"❌ archive_old Fehler: {e}")
+            return 0
+    
+    def get_archive_bundles(self,start=None,end=None):
+        """
+        Archivierte Buchungen aus 'archive_bundles' - ein Read pro Monat
+        Returns: Buchungs-Dicts im Zeitraum, nach Datum/Zeit sortiert
+        """
+        try:
+            q = self.db.collection('archive_bundles')
+            if start:
+                q = q.where('month','>=',start.strftime("%Y-%m"))
+            if end:
+                q = q.where('month','<=',end.strftime("%Y-%m"))
+            bookings = []
+            for doc in q.stream():
+                bookings.extend(decode_archive_bundle(doc.to_dict()))
+            # Monatsgrenzen auf Tagesgenauigkeit zuschneiden
+            if start:
+                bookings = [b for b in bookings if b['slot_date'] >= start.strftime("%Y-%m-%d")]
+            if end:
+                bookings = [b for b in bookings if b['slot_date'] <= end.strftime("%Y-%m-%d")]
+            return sorted(bookings,key=lambda b:(b['slot_date'],b['slot_time']))
+        except Exception as e:
+            print(f"❌ get_archive_bundles Fehler: {e}")
+            return []
+    
+    def compact_archive(self):
+        """
+        Einzeldokumente aus 'archive' in Monats-Bundles ('archive_bundles') packen
+        Idempotent: bestehende Bundles werden gelesen und per ID dedupliziert,
+        Einzeldokumente erst nach erfolgreichem Bundle-Write gelöscht
+        Returns: Anzahl kompaktierter Buchungen
+        """
+        try:
+            # Bundles aus älteren Läufen ohne emails-Index nachziehen (Mitgliederseite fragt per array_contains)
+            for doc in self.db.collection('archive_bundles').select(['members','emails']).stream():
+                data = doc.to_dict()
+                if 'emails' not in data:
+                    doc.reference.update({'emails':sorted({m['e'] for m in data.get('members',[]) if m.get('e')})})
+            
+            by_month = {}
+            for doc in self.db.collection('archive').select(ARCHIVE_BUNDLE_FIELDS).stream():
+                b = doc.to_dict()
+                b['id'] = doc.id
+                if not re.match(r'^\d{4}-\d{2}-\d{2}$',str(b.get('slot_date',''))):
+                    continue
+                by_month.setdefault(b['slot_date'][:7],[]).append((doc.reference,b))
+            
+            count = 0
+            for month,entries in sorted(by_month.items()):
+                existing_refs,merged = [],{}
+                for doc in self.db.collection('archive_bundles').where('month','==',month).stream():
+                    existing_refs.append(doc.reference)
+                    merged.update({b['id']:b for b in decode_archive_bundle(doc.to_dict())})
+                merged.update({b['id']:b for _,b in entries})
+                
+                batch = self.db.batch()
+                part_ids = set()
+                for bundle in encode_archive_bundles(month,merged.values()):
+                    doc_id = f"{month}_{bundle['part']}"
+                    part_ids.add(doc_id)
+                    batch.set(self.db.collection('archive_bundles').document(doc_id),{
+                        **bundle,'updated_at':firestore.SERVER_TIMESTAMP
+                    })
+                # Überzählige Teile einer früheren Aufteilung entfernen
+                for ref in existing_refs:
+                    if ref.id not in part_ids:
+                        batch.delete(ref)
+                        self._record_deletion(batch,'archive_bundles',ref.id)
+                self._bump_bookings_version(batch)
+                batch.commit()
+                
+                for i in range(0,len(entries),200):
+                    batch = self.db.batch()
+                    for ref,_ in entries[i:i+200]:
+                        batch.delete(ref)
+                        self._record_deletion(batch,'archive',ref.id)
+                    batch.commit()
+                count += len(entries)
+            if count > 0:
+                print(f"✅ {count} Archiv-Buchungen in {len(by_month)} Monats-Bundles kompaktiert")
+            return count
+        except Exception as e:
+            print(f"❌ compact_archive Fehler: {e}")
+            return 0
+
+ww_db = WasserwachtDB()
+
+# ===== USER-VERZEICHNIS (CACHE) =====
+USER_DIRECTORY_FIELDS = ['email', 'name', 'phone', 'role', 'active', 'sms_notifications_booking']
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_user_directory():
+    """Schlankes User-Verzeichnis (ohne Passwort-Hash) - prozessweit gecacht, bei Schreibzugriffen invalidiert"""
+    try:
+        users = []
+        for doc in db.collection('users').select(USER_DIRECTORY_FIELDS).stream():
+            data = doc.to_dict()
+            data['id'] = doc.id
+            users.append(data)
+        return sorted(users, key=lambda u: u.get('name', '').lower())
+    except Exception as e:
+        print(f"❌ load_user_directory Fehler: {e}")
+        return []
+
+@st.cache_resource
+def ensure_stats_rollups():
+    """Einmal pro Prozess: Statistik-Rollups für Bestandsbuchungen aufbauen"""
+    return ww_db.ensure_stats_rollups()
+
+@st.cache_resource
+def ensure_member_counters():
+    """Einmal pro Prozess: Limit-Zähler für Bestandsbuchungen aufbauen"""
+    return ww_db.ensure_member_counters()
+
+@st.cache_resource
+def ensure_user_search_index():
+    """Einmal pro Prozess: fehlende Suchfelder bei Bestands-Usern nachtragen"""
+    return ww_db.backfill_search_fields()
+
+# ===== SCHICHTPLÄNE (PROZESS-CACHE) =====
+class ScheduleCache:
+    """
+    Aktive Schichtpläne aus 'slot_schedules' - einmal pro Prozess geladen und per
+    on_snapshot-Listener aktuell gehalten; der Kalender-Pfad liest nie aus Firestore
+    """
+    def __init__(self, db):
+        self._lock = threading.Lock()
+        self._schedules = []
+        self.version = 0
+        self._watch = None
+        try:
+            ref = db.collection('slot_schedules')
+            self._apply(ref.stream())
+            self._watch = ref.on_snapshot(self._on_snapshot)
+        except Exception as e:
+            print(f"❌ ScheduleCache Fehler: {e}")
+    
+    def _apply(self, docs):
+        schedules = []
+        for doc in docs:
+            data = doc.to_dict()
+            data['id'] = doc.id
+            if data.get('active', True):
+                schedules.append(data)
+        schedules.sort(key=lambda s: s.get('valid_from') or '')
+        with self._lock:
+            self._schedules = schedules
+            self.version += 1
+    
+    def _on_snapshot(self, docs, changes, read_time):
+        # Listener liefert den vollständigen Stand - kein erneutes Lesen nötig
+        self._apply(docs)
+        print(f"🔄 Schichtpläne aktualisiert ({len(docs)} Dokumente)")
+    
+    def schedules(self):
+        with self._lock:
+            return list(self._schedules)
+
+@st.cache_resource
+def get_schedule_cache():
+    return ScheduleCache(db)
+
+def normalize_schedule_slots(rows):
+    """
+    Slot-Zeilen aus dem Editor prüfen und normalisieren
+    rows: Liste von {'day': 'monday'..., 'start': 'HH:MM', 'end': 'HH:MM', 'capacity': n}
+    Returns: (slots, fehlertext oder None)
+    """
+    slots, seen = [], set()
+    for row in rows:
+        day, start, end = row.get('day'), str(row.get('start') or '').strip(), str(row.get('end') or '').strip()
+        if not day and not start and not end:
+            continue
+        if day not in WEEKDAY_INDEX:
+            return [], f"Unbekannter Wochentag: {day}"
+        if not re.match(r'^([01]\d|2[0-3]):[0-5]\d$', start) or not re.match(r'^([01]\d|2[0-3]):[0-5]\d$', end):
+            return [], f"Uhrzeit im Format HH:MM angeben ({DAY_NAMES_DE[day]} {start}-{end})"
+        if start >= end:
+            return [], f"Ende muss nach dem Start liegen ({DAY_NAMES_DE[day]} {start}-{end})"
+        if (day, start) in seen:
+            return [], f"Doppelter Slot: {DAY_NAMES_DE[day]} {start}"
+        try:
+            capacity = int(row.get('capacity') or DEFAULT_SLOT_CAPACITY)
+        except (TypeError, ValueError):
+            capacity = 0
+        if not 1 <= capacity <= MAX_SLOT_CAPACITY:
+            return [], f"Plätze zwischen 1 und {MAX_SLOT_CAPACITY} angeben ({DAY_NAMES_DE[day]} {start})"
+        seen.add((day, start))
+        slots.append({'day': day, 'day_name': DAY_NAMES_DE[day], 'start': start, 'end': end, 'capacity': capacity})
+    slots.sort(key=lambda sc: (WEEKDAY_INDEX[sc['day']], sc['start']))
+    for i, sc in enumerate(slots, 1):
+        sc['id'] = i
+    return slots, None
+
+# ===== VERFÜGBARKEIT (PROZESS-INDEX) =====
+AVAILABILITY_AWAY_MAX_DAYS = 366
+
+def expand_away(away):
+    """Abwesenheits-Zeiträume [{'from','to'}] in einzelne Tage ('YYYY-MM-DD') auflösen"""
+    for a in away:
+        start, end = as_date(a['from']), as_date(a['to'])
+        for i in range(min((end - start).days + 1, AVAILABILITY_AWAY_MAX_DAYS)):
+            yield (start + timedelta(days=i)).strftime("%Y-%m-%d")
+
+class AvailabilityIndex:
+    """
+    Verfügbarkeiten aller Helfer aus 'availability' als In-Memory-Index, per on_snapshot-Listener
+    aktuell gehalten. "Wer kann am Tag X" = Mengen-Lookup statt Scan über alle User.
+    Verfügbar ist, wer den Wochentag angegeben hat und nicht abwesend ist, oder den Tag extra freigegeben hat.
+    """
+    def __init__(self, db):
+        self._lock = threading.Lock()
+        self._weekdays = [frozenset()] * 7
+        self._extra = {}
+        self._away = {}
+        self._names = {}
+        self.version = 0
+        self._watch = None
+        try:
+            ref = db.collection('availability')
+            self._apply(ref.stream())
+            self._watch = ref.on_snapshot(self._on_snapshot)
+        except Exception as e:
+            print(f"❌ AvailabilityIndex Fehler: {e}")
+    
+    def _apply(self, docs):
+        weekdays = [set() for _ in range(7)]
+        extra, away, names = {}, {}, {}
+        for doc in docs:
+            data = doc.to_dict() or {}
+            email = data.get('email')
+            if not email:
+                continue
+            names[email] = data.get('name', email)
+            mask = int(data.get('weekdays', 0))
+            for wd in range(7):
+                if mask >> wd & 1:
+                    weekdays[wd].add(email)
+            for d in data.get('extra', []):
+                extra.setdefault(d, set()).add(email)
+            for d in expand_away(data.get('away', [])):
+                away.setdefault(d, set()).add(email)
+        with self._lock:
+            self._weekdays = [frozenset(w) for w in weekdays]
+            self._extra = {d: frozenset(e) for d, e in extra.items()}
+            self._away = {d: frozenset(e) for d, e in away.items()}
+            self._names = names
+            self.version += 1
+    
+    def _on_snapshot(self, docs, changes, read_time):
+        self._apply(docs)
+        print(f"🔄 Verfügbarkeiten aktualisiert ({len(docs)} Dokumente)")
+    
+    def is_declared(self, email):
+        return email in self._names
+    
+    def is_available(self, email, slot_date_str, slot_time=None, default=True):
+        """
+        Kann der Helfer am Tag? Ohne eigene Angabe gilt default.
+        slot_time wird (noch) nicht ausgewertet - Angaben gelten ganztägig.
+        """
+        if email not in self._names:
+            return default
+        if email in self._extra.get(slot_date_str, ()):
+            return True
+        return (email in self._weekdays[as_date(slot_date_str).weekday()]
+                and email not in self._away.get(slot_date_str, ()))
+    
+    def available(self, slot_date_str, exclude=()):
+        """Alle Helfer mit Verfügbarkeit am Tag als [(name, email)], nach Name sortiert"""
+        with self._lock:
+            emails = (self._weekdays[as_date(slot_date_str).weekday()] - self._away.get(slot_date_str, frozenset())) \
+                     | self._extra.get(slot_date_str, frozenset())
+            names = self._names
+        return sorted((names[e], e) for e in emails if e not in exclude)
+
+@st.cache_resource
+def get_availability_index():
+    return AvailabilityIndex(db)
+
 # ===== E-MAIL KLASSE (VOLLSTÄNDIG MIT TEMPLATE-SUPPORT) =====
 class Mailer:
     """E-Mail Versand mit detailliertem Error-Handling und Template-System"""
@@ -1120,6 +2944,143 @@ Gesendet am {current_date}"""
         
         return self.send(user_email, subject, body)
 
+    def send_booking_summary(self, user_email, user_name, shifts):
+        """Sammel-Bestätigung für mehrere Dienste (eine Mail statt einer pro Termin) - verwendet Template"""
+        subject_template = ww_db.get_setting('email_booking_summary_subject', 'Deine Dienste ({count})')
+        body_template = ww_db.get_setting('email_booking_summary_body',
+            """Hallo {name},
+
+für dich wurden {count} Dienste eingetragen:
+
+{shifts}
+
+Bei Fragen melde dich gerne unter {org_email}.
+
+Viele Grüße,
+Dein {org_name} Team 🌊""")
+        
+        data = {
+            'name': user_name,
+            'count': len(shifts),
+            'shifts': '\n'.join(f"📅 {fmt_de(slot_date)} ⏰ {slot_time}" for slot_date, slot_time in sorted(shifts)),
+            'email': user_email,
+            'org_name': ww_db.get_setting('org_name', 'Wasserwacht'),
+            'org_email': self.admin_receiver,
+            'current_date': datetime.now().strftime('%d.%m.%Y %H:%M')
+        }
+        
+        subject = subject_template
+        body = body_template
+        for key, value in data.items():
+            subject = subject.replace('{' + key + '}', str(value))
+            body = body.replace('{' + key + '}', str(value))
+        
+        return self.send(user_email, subject, body)
+
+    def send_free_slot_alert(self, user_email, user_name, shifts):
+        """Hinweis auf offene Dienste an verfügbare Helfer (eine Mail pro Helfer) - verwendet Template"""
+        subject_template = ww_db.get_setting('email_free_slot_alert_subject', 'Helfer gesucht: {count} offene Dienste')
+        body_template = ww_db.get_setting('email_free_slot_alert_body',
+            """Hallo {name},
+
+für folgende Dienste werden noch Helfer gesucht - laut deinem Profil hättest du Zeit:
+
+{shifts}
+
+Buchen kannst du direkt im Dienstplan. Danke für deine Unterstützung!
+
+Viele Grüße,
+Dein {org_name} Team 🌊""")
+        
+        data = {
+            'name': user_name,
+            'count': len(shifts),
+            'shifts': '\n'.join(f"📅 {fmt_de(slot_date)} ⏰ {slot_time}" for slot_date, slot_time in sorted(shifts)),
+            'email': user_email,
+            'org_name': ww_db.get_setting('org_name', 'Wasserwacht'),
+            'org_email': self.admin_receiver,
+            'current_date': datetime.now().strftime('%d.%m.%Y %H:%M')
+        }
+        
+        subject = subject_template
+        body = body_template
+        for key, value in data.items():
+            subject = subject.replace('{' + key + '}', str(value))
+            body = body.replace('{' + key + '}', str(value))
+        
+        return self.send(user_email, subject, body)
+
+    def send_waitlist_promotion(self, user_email, user_name, slot_date, slot_time):
+        """Benachrichtigung beim Nachrücken von der Warteliste - verwendet Template"""
+        subject_template = ww_db.get_setting('email_waitlist_promoted_subject', 'Nachgerückt: Dienst am {date}')
+        body_template = ww_db.get_setting('email_waitlist_promoted_body',
+            """Hallo {name},
+
+gute Nachricht: Auf der Warteliste bist du nachgerückt und jetzt fest eingetragen!
+
+📅 Datum: {date}
+⏰ Zeit: {time}
+
+Falls du doch nicht kannst, storniere bitte im Dienstplan, damit der Nächste nachrücken kann.
+
+Viele Grüße,
+Dein {org_name} Team 🌊""")
+        
+        data = {
+            'name': user_name,
+            'date': fmt_de(slot_date),
+            'time': slot_time,
+            'email': user_email,
+            'org_name': ww_db.get_setting('org_name', 'Wasserwacht'),
+            'current_date': datetime.now().strftime('%d.%m.%Y %H:%M')
+        }
+        
+        subject = subject_template
+        body = body_template
+        for key, value in data.items():
+            subject = subject.replace('{' + key + '}', str(value))
+            body = body.replace('{' + key + '}', str(value))
+        
+        return self.send(user_email, subject, body)
+
+    def send_rebooking(self, user_email, user_name, old_shift, new_shift, comment=''):
+        """Benachrichtigung bei Umbuchung/Tausch durch einen Admin - verwendet Template
+        old_shift/new_shift: (slot_date, slot_time) oder None"""
+        subject_template = ww_db.get_setting('email_rebooking_subject', 'Änderung deiner Dienste')
+        body_template = ww_db.get_setting('email_rebooking_body',
+            """Hallo {name},
+
+deine Einteilung wurde von der Dienstplanung geändert:
+
+Bisher: {old_shift}
+Neu: {new_shift}
+
+{comment}
+
+Bei Fragen melde dich gerne unter {org_email}.
+
+Viele Grüße,
+Dein {org_name} Team 🌊""")
+        
+        data = {
+            'name': user_name,
+            'old_shift': f"📅 {fmt_de(old_shift[0])} ⏰ {old_shift[1]}" if old_shift else "kein Dienst",
+            'new_shift': f"📅 {fmt_de(new_shift[0])} ⏰ {new_shift[1]}" if new_shift else "kein Dienst",
+            'comment': f"💬 Hinweis: {comment}" if comment else "",
+            'email': user_email,
+            'org_name': ww_db.get_setting('org_name', 'Wasserwacht'),
+            'org_email': self.admin_receiver,
+            'current_date': datetime.now().strftime('%d.%m.%Y %H:%M')
+        }
+        
+        subject = subject_template
+        body = body_template
+        for key, value in data.items():
+            subject = subject.replace('{' + key + '}', str(value))
+            body = body.replace('{' + key + '}', str(value))
+        
+        return self.send(user_email, subject, body)
+
     def send_admin_notification(self, user_name, user_email, user_phone, slot_date, slot_time):
         """Admin-Benachrichtigung bei neuer Buchung - NEU"""
         if not self.admin_receiver:
@@ -1426,38 +3387,508 @@ def show_navigation():
         }}
         </style>
     
-        <div class="theme-toggle">
-            <span class="theme-icon">{'🌙' if current_mode else '☀️'}</span>
-            <span class="theme-label">{'Dark Mode' if current_mode else 'Light Mode'}</span>
+        <div class="theme-toggle">
+            <span class="theme-icon">{'🌙' if current_mode else '☀️'}</span>
+            <span class="theme-label">{'Dark Mode' if current_mode else 'Light Mode'}</span>
+        </div>
+        """
+    
+        st.markdown(toggle_html, unsafe_allow_html=True)
+    
+        # Toggle Button
+        col1, col2 = st.columns(2)
+        with col1:
+            if not current_mode:
+                if st.button("🌙 Dark", key="switch_dark", use_container_width=True):
+                    st.session_state.dark_mode = True
+                    if is_admin:
+                        ww_db.set_setting('dark_mode', 'true')
+                    st.rerun()
+        with col2:
+            if current_mode:
+                if st.button("☀️ Light", key="switch_light", use_container_width=True):
+                    st.session_state.dark_mode = False
+                    if is_admin:
+                        ww_db.set_setting('dark_mode', 'false')
+                    st.rerun()
+
+        st.divider()
+        
+        if st.button("🚪 Abmelden", use_container_width=True):
+            logout()
+        
+        st.divider()
+        st.caption(f"Version {VERSION}")
+# ===== SLOT-KALENDER (VEKTORISIERT) =====
+def slot_calendar(start, end):
+    """
+    Alle Slot-Termine zwischen start und end (inkl.) laut gültigem Schichtplan als DataFrame,
+    nach Datum/Startzeit sortiert. Pro Tag gilt der Plan mit dem spätesten valid_from,
+    ohne passenden Plan DEFAULT_SCHEDULE (WEEKLY_SLOTS).
+    Spalten: date (datetime64), slot_date ('YYYY-MM-DD'), slot_id, slot_key, weekday, slot_start,
+             slot_end, slot_time, slot_label, capacity, config (Slot-Dict), schedule_id, blocked,
+             reason ('Feiertag' / 'Sommerpause' / None)
+    Gecacht pro Zeitraum und Schichtplan-Stand - Ergebnis nicht verändern (bei Bedarf .copy())
+    """
+    return _slot_calendar(as_date(start), as_date(end), get_schedule_cache().version)
+
+@lru_cache(maxsize=64)
+def _slot_calendar(start, end, schedule_version):
+    schedules = get_schedule_cache().schedules()
+    days = pd.date_range(start, end, freq='D')
+    
+    # Gültigen Plan je Tag bestimmen (-1 = Standard); spätere valid_from überschreiben frühere
+    owner = np.full(len(days), -1)
+    for i, schedule in enumerate(schedules):
+        mask = np.ones(len(days), dtype=bool)
+        if schedule.get('valid_from'):
+            mask &= days >= pd.Timestamp(schedule['valid_from'])
+        if schedule.get('valid_to'):
+            mask &= days <= pd.Timestamp(schedule['valid_to'])
+        owner[mask] = i
+    
+    frames = []
+    for i, schedule in enumerate([DEFAULT_SCHEDULE] + schedules, start=-1):
+        schedule_days = days[owner == i]
+        weekdays = schedule_days.weekday
+        for slot_config in schedule.get('slots', []):
+            slot_days = schedule_days[weekdays == WEEKDAY_INDEX[slot_config['day']]]
+            frames.append(pd.DataFrame({
+                'date': slot_days,
+                'slot_id': slot_config['id'],
+                'slot_key': f"{slot_config['day']} {slot_config['start']}-{slot_config['end']}",
+                'weekday': WEEKDAY_INDEX[slot_config['day']],
+                'slot_start': slot_config['start'],
+                'slot_end': slot_config['end'],
+                'slot_time': f"{slot_config['start']} - {slot_config['end']}",
+                'slot_label': f"{slot_config['day_name']} {slot_config['start']}",
+                'capacity': slot_capacity(slot_config),
+                'config': [slot_config] * len(slot_days),
+                'schedule_id': schedule['id'],
+                'summer_break': bool(schedule.get('summer_break', True)),
+            }))
+    cal = pd.concat(frames, ignore_index=True).sort_values(['date', 'slot_start'], ignore_index=True)
+    
+    holiday_dates = pd.to_datetime(sorted(d for year in range(start.year, end.year + 1) for d in holidays(year)))
+    is_holiday_arr = cal['date'].isin(holiday_dates).to_numpy()
+    # Sommerpause nur, wenn der gültige Plan sie vorsieht (z.B. nicht beim Sommer-Seedienst)
+    is_summer_arr = cal['date'].dt.month.between(6, 9).to_numpy() & cal['summer_break'].to_numpy(dtype=bool)
+    cal['slot_date'] = cal['date'].dt.strftime('%Y-%m-%d')
+    cal['blocked'] = is_holiday_arr | is_summer_arr
+    cal['reason'] = np.where(is_holiday_arr, 'Feiertag', np.where(is_summer_arr, 'Sommerpause', None))
+    return cal
+
+def slot_capacity_for(slot_date_str, slot_time):
+    """Kapazität eines konkreten Slots laut Schichtplan (aus dem Prozess-Cache, kein Firestore-Read)"""
+    cal = slot_calendar(as_date(slot_date_str), as_date(slot_date_str))
+    match = cal[cal['slot_start'] == slot_time[:5]]
+    return int(match['capacity'].iloc[0]) if len(match) else DEFAULT_SLOT_CAPACITY
+
+def slot_columns(start, end):
+    """Alle im Zeitraum vorkommenden Slot-Definitionen (Spalten für Raster/Excel), nach Wochentag/Startzeit"""
+    cal = slot_calendar(start, end)
+    first = cal.drop_duplicates('slot_key').sort_values(['weekday', 'slot_start'])
+    return list(zip(first['slot_key'], first['config']))
+
+def slot_rows(cal):
+    """Zeilen eines Slot-Kalenders als Tupel (slot_config, slot_date, blocked, reason) - ohne iterrows-Overhead"""
+    return zip(cal['config'], cal['slot_date'], cal['blocked'], cal['reason'])
+
+# ===== KALENDER-ÜBERSICHTEN (MONAT / SAISON) =====
+def season_bounds(d=None):
+    """Start- und Enddatum der Saison (Oktober bis Mai), in der d liegt"""
+    d = d or datetime.now().date()
+    if hasattr(d, "date"):
+        d = d.date()
+    start_year = d.year if d.month >= SEASON_START_MONTH else d.year - 1
+    start = date(start_year, SEASON_START_MONTH, 1)
+    end = date(start_year + 1, SEASON_END_MONTH, cal_module.monthrange(start_year + 1, SEASON_END_MONTH)[1])
+    return start, end
+
+def index_bookings(bookings):
+    """Buchungen nach (slot_date, Startzeit) gruppieren für O(1)-Lookup - Werte sind Listen (mehrere Helfer pro Slot)"""
+    index = {}
+    for b in bookings:
+        index.setdefault((b.get('slot_date', ''), b.get('slot_time', '')[:5]), []).append(b)
+    return index
+
+def slot_chip_html(sd, slot_config, booking_index, blocked, reason, show_time=True):
+    """Kompakter Status-Chip (frei/teilbelegt/voll/blockiert) für eine Tabellenzelle"""
+    label = slot_config['start'] if show_time else ''
+    if blocked:
+        return f'<span class="cal-chip blocked" title="{reason}">🚫 {label}</span>'
+    booked = booking_index.get((sd, slot_config['start']), [])
+    capacity = slot_capacity(slot_config)
+    names = html.escape(', '.join(b.get('user_name', 'N/A') for b in booked))
+    if len(booked) >= capacity:
+        return f'<span class="cal-chip booked" title="{names}">✅ {label} {names}</span>'
+    if booked:
+        return f'<span class="cal-chip free" title="{names}">👥 {label} {len(booked)}/{capacity}</span>'
+    return f'<span class="cal-chip free" title="Verfügbar">✨ {label}</span>'
+
+def month_calendar_html(year, month, bookings):
+    """Monatskalender (Mo-So) mit allen Slots laut Schichtplan als EINE HTML-Tabelle"""
+    booking_index = index_bookings(bookings)
+    weeks = cal_module.Calendar(firstweekday=0).monthdatescalendar(year, month)
+    chips_by_day = {}
+    for slot_config, sd, blocked, reason in slot_rows(slot_calendar(weeks[0][0], weeks[-1][-1])):
+        chips_by_day[sd] = chips_by_day.get(sd, '') + slot_chip_html(sd, slot_config, booking_index, blocked, reason)
+
+    rows = []
+    for week in weeks:
+        cells = []
+        for d in week:
+            chips = chips_by_day.get(d.strftime("%Y-%m-%d"), '')
+            css = ' class="outside"' if d.month != month else ''
+            cells.append(f'<td{css}><div class="cal-day">{d.day}</div>{chips}</td>')
+        rows.append(f"<tr>{''.join(cells)}</tr>")
+
+    header = ''.join(f'<th>{t}</th>' for t in WOCHENTAGE_KURZ)
+    return f'<table class="cal-grid"><thead><tr>{header}</tr></thead><tbody>{"".join(rows)}</tbody></table>'
+
+def season_grid_html(start, end, bookings):
+    """Saison-Raster: eine Zeile pro Kalenderwoche, eine Spalte pro Slot-Definition im Zeitraum"""
+    booking_index = index_bookings(bookings)
+    cal = slot_calendar(start, end)
+    columns = slot_columns(start, end)
+    cells_by_slot = {
+        (week_start(as_date(sd)), key): slot_chip_html(sd, slot_config, booking_index, blocked, reason, show_time=False)
+        for (slot_config, sd, blocked, reason), key in zip(slot_rows(cal), cal['slot_key'])
+    }
+    rows = []
+    ws = week_start(start)
+    while ws <= end:
+        cells = [f'<th>KW {ws.isocalendar()[1]}<br>{ws.strftime("%d.%m.")}</th>']
+        for key, _ in columns:
+            chip = cells_by_slot.get((ws, key))
+            cells.append(f'<td>{chip}</td>' if chip else '<td class="outside"></td>')
+        rows.append(f"<tr>{''.join(cells)}</tr>")
+        ws += timedelta(days=7)
+
+    header = '<th>Woche</th>' + ''.join(
+        f"<th>{sc['day_name']}<br>{sc['start']}-{sc['end']}</th>" for _, sc in columns
+    )
+    return f'<table class="cal-grid"><thead><tr>{header}</tr></thead><tbody>{"".join(rows)}</tbody></table>'
+
+def overview_stats(start, end, bookings):
+    """Zählt Slots im Zeitraum: voll belegt ('booked'), mit freien Plätzen ('free'), blockiert"""
+    cal = slot_calendar(start, end)
+    per_slot = Counter((b.get('slot_date', ''), b.get('slot_time', '')[:5]) for b in bookings)
+    filled = np.fromiter((per_slot[key] for key in zip(cal['slot_date'], cal['slot_start'])),
+                         dtype=int, count=len(cal))
+    booked = filled >= cal['capacity'].to_numpy()
+    blocked = cal['blocked'].to_numpy()
+    return Counter({
+        'blocked': int(blocked.sum()),
+        'booked': int((booked & ~blocked).sum()),
+        'free': int((~booked & ~blocked).sum()),
+    })
+
+def kalender_monat_ansicht():
+    """Monatsansicht - alle Slots eines Monats, eine Range-Query"""
+    if 'selected_month' not in st.session_state:
+        st.session_state.selected_month = datetime.now().date().replace(day=1)
+    month_start = st.session_state.selected_month
+
+    col1, col2, col3, col4 = st.columns([2, 1, 1, 2])
+    with col1:
+        st.markdown(f"### {MONATSNAMEN[month_start.month - 1]} {month_start.year}")
+    with col2:
+        if st.button("⬅️ Vorheriger", key="month_prev", use_container_width=True):
+            st.session_state.selected_month = (month_start - timedelta(days=1)).replace(day=1)
+            st.rerun()
+    with col3:
+        if st.button("Nächster ➡️", key="month_next", use_container_width=True):
+            st.session_state.selected_month = (month_start + timedelta(days=32)).replace(day=1)
+            st.rerun()
+    with col4:
+        if st.button("🔄 Dieser Monat", key="month_today", use_container_width=True):
+            st.session_state.selected_month = datetime.now().date().replace(day=1)
+            st.rerun()
+
+    # Sichtbarer Bereich inkl. angeschnittener Wochen
+    weeks = cal_module.Calendar(firstweekday=0).monthdatescalendar(month_start.year, month_start.month)
+    bookings = ww_db.get_range_bookings(weeks[0][0].strftime("%Y-%m-%d"), weeks[-1][-1].strftime("%Y-%m-%d"))
+
+    st.markdown(month_calendar_html(month_start.year, month_start.month, bookings), unsafe_allow_html=True)
+
+    month_end = month_start.replace(day=cal_module.monthrange(month_start.year, month_start.month)[1])
+    counts = overview_stats(month_start, month_end, bookings)
+    st.caption(f"✨ {counts['free']} frei | ✅ {counts['booked']} gebucht | 🚫 {counts['blocked']} blockiert")
+
+def kalender_saison_ansicht():
+    """Saisonansicht - Raster Woche x Slot für Oktober bis Mai, eine Range-Query"""
+    if 'selected_season' not in st.session_state:
+        st.session_state.selected_season = season_bounds()[0]
+    start, end = season_bounds(st.session_state.selected_season)
+
+    col1, col2, col3, col4 = st.columns([2, 1, 1, 2])
+    with col1:
+        st.markdown(f"### Saison {start.year}/{end.year}")
+        st.caption(f"{fmt_de(start)} - {fmt_de(end)}")
+    with col2:
+        if st.button("⬅️ Vorherige", key="season_prev", use_container_width=True):
+            st.session_state.selected_season = start.replace(year=start.year - 1)
+            st.rerun()
+    with col3:
+        if st.button("Nächste ➡️", key="season_next", use_container_width=True):
+            st.session_state.selected_season = start.replace(year=start.year + 1)
+            st.rerun()
+    with col4:
+        if st.button("🔄 Aktuelle Saison", key="season_today", use_container_width=True):
+            st.session_state.selected_season = season_bounds()[0]
+            st.rerun()
+
+    bookings = ww_db.get_range_bookings(start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+
+    counts = overview_stats(start, end, bookings)
+    col_a, col_b, col_c = st.columns(3)
+    with col_a:
+        st.metric("✨ Frei", counts['free'])
+    with col_b:
+        st.metric("✅ Gebucht", counts['booked'])
+    with col_c:
+        st.metric("🚫 Blockiert", counts['blocked'])
+
+    st.markdown(season_grid_html(start, end, bookings), unsafe_allow_html=True)
+
+# ===== KALENDER-RENDERING (KARTEN & AKTIONEN) =====
+class RenderMeter:
+    """Misst Renderzeit und Anzahl gesendeter Frontend-Elemente (Deltas) eines Seitenbereichs"""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.deltas = 0
+    
+    def add(self, n=1):
+        self.deltas += n
+    
+    def report(self):
+        return (time.perf_counter() - self.start) * 1000, self.deltas
+
+def week_slot_states(ws, bookings):
+    """
+    Status aller Slots einer Woche
+    Returns: Liste von (slot_config, slot_date, reason, blocked, status_class, bookings)
+    status_class 'booked' erst, wenn alle Plätze belegt sind
+    """
+    booking_index = index_bookings(bookings)
+    states = []
+    for slot_config, sd, blocked, reason in slot_rows(slot_calendar(ws, ws + timedelta(days=6))):
+        slot_bookings = booking_index.get((sd, slot_config['start']), [])
+        if blocked:
+            status_class = "blocked"
+        elif len(slot_bookings) >= slot_capacity(slot_config):
+            status_class = "booked"
+        else:
+            status_class = "free"
+        states.append((slot_config, sd, reason, blocked, status_class, slot_bookings))
+    return states
+
+def slot_card_html(slot_config, sd, reason, blocked, status_class, bookings=()):
+    """HTML einer 3D-Slot-Karte"""
+    capacity = slot_capacity(slot_config)
+    names = html.escape(', '.join(b.get('user_name', 'N/A') for b in bookings))
+    if status_class == "blocked":
+        status_text = f"🚫 Blockiert ({reason})"
+        status_icon = "🚫"
+    elif status_class == "booked":
+        status_text = f"✅ Gebucht von {names}" if bookings else "✅ Gebucht"
+        status_icon = "✅"
+    elif bookings:
+        status_text = f"👥 {len(bookings)}/{capacity} belegt: {names} - noch {capacity - len(bookings)} frei"
+        status_icon = "👥"
+    else:
+        status_text = "✨ Verfügbar" if capacity == 1 else f"✨ Verfügbar ({capacity} Plätze)"
+        status_icon = "✨"
+    
+    return f"""
+        <div class="slot-card {status_class}">
+            <div style="display: flex; justify-content: space-between; align-items: flex-start; margin-bottom: 0.5rem;">
+                <div style="flex: 1;">
+                    <h3 style="margin: 0; font-size: 1.15rem; font-weight: 700;">{slot_config['day_name']}</h3>
+                    <p style="margin: 0.3rem 0 0 0; font-size: 0.9rem; opacity: 0.85;">
+                        📅 {fmt_de(sd)} | 🕐 {slot_config['start']} - {slot_config['end']}
+                    </p>
+                </div>
+                <div style="font-size: 1.8rem; line-height: 1;">
+                    {status_icon}
+                </div>
+            </div>
+            <div class="status-badge {status_class}">
+                {status_text}
+            </div>
         </div>
         """
+
+def slot_action(user, slot_config, blocked, bookings, waiting=False):
+    """
+    Mögliche Aktion für einen Slot (waiting = User steht auf der Warteliste)
+    Returns: ('book', None), ('cancel', buchung), ('waitlist', None), ('leave_waitlist', None) oder (None, None)
+    """
+    if blocked:
+        return None, None
+    own = next((b for b in bookings if b.get('user_email') == user.get('email')), None)
+    if own:
+        return 'cancel', own
+    if len(bookings) < slot_capacity(slot_config):
+        return 'book', None
+    # Admin kann Einzel-Slots direkt stornieren, Mehrfach-Slots über die Verwaltung
+    if user.get('role') == 'admin' and len(bookings) == 1:
+        return 'cancel', bookings[0]
+    return ('leave_waitlist' if waiting else 'waitlist'), None
+
+def handle_waitlist_slot(user, sd, slot_config, join=True):
+    """Warteliste eines vollen Slots betreten bzw. verlassen"""
+    slot_time = f"{slot_config['start']} - {slot_config['end']}"
+    if join:
+        success, msg = ww_db.join_waitlist(sd, slot_time, user)
+    else:
+        success = ww_db.leave_waitlist(sd, slot_time, user.get('email'))
+        msg = "Von der Warteliste entfernt" if success else "Fehler beim Verlassen der Warteliste"
+    if success:
+        st.success(f"✅ {msg}")
+        st.rerun()
+    else:
+        st.error(f"❌ {msg}")
+
+def handle_cancel_slot(user, booking, sd, slot_config):
+    """Stornierung aus dem Kalender heraus"""
+    success = ww_db.cancel_booking(booking['id'], user.get('email'))
+    if success:
+        # Email senden
+        mailer.send_cancellation(
+            booking.get('user_email'),
+            booking.get('user_name'),
+            sd,
+            f"{slot_config['start']} - {slot_config['end']}"
+        )
+        st.success("✅ Stornierung erfolgreich!")
+        st.rerun()
+    else:
+        st.error("❌ Fehler bei der Stornierung")
+
+def handle_book_slot(user, sd, slot_config):
+    """Direkt buchen mit Session-User-Daten"""
+    success, msg = ww_db.create_booking(
+        sd,
+        f"{slot_config['start']} - {slot_config['end']}",
+        user.get('email'),
+        user.get('name'),
+        user.get('phone', '')
+    )
+    
+    if success:
+        # Benachrichtigungen senden
+        if user.get('email_notifications', True):
+            mailer.send_booking_confirmation(
+                user.get('email'),
+                user.get('name'),
+                sd,
+                f"{slot_config['start']} - {slot_config['end']}"
+            )
+        
+        if user.get('sms_notifications', False) and user.get('phone'):
+            sms_client.send_booking_confirmation(
+                user.get('phone'),
+                user.get('name'),
+                sd,
+                f"{slot_config['start']} - {slot_config['end']}"
+            )
+        
+        # Admin-Benachrichtigung
+        if user.get('role') != 'admin':
+            mailer.send_admin_notification(
+                user.get('name'),
+                user.get('email'),
+                user.get('phone', ''),
+                sd,
+                f"{slot_config['start']} - {slot_config['end']}"
+            )
+        
+        st.success(f"✅ {msg}")
+        st.balloons()
+        st.rerun()
+    else:
+        st.error(f"❌ {msg}")
+
+# ===== SERIENBUCHUNG (JEDE WOCHE BIS DATUM X) =====
+SERIES_MAX_WEEKS = 52
+
+def series_plan(user, weekday, slot_start, start, until):
+    """
+    Alle Termine eines Wochen-Slots zwischen start und until mit EINER Range-Query prüfen
+    Returns: (buchbare Termine als Assignment-Dicts, übersprungene Termine [(slot_date, slot_time, grund)])
+    """
+    cal = slot_calendar(start, until)
+    cal = cal[(cal['weekday'] == weekday) & (cal['slot_start'] == slot_start)]
+    booking_index = index_bookings(ww_db.get_range_bookings(start.strftime("%Y-%m-%d"), until.strftime("%Y-%m-%d")))
+    bookable, skipped = [], []
+    for slot_config, slot_d, blocked, reason in slot_rows(cal):
+        slot_time = f"{slot_config['start']} - {slot_config['end']}"
+        slot_bookings = booking_index.get((slot_d, slot_config['start']), [])
+        if blocked:
+            skipped.append((slot_d, slot_time, reason))
+        elif any(b.get('user_email') == user['email'] for b in slot_bookings):
+            skipped.append((slot_d, slot_time, "bereits gebucht"))
+        elif len(slot_bookings) >= slot_capacity(slot_config):
+            skipped.append((slot_d, slot_time, "belegt"))
+        else:
+            bookable.append({
+                'slot_date': slot_d, 'slot_time': slot_time, 'capacity': slot_capacity(slot_config),
+                'user_email': user['email'], 'user_name': user['name'], 'user_phone': user.get('phone', '')
+            })
+    return bookable, skipped
+
+def serienbuchung(user):
+    """Einen Wochen-Slot für jede Woche bis zu einem Datum buchen - gebündelt, mit EINER Sammel-Mail"""
+    today = date.today()
+    horizon = today + timedelta(weeks=SERIES_MAX_WEEKS)
+    columns = slot_columns(today, horizon)
+    if not columns:
+        st.info("Keine Slots im Schichtplan")
+        return
     
-        st.markdown(toggle_html, unsafe_allow_html=True)
-    
-        # Toggle Button
+    with st.form("serienbuchung"):
         col1, col2 = st.columns(2)
         with col1:
-            if not current_mode:
-                if st.button("🌙 Dark", key="switch_dark", use_container_width=True):
-                    st.session_state.dark_mode = True
-                    if is_admin:
-                        ww_db.set_setting('dark_mode', 'true')
-                    st.rerun()
+            slot_key = st.selectbox(
+                "Slot", [key for key, _ in columns],
+                format_func=lambda key: next(f"{c['day_name']} {c['start']} - {c['end']}" for k, c in columns if k == key)
+            )
         with col2:
-            if current_mode:
-                if st.button("☀️ Light", key="switch_light", use_container_width=True):
-                    st.session_state.dark_mode = False
-                    if is_admin:
-                        ww_db.set_setting('dark_mode', 'false')
-                    st.rerun()
+            until = st.date_input("Jede Woche bis", today + timedelta(weeks=12),
+                                  min_value=today, max_value=horizon, format="DD.MM.YYYY")
+        check = st.form_submit_button("🔍 Termine prüfen", use_container_width=True)
+    
+    if check:
+        slot_config = dict(columns)[slot_key]
+        bookable, skipped = series_plan(user, WEEKDAY_INDEX[slot_config['day']], slot_config['start'], today, until)
+        st.session_state.series_plan = {'bookable': bookable, 'skipped': skipped}
+    
+    plan = st.session_state.get('series_plan')
+    if not plan:
+        return
+    bookable, skipped = plan['bookable'], plan['skipped']
+    
+    rows = sorted([(a['slot_date'], a['slot_time'], "✅ wird gebucht") for a in bookable] +
+                  [(d, t, f"⏭️ {reason}") for d, t, reason in skipped])
+    st.dataframe(pd.DataFrame([{'Datum': fmt_de(d), 'Zeit': t, 'Status': status} for d, t, status in rows]),
+                 use_container_width=True, hide_index=True)
+    
+    if not bookable:
+        st.info("Keine buchbaren Termine im Zeitraum")
+        return
+    if st.button(f"✅ {len(bookable)} Termine buchen", type="primary", use_container_width=True):
+        with st.spinner("Buchungen werden angelegt..."):
+            created, rejected = ww_db.create_bookings_bulk(bookable)
+        del st.session_state.series_plan
+        if created:
+            st.success(f"✅ {len(created)} Termine gebucht")
+            if user.get('email_notifications_booking', True):
+                mailer.send_booking_summary(user['email'], user['name'], [(a['slot_date'], a['slot_time']) for a in created])
+        for a, reason in rejected:
+            st.warning(f"⏭️ {fmt_de(a['slot_date'])}: {reason}")
 
-        st.divider()
-        
-        if st.button("🚪 Abmelden", use_container_width=True):
-            logout()
-        
-        st.divider()
-        st.caption(f"Version {VERSION}")
 # ===== KALENDER SEITE (KOMPLETT ÜBERARBEITET) =====
 def kalender_page():
     """Kalender-Seite - Original-Funktionalität mit modernem 3D-Design"""
@@ -1466,6 +3897,15 @@ def kalender_page():
     st.title("📅 Wochenschichten buchen")
     st.caption("Buchen Sie Ihre Schichten für die kommenden Wochen")
     
+    # ===== ANSICHT =====
+    ansicht = st.radio("Ansicht", ["📅 Woche", "🗓️ Monat", "📆 Saison"], horizontal=True, label_visibility="collapsed")
+    if ansicht == "🗓️ Monat":
+        kalender_monat_ansicht()
+        return
+    if ansicht == "📆 Saison":
+        kalender_saison_ansicht()
+        return
+    
     # Session State für Woche
     if 'selected_week' not in st.session_state:
         st.session_state.selected_week = week_start()
@@ -1504,125 +3944,94 @@ def kalender_page():
     ws_str = st.session_state.selected_week.strftime("%Y-%m-%d")
     bookings = ww_db.get_week_bookings(ws_str)
     
-    # ===== SLOTS MIT 3D-CARDS ANZEIGEN =====
-    for slot_config in WEEKLY_SLOTS:
-        sd = slot_date(st.session_state.selected_week, slot_config['day'])
-        
-        # Blockierung prüfen
-        blocked = is_blocked(sd)
-        reason = block_reason(sd) if blocked else None
-        
-        # Buchung suchen
-        booking = None
-        for b in bookings:
-            if b.get('slot_date') == sd and b.get('slot_time', '').startswith(slot_config['start']):
-                booking = b
-                break
-        
-        # ===== STATUS =====
-        if blocked:
-            status_class = "blocked"
-            status_text = f"🚫 Blockiert ({reason})"
-            status_icon = "🚫"
-        elif booking:
-            status_class = "booked"
-            status_text = f"✅ Gebucht von {booking.get('user_name', 'N/A')}"
-            status_icon = "✅"
-        else:
-            status_class = "free"
-            status_text = "✨ Verfügbar"
-            status_icon = "✨"
+    # ===== SLOTS ANZEIGEN =====
+    compact = st.toggle(
+        "⚡ Kompaktmodus (ein HTML-Block)",
+        value=True,
+        key='compact_calendar',
+        help="Rendert alle Slot-Karten als einen Block - deutlich schneller auf dem Handy"
+    )
+    
+    meter = RenderMeter()
+    slot_states = week_slot_states(st.session_state.selected_week, bookings)
+    waiting = {(w['slot_date'], w['slot_time'][:5]) for w in ww_db.get_user_waitlist(user['email'], ws_str)}
+    
+    if compact:
+        # Alle Karten in EINEM Markdown-Delta
+        st.markdown(''.join(slot_card_html(*state) for state in slot_states), unsafe_allow_html=True)
+        meter.add()
         
-        # ===== 3D CARD =====
-        st.markdown(f"""
-        <div class="slot-card {status_class}">
-            <div style="display: flex; justify-content: space-between; align-items: flex-start; margin-bottom: 0.5rem;">
-                <div style="flex: 1;">
-                    <h3 style="margin: 0; font-size: 1.15rem; font-weight: 700;">{slot_config['day_name']}</h3>
-                    <p style="margin: 0.3rem 0 0 0; font-size: 0.9rem; opacity: 0.85;">
-                        📅 {fmt_de(sd)} | 🕐 {slot_config['start']} - {slot_config['end']}
-                    </p>
-                </div>
-                <div style="font-size: 1.8rem; line-height: 1;">
-                    {status_icon}
-                </div>
-            </div>
-            <div class="status-badge {status_class}">
-                {status_text}
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # ===== AKTIONEN (WIE IM ORIGINAL) =====
-        if not blocked:
-            if booking:
-                # Gebuchter Slot
-                if booking.get('user_email') == user.get('email') or user.get('role') == 'admin':
-                    col_btn1, col_btn2 = st.columns([4, 1])
-                    with col_btn2:
-                        if st.button("❌ Stornieren", key=f"cancel_{sd}_{slot_config['start']}", use_container_width=True):
-                            success = ww_db.cancel_booking(booking['id'], user.get('email'))
-                            if success:
-                                # Email senden
-                                mailer.send_cancellation(
-                                    booking.get('user_email'),
-                                    booking.get('user_name'),
-                                    sd,
-                                    f"{slot_config['start']} - {slot_config['end']}"
-                                )
-                                st.success("✅ Stornierung erfolgreich!")
-                                st.rerun()
-                            else:
-                                st.error("❌ Fehler bei der Stornierung")
-            else:
-                # Freier Slot - DIREKTER BUTTON WIE IM ORIGINAL
+        # Buttons nur für Slots mit möglicher Aktion
+        actions = [(state, *slot_action(user, state[0], state[3], state[5], (state[1], state[0]['start']) in waiting))
+                   for state in slot_states]
+        actions = [a for a in actions if a[1]]
+        if actions:
+            cols = st.columns(len(actions))
+            meter.add(len(actions) + 1)
+            for col, ((slot_config, sd, *_), action, booking) in zip(cols, actions):
+                with col:
+                    day_short = WOCHENTAGE_KURZ[WEEKDAY_INDEX.get(slot_config['day'], 0)]
+                    if action == 'cancel':
+                        if st.button(f"❌ {day_short} {fmt_de(sd)[:6]} stornieren", key=f"cancel_{sd}_{slot_config['start']}", use_container_width=True):
+                            handle_cancel_slot(user, booking, sd, slot_config)
+                    elif action == 'waitlist':
+                        if st.button(f"⏳ {day_short} {fmt_de(sd)[:6]} Warteliste", key=f"wait_{sd}_{slot_config['start']}", use_container_width=True):
+                            handle_waitlist_slot(user, sd, slot_config)
+                    elif action == 'leave_waitlist':
+                        if st.button(f"↩️ {day_short} {fmt_de(sd)[:6]} Warteliste verlassen", key=f"unwait_{sd}_{slot_config['start']}", use_container_width=True):
+                            handle_waitlist_slot(user, sd, slot_config, join=False)
+                    else:
+                        if st.button(f"📝 {day_short} {fmt_de(sd)[:6]} buchen", key=f"book_{sd}_{slot_config['start']}", use_container_width=True, type="primary"):
+                            handle_book_slot(user, sd, slot_config)
+                    meter.add()
+    else:
+        for slot_config, sd, reason, blocked, status, slot_bookings in slot_states:
+            # ===== 3D CARD =====
+            st.markdown(slot_card_html(slot_config, sd, reason, blocked, status, slot_bookings), unsafe_allow_html=True)
+            meter.add()
+            
+            # ===== AKTIONEN (WIE IM ORIGINAL) =====
+            action, booking = slot_action(user, slot_config, blocked, slot_bookings, (sd, slot_config['start']) in waiting)
+            if action == 'cancel':
+                col_btn1, col_btn2 = st.columns([4, 1])
+                meter.add(3)
+                with col_btn2:
+                    if st.button("❌ Stornieren", key=f"cancel_{sd}_{slot_config['start']}", use_container_width=True):
+                        handle_cancel_slot(user, booking, sd, slot_config)
+                    meter.add()
+            elif action == 'book':
                 col_info, col_btn = st.columns([4, 1])
+                meter.add(3)
                 with col_btn:
                     if st.button("📝 Buchen", key=f"book_{sd}_{slot_config['start']}", use_container_width=True, type="primary"):
-                        # Direkt buchen mit Session-User-Daten
-                        success, msg = ww_db.create_booking(
-                            sd,
-                            f"{slot_config['start']} - {slot_config['end']}",
-                            user.get('email'),
-                            user.get('name'),
-                            user.get('phone', '')
-                        )
-                        
-                        if success:
-                            # Benachrichtigungen senden
-                            if user.get('email_notifications', True):
-                                mailer.send_booking_confirmation(
-                                    user.get('email'),
-                                    user.get('name'),
-                                    sd,
-                                    f"{slot_config['start']} - {slot_config['end']}"
-                                )
-                            
-                            if user.get('sms_notifications', False) and user.get('phone'):
-                                sms_client.send_booking_confirmation(
-                                    user.get('phone'),
-                                    user.get('name'),
-                                    sd,
-                                    f"{slot_config['start']} - {slot_config['end']}"
-                                )
-                            
-                            # Admin-Benachrichtigung
-                            if user.get('role') != 'admin':
-                                mailer.send_admin_notification(
-                                    user.get('name'),
-                                    user.get('email'),
-                                    user.get('phone', ''),
-                                    sd,
-                                    f"{slot_config['start']} - {slot_config['end']}"
-                                )
-                            
-                            st.success(f"✅ {msg}")
-                            st.balloons()
-                            st.rerun()
-                        else:
-                            st.error(f"❌ {msg}")
-        
-        st.markdown("---")
+                        handle_book_slot(user, sd, slot_config)
+                    meter.add()
+            elif action in ('waitlist', 'leave_waitlist'):
+                col_info, col_btn = st.columns([4, 1])
+                meter.add(3)
+                with col_btn:
+                    if action == 'waitlist':
+                        if st.button("⏳ Warteliste", key=f"wait_{sd}_{slot_config['start']}", use_container_width=True):
+                            handle_waitlist_slot(user, sd, slot_config)
+                    elif st.button("↩️ Verlassen", key=f"unwait_{sd}_{slot_config['start']}", use_container_width=True):
+                        handle_waitlist_slot(user, sd, slot_config, join=False)
+                    meter.add()
+            
+            st.markdown("---")
+            meter.add()
+    
+    # Render-Messung (Vergleich Kompakt vs. Klassisch)
+    render_ms, deltas = meter.report()
+    st.session_state.setdefault('render_stats', {})['kompakt' if compact else 'klassisch'] = (render_ms, deltas)
+    if user.get('role') == 'admin':
+        st.caption(" | ".join(
+            f"⏱️ {mode}: {ms:.1f} ms, {n} Elemente"
+            for mode, (ms, n) in sorted(st.session_state.render_stats.items())
+        ))
+    
+    # ===== SERIENBUCHUNG =====
+    with st.expander("🔁 Serienbuchung (jede Woche)", expanded=False):
+        serienbuchung(user)
     
     # ===== ADMIN-ÜBERSICHT =====
     if user.get('role') == 'admin':
@@ -1636,23 +4045,51 @@ def kalender_page():
                 st.info("Noch keine Buchungen in dieser Woche")
 
 # ===== MEINE BUCHUNGEN =====
+PAST_BOOKINGS_PAGE_SIZE = 20
+
+def load_more_past_bookings(email):
+    """Nächste Seite vergangener Buchungen laden - erst 'bookings', dann 'archive', zuletzt die Bundles"""
+    state = st.session_state.past_bookings
+    while not state['done']:
+        page, cursor = ww_db.get_user_past_bookings_page(
+            email, state['collection'], state['cursor'], PAST_BOOKINGS_PAGE_SIZE
+        )
+        state['items'].extend(page)
+        state['cursor'] = cursor
+        if cursor is None:
+            # Collection erschöpft -> mit Archiv weitermachen
+            if state['collection'] == 'bookings':
+                state['collection'] = 'archive'
+            elif state['collection'] == 'archive':
+                state['collection'] = 'archive_bundles'
+            else:
+                state['done'] = True
+        if page:
+            break
+
 def meine_buchungen_page():
     user = st.session_state.user
     
     st.title("📋 Meine Buchungen")
     
-    bookings = ww_db.get_user_bookings(user['email'], future_only=False)
+    future = ww_db.get_user_future_bookings(user['email'])
+    waitlist = ww_db.get_user_waitlist(user['email'])
+    
+    # Vergangene Buchungen seitenweise im Session State halten
+    if st.session_state.get('past_bookings', {}).get('email') != user['email']:
+        st.session_state.past_bookings = {
+            'email': user['email'], 'items': [], 'collection': 'bookings', 'cursor': None, 'done': False
+        }
+        load_more_past_bookings(user['email'])
+    past_state = st.session_state.past_bookings
+    past = past_state['items']
     
-    if not bookings:
+    if not future and not past and not waitlist:
         st.info("Du hast noch keine Buchungen.")
         return
     
-    # Nach zukünftig/vergangen filtern
-    today = datetime.now().date().strftime("%Y-%m-%d")
-    future = [b for b in bookings if b['slot_date'] >= today]
-    past = [b for b in bookings if b['slot_date'] < today]
-    
-    tab1, tab2 = st.tabs([f"🔜 Zukünftig ({len(future)})", f"📅 Vergangen ({len(past)})"])
+    past_label = f"{len(past)}" if past_state['done'] else f"{len(past)}+"
+    tab1, tab2 = st.tabs([f"🔜 Zukünftig ({len(future)})", f"📅 Vergangen ({past_label})"])
     
     with tab1:
         if not future:
@@ -1673,16 +4110,34 @@ def meine_buchungen_page():
                             )
                             st.success("✅ Buchung storniert")
                             st.rerun()
+        
+        if waitlist:
+            st.markdown("#### ⏳ Warteliste")
+            for w in waitlist:
+                col1, col2 = st.columns([4, 1])
+                with col1:
+                    st.markdown(f"**{fmt_de(w['slot_date'])}** | {w['slot_time']} · Platz {w['position']}")
+                with col2:
+                    if st.button("↩️ Verlassen", key=f"unwait_my_{w['slot_date']}_{w['slot_time'][:5]}", use_container_width=True):
+                        ww_db.leave_waitlist(w['slot_date'], w['slot_time'], user['email'])
+                        st.rerun()
     
     with tab2:
         if not past:
             st.info("Keine vergangenen Buchungen.")
         else:
-            for b in past:
-                with st.expander(f"{fmt_de(b['slot_date'])} - {b.get('slot_time', 'N/A')}"):
-                    st.markdown(f"**📅 Datum:** {fmt_de(b['slot_date'])}")
-                    st.markdown(f"**⏰ Zeit:** {b.get('slot_time', 'N/A')}")
-                    st.markdown(f"**Status:** {b.get('status', 'confirmed')}")
+            # Eine Tabelle statt einem Expander pro Buchung
+            df_past = pd.DataFrame([{
+                'Datum': fmt_de(b['slot_date']),
+                'Zeit': b.get('slot_time', 'N/A'),
+                'Status': b.get('status', 'confirmed'),
+            } for b in past])
+            st.dataframe(df_past, use_container_width=True, hide_index=True)
+        
+        if not past_state['done']:
+            if st.button("⬇️ Ältere Buchungen laden", key="past_load_more", use_container_width=True):
+                load_more_past_bookings(user['email'])
+                st.rerun()
 
 # ===== PROFIL-SEITE (FÜR ALLE USER) =====
 def profil_page():
@@ -1697,7 +4152,7 @@ def profil_page():
         st.title("👤 Mein Profil")
     
     # Tabs
-    tab1, tab2, tab3 = st.tabs(["📋 Profil-Info", "🔔 Benachrichtigungen", "🔒 Sicherheit"])
+    tab1, tab2, tab3, tab4 = st.tabs(["📋 Profil-Info", "🔔 Benachrichtigungen", "📅 Verfügbarkeit", "🔒 Sicherheit"])
     
     # ===== TAB 1: PROFIL-INFO =====
     with tab1:
@@ -1863,8 +4318,63 @@ def profil_page():
                 else:
                     st.error("❌ Fehler beim Speichern")
     
-    # ===== TAB 3: SICHERHEIT (PASSWORT ÄNDERN) =====
+    # ===== TAB 3: VERFÜGBARKEIT =====
     with tab3:
+        st.subheader("Wann kannst du Dienste übernehmen?")
+        st.caption("Hilft bei der Dienstplanung und bei Hinweisen auf offene Dienste. Angaben gelten ganztägig.")
+        
+        availability = ww_db.get_availability(user['id'])
+        mask = availability.get('weekdays', 0)
+        day_keys = list(DAY_NAMES_DE)
+        
+        with st.form("verfuegbarkeit"):
+            weekdays = st.multiselect(
+                "Regelmäßig verfügbar an",
+                options=day_keys,
+                default=[d for d in day_keys if mask >> WEEKDAY_INDEX[d] & 1],
+                format_func=lambda d: DAY_NAMES_DE[d]
+            )
+            
+            st.markdown("**Abwesend (Urlaub etc.)**")
+            away = st.data_editor(
+                pd.DataFrame([{'Von': as_date(a['from']), 'Bis': as_date(a['to'])} for a in availability.get('away', [])],
+                             columns=['Von', 'Bis']),
+                num_rows="dynamic", use_container_width=True, hide_index=True, key="availability_away",
+                column_config={
+                    'Von': st.column_config.DateColumn("Von", format="DD.MM.YYYY"),
+                    'Bis': st.column_config.DateColumn("Bis", format="DD.MM.YYYY"),
+                }
+            )
+            
+            st.markdown("**Zusätzlich verfügbar am**")
+            extra = st.data_editor(
+                pd.DataFrame([{'Datum': as_date(d)} for d in availability.get('extra', [])], columns=['Datum']),
+                num_rows="dynamic", use_container_width=True, hide_index=True, key="availability_extra",
+                column_config={'Datum': st.column_config.DateColumn("Datum", format="DD.MM.YYYY")}
+            )
+            
+            submit = st.form_submit_button("💾 Verfügbarkeit speichern", use_container_width=True, type="primary")
+            
+            if submit:
+                away_ranges = []
+                for row in away.to_dict('records'):
+                    if pd.isna(row['Von']) or pd.isna(row['Bis']):
+                        continue
+                    start, end = sorted([as_date(row['Von']), as_date(row['Bis'])])
+                    away_ranges.append({'from': start.strftime("%Y-%m-%d"), 'to': end.strftime("%Y-%m-%d")})
+                extra_days = [as_date(row['Datum']).strftime("%Y-%m-%d")
+                              for row in extra.to_dict('records') if not pd.isna(row['Datum'])]
+                
+                if ww_db.save_availability(
+                    user['id'], user['email'], user['name'],
+                    sum(1 << WEEKDAY_INDEX[d] for d in weekdays), extra_days, away_ranges
+                ):
+                    st.success("✅ Verfügbarkeit gespeichert!")
+                else:
+                    st.error("❌ Fehler beim Speichern")
+    
+    # ===== TAB 4: SICHERHEIT (PASSWORT ÄNDERN) =====
+    with tab4:
         st.subheader("Passwort ändern")
         st.caption("Ändern Sie hier Ihr Passwort")
         
@@ -1920,52 +4430,690 @@ def profil_page():
                     else:
                         st.error("❌ Fehler beim Ändern des Passworts")
 
+# ===== STATISTIK-CACHE (VERSIONIERT) =====
+BOOKING_FRAME_FIELDS = ['slot_date', 'slot_time', 'user_email', 'user_name', 'status', 'created_at', 'cancelled_at']
+
+def build_bookings_frame():
+    """Alle Buchungen aus 'bookings', 'archive' und den Archiv-Bundles als DataFrame (projizierte Felder)"""
+    rows = []
+    for collection in ('bookings', 'archive'):
+        for doc in db.collection(collection).select(BOOKING_FRAME_FIELDS).stream():
+            b = doc.to_dict()
+            b['id'] = doc.id
+            b['source'] = collection
+            rows.append(b)
+    rows.extend({**b, 'source': 'archive'} for b in ww_db.get_archive_bundles())
+    df = pd.DataFrame(rows, columns=['id', 'source'] + BOOKING_FRAME_FIELDS)
+    df['slot_date'] = pd.to_datetime(df['slot_date'], errors='coerce')
+    for col in ('created_at', 'cancelled_at'):
+        df[col] = pd.to_datetime(df[col], errors='coerce', utc=True)
+    return df
+
+def build_stats_payload():
+    """DataFrames und Plotly-Figuren der Statistik-Seite aus den Rollups bauen"""
+    rollups = ww_db.get_stats_rollups()
+    if rollups is None:
+        return None
+    
+    months, archived, helpers = rollups
+    df_top = pd.DataFrame(helpers[:10], columns=['Name', 'Anzahl Dienste'])
+    df_month = pd.DataFrame(sorted(months.items()), columns=['Monat', 'Anzahl'])
+    return {
+        'total': sum(months.values()),
+        'archived': sum(archived.values()),
+        'df_top': df_top,
+        'df_month': df_month,
+        'fig_top': px.bar(df_top, x='Name', y='Anzahl Dienste', title='Top 10 Helfer'),
+        'fig_month': px.line(df_month, x='Monat', y='Anzahl', title='Buchungen pro Monat'),
+        'built_at': datetime.now(TZ).strftime('%d.%m.%Y %H:%M:%S'),
+    }
+
+@st.cache_data(show_spinner=False, max_entries=3)
+def load_bookings_frame(version):
+    """Gecachter Buchungs-Frame - Key ist die Buchungs-Version, daher exakte Treffer"""
+    return build_bookings_frame()
+
+@st.cache_data(show_spinner=False, max_entries=3)
+def load_stats_payload(version):
+    """Gecachte Statistik-Aggregate und Figuren pro Buchungs-Version"""
+    return build_stats_payload()
+
+class StaleWhileRevalidate:
+    """
+    Liefert sofort das letzte Ergebnis (auch wenn veraltet) und
+    aktualisiert im Hintergrund-Thread auf die aktuelle Version
+    """
+    def __init__(self, builder):
+        self.builder = builder
+        self._lock = threading.Lock()
+        self.value = None
+        self.version = None
+        self.refreshing = False
+    
+    def _refresh(self, version):
+        try:
+            value = self.builder()
+            with self._lock:
+                if value is not None:
+                    self.value, self.version = value, version
+        except Exception as e:
+            print(f"❌ Statistik-Refresh Fehler: {e}")
+        finally:
+            with self._lock:
+                self.refreshing = False
+    
+    def get(self, version):
+        """Returns: (value, is_stale)"""
+        with self._lock:
+            if self.value is not None and self.version == version:
+                return self.value, False
+            have_value = self.value is not None
+            if have_value and not self.refreshing:
+                self.refreshing = True
+                threading.Thread(target=self._refresh, args=(version,), daemon=True).start()
+        
+        if not have_value:
+            # Noch nie berechnet -> einmal synchron
+            value = self.builder()
+            with self._lock:
+                if value is not None:
+                    self.value, self.version = value, version
+            return value, False
+        return self.value, True
+
+@st.cache_resource
+def get_stats_swr():
+    return StaleWhileRevalidate(build_stats_payload)
+
+# ===== AUSLASTUNGS-ANALYSE (VEKTORISIERT) =====
+def offered_slots_frame(start, end):
+    """Angebotene Slots im Zeitraum (aus dem Slot-Kalender, inkl. Kapazität) mit slot_date als datetime"""
+    cal = slot_calendar(as_date(start), as_date(end))
+    return cal[['date', 'slot_id', 'slot_start', 'slot_label', 'capacity', 'blocked']].rename(columns={'date': 'slot_date'})
+
+def occupancy_analytics(df, start, end):
+    """
+    Füllgrad pro Slot/Wochentag/Monat (ohne blockierte Tage), Vorlaufzeit und Stornoquote
+    Füllgrad = belegte Plätze / angebotene Plätze (Kapazität laut Schichtplan), nicht "mindestens eine Buchung"
+    df: Buchungs-Frame aus load_bookings_frame (bookings + archive)
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    offered = offered_slots_frame(start, end)
+    offered = offered[~offered['blocked']].copy()
+    
+    in_range = df[df['slot_date'].between(start, end)]
+    confirmed = in_range[in_range['status'] == 'confirmed']
+    
+    # Buchungen pro (Datum, Startzeit) zählen und an die angebotenen Slots joinen - ohne Python-Schleife
+    booked = confirmed.groupby([confirmed['slot_date'], confirmed['slot_time'].astype(str).str[:5]]).size()
+    booked.index.names = ['slot_date', 'slot_start']
+    offered = offered.join(booked.rename('booked'), on=['slot_date', 'slot_start'])
+    offered['booked'] = offered['booked'].fillna(0).clip(upper=offered['capacity'])
+    offered['weekday'] = offered['slot_date'].dt.weekday
+    offered['month'] = offered['slot_date'].dt.strftime('%Y-%m')
+    
+    def fill(group_cols):
+        sums = offered.groupby(group_cols)[['booked', 'capacity']].sum()
+        return sums['booked'] / sums['capacity']
+    
+    slot_order = list(offered.sort_values(['weekday', 'slot_start'])['slot_label'].unique())
+    by_slot = fill('slot_label').reindex(slot_order).dropna()
+    by_weekday = fill('weekday')
+    by_weekday.index = [WOCHENTAGE_KURZ[i] for i in by_weekday.index]
+    heat_month_slot = fill(['month', 'slot_label']).unstack('slot_label')
+    heat_month_slot = heat_month_slot.reindex(columns=[c for c in slot_order if c in heat_month_slot.columns])
+    
+    # Vorlaufzeit: Buchungsdatum (lokal) bis Dienstdatum in Tagen
+    created_local = confirmed['created_at'].dt.tz_convert(TIMEZONE_STR).dt.tz_localize(None).dt.normalize()
+    lead_days = (confirmed['slot_date'] - created_local).dt.days.dropna().to_numpy()
+    
+    decided = in_range['status'].isin(['confirmed', 'cancelled'])
+    n_cancelled = int((in_range['status'] == 'cancelled').sum())
+    n_decided = int(decided.sum())
+    
+    return {
+        'offered': len(offered),
+        'places': int(offered['capacity'].sum()),
+        'filled': int(offered['booked'].sum()),
+        'fill_rate': float(offered['booked'].sum() / offered['capacity'].sum()) if len(offered) else 0.0,
+        'by_slot': by_slot,
+        'by_weekday': by_weekday,
+        'heat_month_slot': heat_month_slot,
+        'lead_days': lead_days,
+        'lead_median': float(np.median(lead_days)) if lead_days.size else None,
+        'cancel_rate': n_cancelled / n_decided if n_decided else 0.0,
+        'cancelled': n_cancelled,
+    }
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_occupancy(version, start, end):
+    """Gecachte Auslastungs-Analyse pro Buchungs-Version und Zeitraum"""
+    return occupancy_analytics(load_bookings_frame(version), start, end)
+
+def auslastung_section(version):
+    """Auslastungs-Analyse für Admins: Heatmaps, Vorlaufzeit, Stornoquote"""
+    st.subheader("📈 Auslastung")
+    
+    df = load_bookings_frame(version)
+    first = df['slot_date'].min()
+    default_start = first.date() if pd.notna(first) else datetime.now().date() - timedelta(days=365)
+    today = datetime.now().date()
+    date_range = st.date_input("Zeitraum", value=(default_start, today), format="DD.MM.YYYY", key="occupancy_range")
+    if not isinstance(date_range, (tuple, list)) or len(date_range) != 2:
+        st.info("Bitte Start- und Enddatum wählen")
+        return
+    
+    with st.spinner("Berechne Auslastung..."):
+        stats = load_occupancy(version, date_range[0], date_range[1])
+    
+    if not stats['offered']:
+        st.info("Keine buchbaren Slots im Zeitraum")
+        return
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Füllgrad", f"{stats['fill_rate']:.0%}")
+    with col2:
+        st.metric("Belegte Plätze", f"{stats['filled']} / {stats['places']}")
+    with col3:
+        st.metric("Stornoquote", f"{stats['cancel_rate']:.0%}")
+    with col4:
+        lead = stats['lead_median']
+        st.metric("Vorlauf (Median)", f"{lead:.0f} Tage" if lead is not None else "–")
+    
+    col_a, col_b = st.columns(2)
+    with col_a:
+        fig_slot = px.bar(x=stats['by_slot'].index, y=stats['by_slot'].values * 100,
+                          labels={'x': 'Slot', 'y': 'Füllgrad %'}, title='Füllgrad pro Slot')
+        st.plotly_chart(fig_slot, use_container_width=True)
+    with col_b:
+        fig_wd = px.bar(x=stats['by_weekday'].index, y=stats['by_weekday'].values * 100,
+                        labels={'x': 'Wochentag', 'y': 'Füllgrad %'}, title='Füllgrad pro Wochentag')
+        st.plotly_chart(fig_wd, use_container_width=True)
+    
+    heat = stats['heat_month_slot']
+    if not heat.empty:
+        fig_heat = go.Figure(go.Heatmap(
+            z=heat.values * 100, x=list(heat.columns), y=list(heat.index),
+            colorscale='Blues', zmin=0, zmax=100, colorbar={'title': '%'},
+            hovertemplate='%{y} | %{x}: %{z:.0f}%<extra></extra>'
+        ))
+        fig_heat.update_layout(title='Füllgrad Monat × Slot', height=max(300, 22 * len(heat.index)))
+        st.plotly_chart(fig_heat, use_container_width=True)
+    
+    if stats['lead_days'].size:
+        fig_lead = px.histogram(x=stats['lead_days'], nbins=30, labels={'x': 'Tage zwischen Buchung und Dienst'},
+                                title='Vorlaufzeit der Buchungen')
+        st.plotly_chart(fig_lead, use_container_width=True)
+
 # ===== STATISTIK =====
 def statistik_page():
+    user = st.session_state.user
     st.title("📊 Statistik")
     
-    # Lade alle Buchungen
-    all_bookings = []
-    try:
-        for doc in db.collection('bookings').where('status', '==', 'confirmed').stream():
-            b = doc.to_dict()
-            b['id'] = doc.id
-            all_bookings.append(b)
-    except:
+    # 1 Read für die Version - alles andere kommt aus dem Cache
+    version = ww_db.get_bookings_version()
+    if ww_db.get_setting('stats_stale_while_revalidate', 'false') == 'true':
+        payload, stale = get_stats_swr().get(version)
+    else:
+        with st.spinner("Statistik wird berechnet..."):
+            payload, stale = load_stats_payload(version), False
+    
+    if payload is None:
         st.error("Fehler beim Laden der Statistiken")
         return
     
-    if not all_bookings:
+    if payload['total'] == 0:
         st.info("Noch keine Buchungen vorhanden.")
         return
     
+    st.caption(f"Gesamt: {payload['total']} Dienste, davon {payload['archived']} archiviert | Stand: {payload['built_at']}")
+    if stale:
+        st.caption("🔄 Anzeige aus dem Cache - Aktualisierung läuft im Hintergrund")
+    
     # Top Helfer
     st.subheader("🏆 Top Helfer")
-    user_counts = Counter([b['user_name'] for b in all_bookings])
-    top_10 = user_counts.most_common(10)
+    if not payload['df_top'].empty:
+        st.plotly_chart(payload['fig_top'], use_container_width=True)
+    
+    # Buchungen pro Monat
+    st.subheader("📅 Buchungen pro Monat")
+    st.plotly_chart(payload['fig_month'], use_container_width=True)
+    
+    # Eigene Dienste aus dem Helfer-Rollup (+ 1 Count-Query für die geplanten)
+    st.subheader("👤 Meine Dienste")
+    done, planned = ww_db.get_user_service_counts(user.get('email'))
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Geleistete Dienste", done)
+    with col2:
+        st.metric("Geplante Dienste", planned)
+    
+    if user.get('role') == 'admin':
+        st.divider()
+        auslastung_section(version)
+
+# ===== ARCHIV-ANSICHT (ADMIN) =====
+ARCHIVE_PAGE_SIZE = 50
+
+def archiv_browser():
+    """Archivierte Buchungen nach Zeitraum/Mitglied durchsuchen und exportieren"""
+    st.subheader("🗄️ Archiv durchsuchen")
+    
+    today = date.today()
+    col1, col2, col3 = st.columns([2, 2, 3])
+    with col1:
+        start = st.date_input("Von", today.replace(year=today.year - 2), format="DD.MM.YYYY", key="archive_from")
+    with col2:
+        end = st.date_input("Bis", today, format="DD.MM.YYYY", key="archive_to")
+    with col3:
+        directory = load_user_directory()
+        members = {"": "Alle Mitglieder"}
+        members.update({u['email']: f"{u.get('name', '')} ({u['email']})" for u in directory})
+        email = st.selectbox("Mitglied", list(members), format_func=lambda e: members[e], key="archive_member")
+    
+    # Seiten-Cursor zurücksetzen, wenn sich der Filter ändert
+    filter_key = (start, end, email)
+    if st.session_state.get('archive_filter_key') != filter_key:
+        st.session_state.archive_filter_key = filter_key
+        st.session_state.archive_cursors = [None]
+    cursors = st.session_state.archive_cursors
+    
+    bookings, next_cursor = ww_db.get_archive_page(start, end, email or None, cursors[-1], ARCHIVE_PAGE_SIZE)
+    # Kompaktierte Monate: ein Read pro Monat, Mitgliedsfilter lokal
+    bundled = [b for b in ww_db.get_archive_bundles(start, end) if not email or b['user_email'] == email][::-1]
+    
+    col_info, col_prev, col_next = st.columns([3, 1, 1])
+    with col_info:
+        st.markdown(f"**Treffer:** {ww_db.count_archive(start, end, email or None) + len(bundled)} "
+                    f"(davon {len(bundled)} kompaktiert) | Seite {len(cursors)}")
+    with col_prev:
+        if len(cursors) > 1 and st.button("⬅️ Zurück", key="archive_prev", use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with col_next:
+        if next_cursor is not None and st.button("Weiter ➡️", key="archive_next", use_container_width=True):
+            cursors.append(next_cursor)
+            st.rerun()
+    
+    def _table(rows):
+        st.dataframe(pd.DataFrame([{
+            'Datum': datetime.strptime(b['slot_date'], "%Y-%m-%d").strftime("%d.%m.%Y"),
+            'Zeit': b.get('slot_time', ''),
+            'Name': b.get('user_name', ''),
+            'E-Mail': b.get('user_email', ''),
+            'Status': b.get('status', '')
+        } for b in rows]), use_container_width=True, hide_index=True)
+    
+    if bookings:
+        _table(bookings)
+    if bundled:
+        with st.expander(f"🗜️ Kompaktiertes Archiv ({len(bundled)} Buchungen)", expanded=not bookings):
+            _table(bundled)
+    if not bookings and not bundled:
+        st.info("Keine archivierten Buchungen im gewählten Zeitraum")
+    
+    if st.button("📦 Zeitraum als NDJSON exportieren", key="archive_export"):
+        with st.spinner("Exportiere Archiv..."):
+            spool, count, size = spool_ndjson(ww_db.archive_query(start, end, email or None), order_by='slot_date',
+                                              extra_records=bundled[::-1])
+        st.download_button(
+            f"⬇️ archiv.ndjson ({count} Buchungen, {size / 1024:.0f} KB)",
+            spool.read(),
+            f"archiv_{start.strftime('%Y%m%d')}_{end.strftime('%Y%m%d')}.ndjson",
+            "application/x-ndjson",
+            key="archive_download"
+        )
+        spool.close()
+
+# ===== SCHICHTPLÄNE (ADMIN) =====
+def schichtplan_editor():
+    """Versionierte, zeitlich begrenzte Schichtpläne anzeigen und bearbeiten"""
+    st.subheader("🕐 Schichtpläne")
+    st.caption("Ohne passenden Plan gilt der Standard (Di/Fr 17-20 Uhr, Sa 14-17 Uhr). "
+               "Überlappen sich Pläne, gilt der mit dem spätesten Beginn.")
+    
+    schedules = ww_db.get_slot_schedules()
+    for sch in schedules:
+        period = f"{fmt_de(sch['valid_from']) if sch.get('valid_from') else 'offen'} - " \
+                 f"{fmt_de(sch['valid_to']) if sch.get('valid_to') else 'offen'}"
+        status = "✅" if sch.get('active', True) else "⏸️"
+        slots = ", ".join(f"{sc['day_name'][:2]} {sc['start']}-{sc['end']} ({slot_capacity(sc)}×)" for sc in sch.get('slots', []))
+        st.markdown(f"{status} **{sch.get('name', sch['id'])}** ({period}) · v{sch.get('version', 1)}")
+        st.caption(slots or "Keine Slots (dienstfrei)")
+    
+    st.divider()
+    options = {"": "➕ Neuer Schichtplan"}
+    options.update({sch['id']: f"✏️ {sch.get('name', sch['id'])}" for sch in schedules})
+    selected_id = st.selectbox("Plan bearbeiten", list(options), format_func=lambda i: options[i], key="schedule_select")
+    current = next((sch for sch in schedules if sch['id'] == selected_id), {})
+    
+    with st.form(f"schedule_form_{selected_id or 'new'}"):
+        name = st.text_input("Name", current.get('name', ''), placeholder="z.B. Sommer-Seedienst")
+        col1, col2 = st.columns(2)
+        with col1:
+            valid_from = st.date_input("Gültig ab", as_date(current['valid_from']) if current.get('valid_from') else None,
+                                       format="DD.MM.YYYY")
+        with col2:
+            valid_to = st.date_input("Gültig bis (leer = offen)", as_date(current['valid_to']) if current.get('valid_to') else None,
+                                     format="DD.MM.YYYY")
+        col3, col4 = st.columns(2)
+        with col3:
+            summer_break = st.checkbox("Sommerpause (Juni-September blockiert)", current.get('summer_break', True))
+        with col4:
+            active = st.checkbox("Aktiv", current.get('active', True))
+        
+        rows = [{'Tag': DAY_NAMES_DE[sc['day']], 'Start': sc['start'], 'Ende': sc['end'], 'Plätze': slot_capacity(sc)}
+                for sc in current.get('slots', WEEKLY_SLOTS)]
+        edited = st.data_editor(
+            pd.DataFrame(rows, columns=['Tag', 'Start', 'Ende', 'Plätze']),
+            num_rows="dynamic", use_container_width=True, hide_index=True,
+            column_config={
+                'Tag': st.column_config.SelectboxColumn("Tag", options=list(DAY_NAMES_DE.values()), required=True),
+                'Start': st.column_config.TextColumn("Start", help="HH:MM"),
+                'Ende': st.column_config.TextColumn("Ende", help="HH:MM"),
+                'Plätze': st.column_config.NumberColumn("Plätze", min_value=1, max_value=MAX_SLOT_CAPACITY, step=1,
+                                                        default=DEFAULT_SLOT_CAPACITY, help="Helfer pro Schicht"),
+            }
+        )
+        
+        if st.form_submit_button("💾 Schichtplan speichern", type="primary"):
+            day_keys = {v: k for k, v in DAY_NAMES_DE.items()}
+            slots, error = normalize_schedule_slots([
+                {'day': day_keys.get(r['Tag']), 'start': r['Start'], 'end': r['Ende'], 'capacity': r['Plätze']}
+                for r in edited.fillna('').to_dict('records')
+            ])
+            if not name.strip():
+                error = "Name ist ein Pflichtfeld"
+            elif valid_from and valid_to and valid_to < valid_from:
+                error = "'Gültig bis' liegt vor 'Gültig ab'"
+            if error:
+                st.error(f"❌ {error}")
+            else:
+                success, msg = ww_db.save_slot_schedule(selected_id or None, {
+                    'name': name.strip(),
+                    'valid_from': valid_from.strftime("%Y-%m-%d") if valid_from else '',
+                    'valid_to': valid_to.strftime("%Y-%m-%d") if valid_to else '',
+                    'summer_break': summer_break,
+                    'active': active,
+                    'slots': slots,
+                }, st.session_state.user['email'])
+                if success:
+                    st.success(f"✅ {msg}")
+                    st.rerun()
+                else:
+                    st.error(f"❌ {msg}")
+
+# ===== DIENSTPLAN-AUTOMATIK (SOLVER) =====
+ROSTER_DEFAULT_LIMITS = {'max_total': 0, 'max_per_week': 1, 'max_per_month': 0, 'one_per_day': True}
+
+def roster_places(start, end, bookings):
+    """
+    Offene Plätze im Zeitraum aus dem Slot-Kalender (nur nicht blockierte Slots ab heute)
+    Returns: Liste von {'slot_date','slot_time','capacity','members'} mit freien Plätzen
+    """
+    cal = slot_calendar(max(as_date(start), date.today()), as_date(end))
+    cal = cal[~cal['blocked']]
+    booking_index = index_bookings(bookings)
+    places = []
+    for slot_date_str, slot_time, slot_start, capacity in zip(cal['slot_date'], cal['slot_time'], cal['slot_start'], cal['capacity']):
+        members = [b.get('user_email', '') for b in booking_index.get((slot_date_str, slot_start), [])]
+        if len(members) < capacity:
+            places.append({'slot_date': slot_date_str, 'slot_time': slot_time,
+                           'capacity': int(capacity), 'members': members})
+    return places
+
+def solve_roster(places, members, bookings=(), history=None, limits=None, availability=None, time_budget=2.0):
+    """
+    Fairer Dienstplan-Vorschlag für offene Plätze (Greedy + lokale Suche)
+    places: aus roster_places() | members: User-Dicts (email, name, phone)
+    bookings: bestehende Buchungen im Zeitraum (zählen für Limits und Last)
+    history: {email: bisherige Dienste} - gleicht langjährige Helfer gegen Neue aus
+    limits: max_total / max_per_week / max_per_month (0 = unbegrenzt), one_per_day
+    availability: optional callable(email, slot_date, slot_time) -> bool
+    Returns: (assignments, info)
+    """
+    t0 = time.perf_counter()
+    limits = {**ROSTER_DEFAULT_LIMITS, **(limits or {})}
+    history = history or {}
+    emails = [m['email'] for m in members]
+    member_index = {e: i for i, e in enumerate(emails)}
+    n = len(members)
+    
+    # Zustand pro Helfer: Last (Historie + Zeitraum), belegte Tage, Wochen-/Monatszähler, neue Dienste
+    load = [history.get(e, 0) for e in emails]
+    days = [set() for _ in range(n)]
+    weeks = [Counter() for _ in range(n)]
+    months = [Counter() for _ in range(n)]
+    new = [0] * n
+    
+    def period(slot_date_str):
+        d = as_date(slot_date_str)
+        return d.isocalendar()[:2], slot_date_str[:7]
+    
+    def book(m, slot_date_str, delta, count_new=True):
+        week, month = period(slot_date_str)
+        load[m] += delta
+        weeks[m][week] += delta
+        months[m][month] += delta
+        if delta > 0:
+            days[m].add(slot_date_str)
+        else:
+            days[m].discard(slot_date_str)
+        if count_new:
+            new[m] += delta
+    
+    for b in bookings:
+        m = member_index.get(b.get('user_email'))
+        if m is not None:
+            book(m, b['slot_date'], 1, count_new=False)
+    
+    # Plätze einzeln; pro Slot die Kandidaten vorfiltern (Verfügbarkeit, nicht schon eingetragen)
+    slots = []
+    for p in places:
+        taken = set(p['members'])
+        candidates = [i for i, e in enumerate(emails)
+                      if e not in taken and (availability is None or availability(e, p['slot_date'], p['slot_time']))]
+        week, month = period(p['slot_date'])
+        slots.append({**p, 'week': week, 'month': month, 'candidates': candidates,
+                      'assigned': [], 'open': p['capacity'] - len(p['members'])})
+    
+    def feasible(m, s):
+        if m in s['assigned']:
+            return False
+        if limits['one_per_day'] and s['slot_date'] in days[m]:
+            return False
+        if limits['max_per_week'] and weeks[m][s['week']] >= limits['max_per_week']:
+            return False
+        if limits['max_per_month'] and months[m][s['month']] >= limits['max_per_month']:
+            return False
+        if limits['max_total'] and new[m] >= limits['max_total']:
+            return False
+        return True
+    
+    def fill(s):
+        while len(s['assigned']) < s['open']:
+            best = min((c for c in s['candidates'] if feasible(c, s)),
+                       key=lambda c: (load[c], new[c], emails[c]), default=None)
+            if best is None:
+                return
+            s['assigned'].append(best)
+            book(best, s['slot_date'], 1)
+    
+    # 1) Greedy: am stärksten eingeschränkte Slots zuerst, jeweils Helfer mit geringster Last
+    for s in sorted(slots, key=lambda s: (len(s['candidates']), s['slot_date'], s['slot_time'])):
+        fill(s)
+    
+    # 2) Lokale Suche: Dienst von a nach b verschieben, solange das die Last-Spreizung verringert
+    moves = 0
+    improved = True
+    while improved and time.perf_counter() - t0 < time_budget:
+        improved = False
+        for s in slots:
+            for pos, a in enumerate(s['assigned']):
+                book(a, s['slot_date'], -1)
+                best = min((c for c in s['candidates'] if c != a and feasible(c, s)),
+                           key=lambda c: (load[c], emails[c]), default=None)
+                if best is not None and load[best] < load[a]:
+                    s['assigned'][pos] = best
+                    book(best, s['slot_date'], 1)
+                    moves += 1
+                    improved = True
+                else:
+                    book(a, s['slot_date'], 1)
+        # Durch Verschiebungen frei gewordene Limits für offene Plätze nutzen
+        for s in slots:
+            fill(s)
+    
+    assignments = []
+    for s in slots:
+        for m in s['assigned']:
+            assignments.append({
+                'slot_date': s['slot_date'], 'slot_time': s['slot_time'], 'capacity': s['capacity'],
+                'user_email': emails[m], 'user_name': members[m].get('name', emails[m]),
+                'user_phone': members[m].get('phone', '')
+            })
+    assignments.sort(key=lambda a: (a['slot_date'], a['slot_time'], a['user_name']))
+    
+    period_loads = [load[m] - history.get(emails[m], 0) for m in range(n)]
+    info = {
+        'places': sum(s['open'] for s in slots),
+        'filled': len(assignments),
+        'members': n,
+        'helpers_used': sum(1 for x in new if x),
+        'min_load': min(load, default=0),
+        'max_load': max(load, default=0),
+        'max_period_load': max(period_loads, default=0),
+        'moves': moves,
+        'duration': time.perf_counter() - t0,
+        'load': {emails[m]: (history.get(emails[m], 0), period_loads[m] - new[m], new[m]) for m in range(n)},
+    }
+    return assignments, info
+
+def auto_dienstplan():
+    """Dienstplan-Vorschlag für einen Zeitraum berechnen, prüfen und gebündelt übernehmen"""
+    st.markdown("### Dienstplan automatisch befüllen")
+    st.caption("Verteilt freie Plätze fair auf aktive Helfer - bisherige Dienste werden berücksichtigt, "
+               "blockierte Tage (Feiertage, Sommerpause) bleiben frei.")
+    
+    configured = ww_db.get_booking_limits()
+    with st.form("auto_dienstplan_form"):
+        col1, col2 = st.columns(2)
+        with col1:
+            start = st.date_input("Von", date.today(), format="DD.MM.YYYY")
+        with col2:
+            end = st.date_input("Bis", date.today() + timedelta(weeks=12), format="DD.MM.YYYY")
+        col3, col4, col5 = st.columns(3)
+        with col3:
+            max_per_week = st.number_input("Max. Dienste pro Woche", 0, 21, configured['week'] or 1, help="0 = unbegrenzt")
+        with col4:
+            max_per_month = st.number_input("Max. Dienste pro Monat", 0, 93, configured['month'] or 2, help="0 = unbegrenzt")
+        with col5:
+            max_total = st.number_input("Max. neue Dienste gesamt", 0, 100, 0, help="0 = unbegrenzt")
+        col6, col7 = st.columns(2)
+        with col6:
+            one_per_day = st.checkbox("Höchstens ein Dienst pro Tag", True)
+            include_admins = st.checkbox("Admins einplanen", False)
+            use_availability = st.checkbox("Verfügbarkeit aus Profilen beachten", True)
+            include_undeclared = st.checkbox("Helfer ohne Verfügbarkeitsangabe einplanen", True)
+        with col7:
+            history_weight = st.slider("Gewicht bisheriger Dienste", 0.0, 1.0, 0.5, 0.1,
+                                       help="0 = nur der Zeitraum zählt, 1 = alle bisherigen Dienste voll")
+        submit = st.form_submit_button("🤖 Vorschlag berechnen", type="primary", use_container_width=True)
+    
+    if submit:
+        if end < start:
+            st.error("❌ 'Bis' liegt vor 'Von'")
+            return
+        members = [u for u in load_user_directory()
+                   if u.get('active', True) and (include_admins or u.get('role') != 'admin')]
+        bookings = ww_db.get_range_bookings(start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+        counts = ww_db.get_helper_counts()
+        history = {u['email']: counts.get(stats_user_key(u['email']), 0) * history_weight for u in members}
+        availability = None
+        if use_availability:
+            availability_index = get_availability_index()
+            availability = lambda email, slot_d, slot_time: availability_index.is_available(
+                email, slot_d, slot_time, default=include_undeclared)
+        assignments, info = solve_roster(
+            roster_places(start, end, bookings), members, bookings, history,
+            {'max_total': max_total, 'max_per_week': max_per_week,
+             'max_per_month': max_per_month, 'one_per_day': one_per_day},
+            availability
+        )
+        st.session_state.roster_proposal = {'assignments': assignments, 'info': info}
+    
+    proposal = st.session_state.get('roster_proposal')
+    if not proposal:
+        return
+    assignments, info = proposal['assignments'], proposal['info']
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Plätze besetzt", f"{info['filled']}/{info['places']}")
+    col2.metric("Helfer eingeplant", f"{info['helpers_used']}/{info['members']}")
+    col3.metric("Max. Dienste/Helfer", info['max_period_load'])
+    col4.metric("Berechnung", f"{info['duration'] * 1000:.0f} ms")
+    if info['filled'] < info['places']:
+        st.warning(f"⚠️ {info['places'] - info['filled']} Plätze bleiben frei (Limits/Verfügbarkeit)")
+    
+    if not assignments:
+        st.info("Keine Zuweisungen möglich")
+        return
     
-    if top_10:
-        df_top = pd.DataFrame(top_10, columns=['Name', 'Anzahl Dienste'])
-        fig = px.bar(df_top, x='Name', y='Anzahl Dienste', title='Top 10 Helfer')
-        st.plotly_chart(fig, use_container_width=True)
+    with st.expander(f"📋 Vorschlag ({len(assignments)} Dienste)", expanded=True):
+        st.dataframe(pd.DataFrame([{
+            'Datum': fmt_de(a['slot_date']),
+            'Zeit': a['slot_time'],
+            'Helfer': a['user_name'],
+            'E-Mail': a['user_email'],
+        } for a in assignments]), use_container_width=True, hide_index=True)
+    with st.expander("⚖️ Verteilung pro Helfer"):
+        names = {a['user_email']: a['user_name'] for a in assignments}
+        st.dataframe(pd.DataFrame([{
+            'Helfer': names.get(email, email),
+            'Bisher (gewichtet)': round(hist, 1),
+            'Bereits gebucht': booked,
+            'Neu': added,
+        } for email, (hist, booked, added) in info['load'].items()]).sort_values('Neu', ascending=False),
+            use_container_width=True, hide_index=True)
+    
+    notify = st.checkbox("Helfer per E-Mail benachrichtigen (eine Sammel-Mail pro Helfer)", True, key="roster_notify")
+    col1, col2 = st.columns(2)
+    with col1:
+        apply = st.button("✅ Vorschlag übernehmen", type="primary", use_container_width=True)
+    with col2:
+        if st.button("🗑️ Verwerfen", use_container_width=True):
+            del st.session_state.roster_proposal
+            st.rerun()
     
-    # Buchungen pro Monat
-    st.subheader("📅 Buchungen pro Monat")
-    monthly = Counter([b['slot_date'][:7] for b in all_bookings])
-    df_month = pd.DataFrame(sorted(monthly.items()), columns=['Monat', 'Anzahl'])
-    fig_month = px.line(df_month, x='Monat', y='Anzahl', title='Buchungen pro Monat')
-    st.plotly_chart(fig_month, use_container_width=True)
+    if apply:
+        bar = st.progress(0.0, text="Buchungen werden angelegt...")
+        created, skipped = ww_db.create_bookings_bulk(
+            assignments, progress=lambda done, total: bar.progress(done / total, text=f"{done}/{total} Slots")
+        )
+        del st.session_state.roster_proposal
+        st.success(f"✅ {len(created)} Buchungen angelegt")
+        if skipped:
+            st.warning(f"⚠️ {len(skipped)} übersprungen (inzwischen belegt)")
+        if notify:
+            shifts = {}
+            for a in created:
+                shifts.setdefault((a['user_email'], a['user_name']), []).append((a['slot_date'], a['slot_time']))
+            sent = sum(1 for (email, name), items in shifts.items() if mailer.send_booking_summary(email, name, items)[0])
+            st.info(f"📧 {sent}/{len(shifts)} Sammel-Mails versendet")
+
 # ===== VERWALTUNG (ADMIN) =====
 # ===== VERWALTUNG (ADMIN) - ERWEITERT MIT FREIEN SLOTS =====
 # ===== VERWALTUNG (ADMIN) - KOMPLETT MIT ADMIN-BUCHUNG =====
 def verwaltung_page():
     st.title("⚙️ Verwaltung")
     
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "📋 Alle Buchungen", 
         "🔍 Freie Slots", 
         "👥 Admin-Buchung", 
-        "🗑️ Archivieren", 
+        "🗄️ Archiv", 
+        "🕐 Schichtpläne", 
         "⚙️ Einstellungen"
     ])
     
@@ -2024,12 +5172,11 @@ def verwaltung_page():
                                         st.rerun()
                             
                             if st.button("🗑️ Löschen", key=f"admin_del_{booking['id']}"):
-                                try:
-                                    db.collection('bookings').document(booking['id']).delete()
+                                if ww_db.delete_booking(booking['id']):
                                     st.success("✅ Gelöscht")
                                     st.rerun()
-                                except Exception as e:
-                                    st.error(f"Fehler: {e}")
+                                else:
+                                    st.error("❌ Fehler beim Löschen")
         
         except Exception as e:
             st.error(f"Fehler beim Laden: {e}")
@@ -2045,45 +5192,47 @@ def verwaltung_page():
         
         all_slots = []
         current_week = week_start(today)
+        period_end = current_week + timedelta(days=7 * weeks_ahead - 1)
+        
+        # Ein Kalender-Frame + eine Range-Query statt einer Query pro Slot
+        cal = slot_calendar(current_week, period_end)
+        cal = cal[(cal['date'] >= pd.Timestamp(today)) & ~cal['blocked']]
+        booking_index = index_bookings(ww_db.get_range_bookings(
+            today.strftime("%Y-%m-%d"), period_end.strftime("%Y-%m-%d")
+        ))
+        availability_index = get_availability_index()
         
-        for week_offset in range(weeks_ahead):
-            ws = current_week + timedelta(days=7 * week_offset)
+        for slot_config, slot_d, _, _ in slot_rows(cal):
+            slot_bookings = booking_index.get((slot_d, slot_config['start']), [])
+            taken = len(slot_bookings)
+            if taken >= slot_capacity(slot_config):
+                continue
             
-            for slot_config in WEEKLY_SLOTS:
-                slot_d = slot_date(ws, slot_config['day'])
-                slot_date_obj = datetime.strptime(slot_d, '%Y-%m-%d').date()
-                
-                if slot_date_obj < today:
-                    continue
-                
-                if is_blocked(slot_d):
-                    continue
-                
-                slot_time = f"{slot_config['start']} - {slot_config['end']}"
-                booking = ww_db.get_booking(slot_d, slot_time)
-                
-                if not booking:
-                    days_until = (slot_date_obj - today).days
-                    
-                    if days_until < 7:
-                        color = "🔴"
-                        urgency = "kritisch"
-                    elif days_until < 14:
-                        color = "🟠"
-                        urgency = "achtung"
-                    else:
-                        color = "🟢"
-                        urgency = "entspannt"
-                    
-                    all_slots.append({
-                        'date': slot_d,
-                        'date_obj': slot_date_obj,
-                        'weekday': slot_config['day_name'],
-                        'time': slot_time,
-                        'days_until': days_until,
-                        'color': color,
-                        'urgency': urgency
-                    })
+            slot_date_obj = as_date(slot_d)
+            slot_time = f"{slot_config['start']} - {slot_config['end']}"
+            days_until = (slot_date_obj - today).days
+            
+            if days_until < 7:
+                color = "🔴"
+                urgency = "kritisch"
+            elif days_until < 14:
+                color = "🟠"
+                urgency = "achtung"
+            else:
+                color = "🟢"
+                urgency = "entspannt"
+            
+            all_slots.append({
+                'date': slot_d,
+                'date_obj': slot_date_obj,
+                'weekday': slot_config['day_name'],
+                'time': slot_time,
+                'open_places': slot_capacity(slot_config) - taken,
+                'available': availability_index.available(slot_d, exclude={b.get('user_email') for b in slot_bookings}),
+                'days_until': days_until,
+                'color': color,
+                'urgency': urgency
+            })
         
         all_slots.sort(key=lambda x: x['date'])
         
@@ -2113,6 +5262,8 @@ def verwaltung_page():
                     'Datum': fmt_de(s['date']),
                     'Wochentag': s['weekday'],
                     'Uhrzeit': s['time'],
+                    'Freie Plätze': s['open_places'],
+                    'Verfügbar': len(s['available']),
                     'Tage bis Slot': s['days_until'],
                     'Dringlichkeit': s['urgency']
                 } for s in all_slots])
@@ -2159,6 +5310,17 @@ Details:
                     else:
                         st.error("❌ Keine Admin-E-Mail konfiguriert")
             
+            # Offene Dienste an Helfer melden, die laut Profil Zeit haben (eine Mail pro Helfer)
+            urgent = [s for s in all_slots if s['urgency'] != 'entspannt' and s['available']]
+            if urgent and st.button(f"📣 Verfügbare Helfer informieren ({len(urgent)} dringende Slots)", use_container_width=True):
+                alerts = {}
+                for s in urgent:
+                    for name, email_addr in s['available']:
+                        alerts.setdefault((email_addr, name), []).append((s['date'], s['time']))
+                sent = sum(1 for (email_addr, name), shifts in alerts.items()
+                           if mailer.send_free_slot_alert(email_addr, name, shifts)[0])
+                st.success(f"📧 {sent}/{len(alerts)} Helfer informiert")
+            
             st.divider()
             st.markdown("### 📋 Details")
             
@@ -2174,6 +5336,10 @@ Details:
                     with col3:
                         st.markdown(f"**{slot['time']}**")
                         st.caption(f"in {slot['days_until']} Tagen")
+                        if slot['available']:
+                            names = ", ".join(name for name, _ in slot['available'][:5])
+                            more = len(slot['available']) - 5
+                            st.caption(f"🙋 {names}" + (f" +{more}" if more > 0 else ""))
                     with col4:
                         if slot['urgency'] == 'kritisch':
                             st.error("Dringend!")
@@ -2190,7 +5356,7 @@ Details:
     with tab3:
         st.subheader("👥 Schichten für User buchen & umbuchen")
         
-        sub_tab1, sub_tab2 = st.tabs(["➕ Neue Buchung", "🔄 Umbuchung"])
+        sub_tab1, sub_tab2, sub_tab3 = st.tabs(["➕ Neue Buchung", "🔄 Umbuchung", "🤖 Auto-Dienstplan"])
         
         # --- SUB-TAB 1: NEUE BUCHUNG ---
         with sub_tab1:
@@ -2199,7 +5365,7 @@ Details:
             
             with st.form("admin_neue_buchung"):
                 # User auswählen
-                all_users = ww_db.get_all_users()
+                all_users = load_user_directory()
                 active_users = [u for u in all_users if u.get('active', True)]
                 
                 if not active_users:
@@ -2233,28 +5399,35 @@ Details:
                     with col2:
                         # Verfügbare Slots für diese Woche
                         available_slots = []
-                        for slot_config in WEEKLY_SLOTS:
-                            slot_d = slot_date(selected_week, slot_config['day'])
-                            slot_date_obj = datetime.strptime(slot_d, '%Y-%m-%d').date()
-                            
-                            if slot_date_obj < today:
-                                continue
-                            
+                        week_cal = slot_calendar(selected_week, selected_week + timedelta(days=6))
+                        week_cal = week_cal[week_cal['date'] >= pd.Timestamp(today)]
+                        booking_index = index_bookings(ww_db.get_week_bookings(selected_week.strftime("%Y-%m-%d")))
+                        availability_index = get_availability_index()
+                        for slot_config, slot_d, blocked, reason in slot_rows(week_cal):
                             slot_time = f"{slot_config['start']} - {slot_config['end']}"
-                            booking = ww_db.get_booking(slot_d, slot_time)
-                            blocked = is_blocked(slot_d)
+                            slot_bookings = booking_index.get((slot_d, slot_config['start']), [])
+                            capacity = slot_capacity(slot_config)
+                            names = ', '.join(b['user_name'] for b in slot_bookings)
                             
                             label = f"{slot_config['day_name']} {fmt_de(slot_d)} | {slot_time}"
                             
-                            if booking:
-                                label += f" (Gebucht: {booking['user_name']})"
-                                available_slots.append((label, slot_d, slot_time, True, booking))
+                            # Vorschlag: Anzahl Helfer mit passender Verfügbarkeit
+                            suggested = availability_index.available(slot_d, exclude={b.get('user_email') for b in slot_bookings})
+                            suggestion = f" · 🙋 {len(suggested)} verfügbar" if suggested else ""
+                            
+                            if len(slot_bookings) >= capacity:
+                                label += f" (Gebucht: {names})"
+                                available_slots.append((label, slot_d, slot_time, True, slot_bookings))
+                            elif slot_bookings:
+                                label += f" ({len(slot_bookings)}/{capacity}: {names}){suggestion}"
+                                available_slots.append((label, slot_d, slot_time, False, slot_bookings))
                             elif blocked:
-                                label += f" (Blockiert: {block_reason(slot_d)})"
+                                label += f" (Blockiert: {reason})"
                                 available_slots.append((label, slot_d, slot_time, True, None))
                             else:
-                                label += " (Frei)"
+                                label += f" (Frei){suggestion}"
                                 available_slots.append((label, slot_d, slot_time, False, None))
+
                         
                         if not available_slots:
                             st.warning("Keine Slots in dieser Woche verfügbar")
@@ -2267,6 +5440,7 @@ Details:
                     
                     # Optionen
                     notify_user = st.checkbox("User per E-Mail/SMS benachrichtigen", value=True)
+                    ignore_limits = st.checkbox("Buchungslimits ignorieren", value=False)
                     
                     # Submit
                     submit = st.form_submit_button("📝 Buchung erstellen", use_container_width=True, type="primary")
@@ -2285,7 +5459,8 @@ Details:
                                 slot_time,
                                 selected_user['email'],
                                 selected_user['name'],
-                                selected_user.get('phone', '')
+                                selected_user.get('phone', ''),
+                                enforce_limits=not ignore_limits
                             )
                             
                             if success:
@@ -2321,28 +5496,24 @@ Details:
         # --- SUB-TAB 2: UMBUCHUNG ---
         with sub_tab2:
             st.markdown("### Bestehende Buchung umbuchen")
-            st.caption("Übertragen Sie eine Buchung von einem User auf einen anderen")
+            st.caption("Übertragen Sie eine Buchung auf einen anderen User oder tauschen Sie zwei Buchungen - "
+                       "in einem Schritt, der Slot ist dabei zu keinem Zeitpunkt frei")
+            
+            modus = st.radio("Art", ["➡️ Auf anderen User übertragen", "🔁 Zwei Buchungen tauschen"],
+                             horizontal=True, label_visibility="collapsed", key="umbuchung_modus")
             
             with st.form("admin_umbuchung"):
-                # Zukünftige Buchungen laden
+                # Zukünftige Buchungen mit EINER Range-Query laden
                 today = datetime.now().date().strftime("%Y-%m-%d")
-                future_bookings = []
-                
-                try:
-                    for doc in db.collection('bookings').where('status', '==', 'confirmed').stream():
-                        b = doc.to_dict()
-                        b['id'] = doc.id
-                        if b.get('slot_date', '') >= today:
-                            future_bookings.append(b)
-                except:
-                    pass
+                future_bookings = sorted(
+                    ww_db.get_range_bookings(today, '9999-12-31'),
+                    key=lambda x: (x['slot_date'], x['slot_time'], x.get('user_name', ''))
+                )
                 
                 if not future_bookings:
                     st.info("Keine zukünftigen Buchungen vorhanden")
+                    st.form_submit_button("🔄 Umbuchung durchführen", disabled=True)
                 else:
-                    # Sortieren
-                    future_bookings.sort(key=lambda x: x['slot_date'])
-                    
                     # Buchung auswählen
                     booking_options = {
                         f"{fmt_de(b['slot_date'])} | {b['slot_time']} | {b['user_name']}": b
@@ -2358,83 +5529,83 @@ Details:
                     
                     st.info(f"**Aktuell gebucht von:** {selected_booking['user_name']} ({selected_booking['user_email']})")
                     
-                    # Neuen User auswählen
-                    all_users = ww_db.get_all_users()
-                    active_users = [u for u in all_users if u.get('active', True) and u['email'] != selected_booking['user_email']]
-                    
-                    if not active_users:
-                        st.error("Keine anderen User verfügbar!")
+                    new_user = other_booking = None
+                    if modus.startswith("➡️"):
+                        # Neuen User auswählen
+                        all_users = load_user_directory()
+                        active_users = [u for u in all_users if u.get('active', True) and u['email'] != selected_booking['user_email']]
+                        if not active_users:
+                            st.error("Keine anderen User verfügbar!")
+                        else:
+                            user_options = {f"{u['name']} ({u['email']})": u for u in active_users}
+                            new_user_str = st.selectbox(
+                                "Neuer User",
+                                options=list(user_options.keys()),
+                                help="Wählen Sie den neuen User für diese Buchung"
+                            )
+                            new_user = user_options[new_user_str]
                     else:
-                        user_options = {f"{u['name']} ({u['email']})": u for u in active_users}
-                        new_user_str = st.selectbox(
-                            "Neuer User",
-                            options=list(user_options.keys()),
-                            help="Wählen Sie den neuen User für diese Buchung"
-                        )
-                        new_user = user_options[new_user_str]
-                        
-                        # Kommentar
-                        comment = st.text_area(
-                            "Kommentar (optional)",
-                            placeholder="z.B. 'Krankheit', 'Urlaub', 'Tausch', etc.",
-                            help="Grund für die Umbuchung (wird in Benachrichtigung erwähnt)"
-                        )
-                        
-                        # Benachrichtigung
-                        notify_users = st.checkbox("Beide User benachrichtigen", value=True)
-                        
-                        # Submit
-                        submit = st.form_submit_button("🔄 Umbuchung durchführen", use_container_width=True, type="primary")
-                        
-                        if submit:
-                            # Alte Buchung löschen
-                            try:
-                                db.collection('bookings').document(selected_booking['id']).delete()
-                            except:
-                                st.error("Fehler beim Löschen der alten Buchung")
-                                st.stop()
-                            
-                            # Neue Buchung erstellen
-                            success, msg = ww_db.create_booking(
-                                selected_booking['slot_date'],
-                                selected_booking['slot_time'],
-                                new_user['email'],
-                                new_user['name'],
-                                new_user.get('phone', '')
+                        # Tauschpartner: Buchung eines anderen Users in einem anderen Slot
+                        swap_options = {
+                            label: b for label, b in booking_options.items()
+                            if b['user_email'] != selected_booking['user_email']
+                            and (b['slot_date'], b['slot_time']) != (selected_booking['slot_date'], selected_booking['slot_time'])
+                        }
+                        if not swap_options:
+                            st.error("Keine passende Buchung zum Tauschen vorhanden!")
+                        else:
+                            other_str = st.selectbox(
+                                "Tauschen mit",
+                                options=list(swap_options.keys()),
+                                help="Beide User übernehmen jeweils den Slot des anderen"
                             )
-                            
-                            if success:
-                                st.success(f"✅ Umbuchung erfolgreich! Slot wurde von {selected_booking['user_name']} auf {new_user['name']} übertragen.")
-                                
-                                # Benachrichtigungen
-                                if notify_users:
-                                    # Alter User: Stornierung
-                                    mailer.send_cancellation(
-                                        selected_booking['user_email'],
-                                        selected_booking['user_name'],
-                                        selected_booking['slot_date'],
-                                        selected_booking['slot_time']
-                                    )
-                                    
-                                    # Neuer User: Buchungsbestätigung
-                                    mailer.send_booking_confirmation(
-                                        new_user['email'],
-                                        new_user['name'],
-                                        selected_booking['slot_date'],
-                                        selected_booking['slot_time']
-                                    )
-                                    
-                                    if comment:
-                                        st.info(f"💬 Kommentar: {comment}")
-                                    
-                                    st.info("📧 Beide User wurden benachrichtigt")
-                                
-                                st.rerun()
-                            else:
-                                st.error(f"❌ Fehler bei neuer Buchung: {msg}")
+                            other_booking = swap_options[other_str]
+                    
+                    # Kommentar
+                    comment = st.text_area(
+                        "Kommentar (optional)",
+                        placeholder="z.B. 'Krankheit', 'Urlaub', 'Tausch', etc.",
+                        help="Grund für die Umbuchung (wird in Benachrichtigung erwähnt)"
+                    )
+                    
+                    # Benachrichtigung
+                    notify_users = st.checkbox("Beide User benachrichtigen", value=True)
+                    ignore_limits = st.checkbox("Buchungslimits ignorieren", value=False, key="umbuchung_ignore_limits")
+                    
+                    # Submit
+                    submit = st.form_submit_button("🔄 Umbuchung durchführen", use_container_width=True, type="primary")
+                    
+                    if submit and (new_user or other_booking):
+                        if new_user:
+                            success, msg = ww_db.reassign_booking(
+                                selected_booking['id'], new_user, st.session_state.user['email'],
+                                comment=comment, notify=notify_users, enforce_limits=not ignore_limits
+                            )
+                        else:
+                            success, msg = ww_db.swap_bookings(
+                                selected_booking['id'], other_booking['id'], st.session_state.user['email'],
+                                comment=comment, notify=notify_users, enforce_limits=not ignore_limits
+                            )
+                        
+                        if success:
+                            st.success(f"✅ Umbuchung erfolgreich! {msg}.")
+                            if notify_users:
+                                # Versand der (gemeinsamen) Outbox-Nachricht im Hintergrund
+                                schedule_outbox_dispatch()
+                                st.info("📧 Beide User werden benachrichtigt")
+                            st.rerun()
+                        else:
+                            st.error(f"❌ Umbuchung fehlgeschlagen: {msg}")
     
-    # ===== TAB 4: ARCHIVIEREN (wie gehabt) =====
+        # --- SUB-TAB 3: AUTO-DIENSTPLAN ---
+        with sub_tab3:
+            auto_dienstplan()
+    
+    # ===== TAB 4: ARCHIV =====
     with tab4:
+        archiv_browser()
+        
+        st.divider()
         st.subheader("🗑️ Alte Buchungen archivieren")
         st.info("Buchungen älter als 12 Monate werden archiviert.")
         
@@ -2442,11 +5613,36 @@ Details:
             count = ww_db.archive_old()
             if count > 0:
                 st.success(f"✅ {count} Buchungen archiviert")
+                compacted = ww_db.compact_archive()
+                st.success(f"🗜️ {compacted} Buchungen in Monats-Bundles kompaktiert")
             else:
                 st.info("Keine Buchungen zum Archivieren gefunden")
+        
+        if st.button("🗜️ Archiv kompaktieren", help="Einzeldokumente im Archiv in ein Dokument pro Monat packen"):
+            with st.spinner("Kompaktiere Archiv..."):
+                compacted = ww_db.compact_archive()
+            if compacted:
+                st.success(f"✅ {compacted} Buchungen kompaktiert")
+            else:
+                st.info("Archiv ist bereits kompaktiert")
+        
+        st.divider()
+        st.subheader("📊 Statistik-Rollups")
+        st.caption("Die Statistik wird bei jeder Buchung/Stornierung mitgezählt. Bei Abweichungen hier komplett neu berechnen.")
+        if st.button("🔄 Statistik neu aufbauen"):
+            with st.spinner("Berechne Statistik aus Buchungen und Archiv..."):
+                total = ww_db.rebuild_stats()
+            if total is None:
+                st.error("❌ Fehler beim Aufbau der Statistik")
+            else:
+                st.success(f"✅ Statistik neu aufgebaut ({total} Dienste)")
     
-    # ===== TAB 5: EINSTELLUNGEN (wie gehabt) =====
+    # ===== TAB 5: SCHICHTPLÄNE =====
     with tab5:
+        schichtplan_editor()
+    
+    # ===== TAB 6: EINSTELLUNGEN (wie gehabt) =====
+    with tab6:
         st.subheader("⚙️ Systemeinstellungen")
         
         dark = ww_db.get_setting('dark_mode', 'false') == 'true'
@@ -2455,38 +5651,96 @@ Details:
             ww_db.set_setting('dark_mode', 'true' if new_dark else 'false')
             st.success("✅ Gespeichert")
             st.rerun()
+        
+        swr = ww_db.get_setting('stats_stale_while_revalidate', 'false') == 'true'
+        new_swr = st.checkbox(
+            "Statistik: Stale-While-Revalidate",
+            value=swr,
+            help="Zeigt sofort das letzte Ergebnis und aktualisiert im Hintergrund"
+        )
+        if new_swr != swr:
+            ww_db.set_setting('stats_stale_while_revalidate', 'true' if new_swr else 'false')
+            st.success("✅ Gespeichert")
+            st.rerun()
+        
+        st.divider()
+        st.subheader("🚦 Buchungslimits pro Helfer")
+        st.caption("Gelten für eigene Buchungen, Warteliste und Auto-Dienstplan (0 = unbegrenzt). "
+                   "Admins können bei der Admin-Buchung Limits übergehen.")
+        limits = ww_db.get_booking_limits()
+        with st.form("booking_limits"):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                one_per_day = st.checkbox("Höchstens ein Dienst pro Tag", value=limits['day'] == 1)
+            with col2:
+                per_week = st.number_input("Max. Dienste pro Woche", 0, 21, limits['week'])
+            with col3:
+                per_month = st.number_input("Max. Dienste pro Monat", 0, 93, limits['month'])
+            if st.form_submit_button("💾 Limits speichern"):
+                ww_db.set_setting('booking_limits', json.dumps({
+                    'day': 1 if one_per_day else 0, 'week': int(per_week), 'month': int(per_month)
+                }))
+                st.success("✅ Gespeichert")
+                st.rerun()
+        if st.button("🔄 Limit-Zähler neu aufbauen", help="Zähler aus den aktuellen Buchungen neu berechnen (Reparatur)"):
+            with st.spinner("Berechne Zähler..."):
+                total = ww_db.rebuild_member_counters()
+            if total is None:
+                st.error("❌ Fehler beim Aufbau der Zähler")
+            else:
+                st.success(f"✅ {total} Zähler neu aufgebaut")
 
 # ===== BENUTZERVERWALTUNG (ADMIN) =====
+USER_PAGE_SIZE = 25
+
 def benutzer_page():
     st.title("👥 Benutzerverwaltung")
     
-    users = ww_db.get_all_users()
+    # Bestands-User einmalig mit Suchfeldern versehen
+    ensure_user_search_index()
     
     tab1, tab2 = st.tabs(["📋 Alle Benutzer", "➕ Neuer Benutzer"])
     
     with tab1:
-        st.markdown(f"**Gesamt:** {len(users)} Benutzer")
+        st.markdown(f"**Gesamt:** {ww_db.count_users()} Benutzer")
         
         # Filter
         col1, col2 = st.columns([3, 1])
         with col1:
-            search = st.text_input("🔍 Suche nach Name oder E-Mail", "")
+            search = st.text_input("🔍 Suche nach Name oder E-Mail", "", help="Sucht nach Wortanfängen in Name und E-Mail")
         with col2:
             role_filter = st.selectbox("Filter Rolle", ["Alle", "user", "admin"])
         
-        # Gefilterte Liste
-        filtered = users
-        if search:
-            filtered = [u for u in users if search.lower() in u.get('name', '').lower() 
-                       or search.lower() in u.get('email', '').lower()]
-        if role_filter != "Alle":
-            filtered = [u for u in filtered if u.get('role') == role_filter]
+        # Seiten-Cursor zurücksetzen, wenn sich die Suche ändert
+        search_key = (normalize_search(search), role_filter)
+        if st.session_state.get('user_search_key') != search_key:
+            st.session_state.user_search_key = search_key
+            st.session_state.user_search_cursors = [None]
+        cursors = st.session_state.user_search_cursors
+        
+        # Serverseitige Präfix-Suche, eine Seite
+        filtered, next_cursor = ww_db.search_users(
+            search,
+            role=None if role_filter == "Alle" else role_filter,
+            cursor=cursors[-1],
+            page_size=USER_PAGE_SIZE
+        )
         
-        st.markdown(f"**Angezeigt:** {len(filtered)} Benutzer")
+        col_info, col_prev, col_next = st.columns([3, 1, 1])
+        with col_info:
+            st.markdown(f"**Seite {len(cursors)}:** {len(filtered)} Benutzer angezeigt")
+        with col_prev:
+            if len(cursors) > 1 and st.button("⬅️ Zurück", key="users_prev", use_container_width=True):
+                cursors.pop()
+                st.rerun()
+        with col_next:
+            if next_cursor is not None and st.button("Weiter ➡️", key="users_next", use_container_width=True):
+                cursors.append(next_cursor)
+                st.rerun()
         st.divider()
         
         # User-Liste
-        for u in sorted(filtered, key=lambda x: x.get('name', '')):
+        for u in filtered:
             with st.container():
                 col1, col2, col3 = st.columns([3, 2, 3])
                 
@@ -2499,8 +5753,7 @@ def benutzer_page():
                 
                 with col2:
                     # Statistik
-                    bookings = ww_db.get_user_bookings(u.get('email'), future_only=False)
-                    st.metric("Buchungen", len(bookings))
+                    st.metric("Buchungen", ww_db.count_user_bookings(u.get('email')))
                 
                 with col3:
                     # Action Buttons - NEU: 4 Buttons inkl. Edit und PW-Reset
@@ -2642,6 +5895,641 @@ def benutzer_page():
                     else:
                         st.error(f"❌ {msg}")
 
+# ===== STREAMING-EXPORT (NDJSON) =====
+EXPORT_PAGE_SIZE = 500
+EXPORT_SPOOL_MAX_MEMORY = 5 * 1024 * 1024  # Ab 5 MB wird auf die Platte ausgelagert
+
+def json_default(value):
+    """Firestore-Timestamps & Co. für JSON serialisieren"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+def iter_query_pages(query, page_size=EXPORT_PAGE_SIZE, order_by=None):
+    """Dokumente seitenweise per Cursor lesen - nie mehr als eine Seite im Speicher"""
+    query = query.order_by(order_by or firestore.FieldPath.document_id())
+    cursor = None
+    while True:
+        q = query.limit(page_size)
+        if cursor is not None:
+            q = q.start_after(cursor)
+        docs = list(q.stream())
+        if not docs:
+            break
+        yield docs
+        if len(docs) < page_size:
+            break
+        cursor = docs[-1]
+
+def iter_ndjson(query, drop_fields=(), counter=None, order_by=None):
+    """NDJSON-Chunks (bytes), ein Chunk pro Seite; counter['docs'] zählt mit, counter['max_updated_at'] merkt sich das neueste updated_at"""
+    for docs in iter_query_pages(query, order_by=order_by):
+        lines = []
+        for doc in docs:
+            data = doc.to_dict()
+            updated = data.get('updated_at')
+            if counter is not None and isinstance(updated, datetime) and (
+                    counter.get('max_updated_at') is None or updated > counter['max_updated_at']):
+                counter['max_updated_at'] = updated
+            for field in drop_fields:
+                data.pop(field, None)
+            data['id'] = doc.id
+            lines.append(json.dumps(data, default=json_default, ensure_ascii=False))
+        if counter is not None:
+            counter['docs'] = counter.get('docs', 0) + len(docs)
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+def iter_records_ndjson(records, counter=None, chunk_size=EXPORT_PAGE_SIZE):
+    """Bereits geladene Datensätze (z.B. aus Archiv-Bundles) als NDJSON-Chunks"""
+    for i in range(0, len(records), chunk_size):
+        chunk = records[i:i + chunk_size]
+        if counter is not None:
+            counter['docs'] = counter.get('docs', 0) + len(chunk)
+        yield ('\n'.join(json.dumps(r, default=json_default, ensure_ascii=False) for r in chunk) + '\n').encode('utf-8')
+
+def spool_ndjson(query, drop_fields=(), order_by=None, extra_records=()):
+    """
+    Export in eine SpooledTemporaryFile streamen (konstanter Speicher)
+    order_by: bei Bereichsfiltern das gefilterte Feld (Firestore-Vorgabe)
+    extra_records: zusätzliche Datensätze, die nach der Query angehängt werden
+    Returns: (datei, anzahl_dokumente, bytes)
+    """
+    counter = {}
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_MEMORY, mode='w+b')
+    for chunk in itertools.chain(iter_ndjson(query, drop_fields, counter, order_by),
+                                 iter_records_ndjson(list(extra_records), counter)):
+        spool.write(chunk)
+    size = spool.tell()
+    spool.seek(0)
+    return spool, counter.get('docs', 0), size
+
+# ===== EXCEL-DIENSTPLAN (OPENPYXL WRITE-ONLY) =====
+def iter_roster_bookings(start, end):
+    """Bestätigte Buchungen aus 'bookings', 'archive' und Bundles im Zeitraum, nach Datum sortiert gestreamt"""
+    def _iter(collection):
+        q = db.collection(collection)\
+            .where('status', '==', 'confirmed')\
+            .where('slot_date', '>=', start.strftime("%Y-%m-%d"))\
+            .where('slot_date', '<=', end.strftime("%Y-%m-%d"))
+        for docs in iter_query_pages(q, order_by='slot_date'):
+            for doc in docs:
+                yield doc.to_dict()
+    bundled = (b for b in ww_db.get_archive_bundles(start, end) if b['status'] == 'confirmed')
+    return heapq.merge(_iter('bookings'), _iter('archive'), bundled, key=lambda b: b.get('slot_date', ''))
+
+def write_roster_xlsx(bookings, start, end, out):
+    """
+    Dienstplan als .xlsx im Write-Only-Modus (konstanter Speicher):
+    - ein Blatt pro Monat: Zeilen = Tage mit Slots, Spalten = Slot-Definitionen im Zeitraum
+    - Blatt 'Helfer': Anzahl Dienste pro Helfer
+    bookings: nach slot_date sortiertes Iterable; es wird immer nur ein Monat gepuffert
+    Returns: Anzahl verarbeiteter Buchungen
+    """
+    wb = Workbook(write_only=True)
+    bold = Font(bold=True)
+    header_fill = PatternFill('solid', fgColor='E3F2FD')
+    
+    def header_row(ws, labels):
+        row = []
+        for label in labels:
+            cell = WriteOnlyCell(ws, value=label)
+            cell.font = bold
+            cell.fill = header_fill
+            row.append(cell)
+        return row
+    
+    summary_ws = wb.create_sheet("Helfer")
+    summary_ws.column_dimensions['A'].width = 28
+    summary_ws.column_dimensions['B'].width = 32
+    helpers = {}
+    
+    start_str = start.strftime("%Y-%m-%d")
+    columns = slot_columns(start, end)
+    slot_labels = [f"{sc['day_name']} {sc['start']}-{sc['end']}" for _, sc in columns]
+    slot_column = {key: i for i, (key, _) in enumerate(columns)}
+    # Slot-Termine des ganzen Zeitraums vorab: {slot_date: [(slot_key, config, blocked, reason), ...]}
+    cal = slot_calendar(start, end)
+    slots_by_day = {}
+    for (slot_config, sd, blocked, reason), key in zip(slot_rows(cal), cal['slot_key']):
+        slots_by_day.setdefault(sd, []).append((key, slot_config, blocked, reason))
+    bookings = iter(bookings)
+    pending = next(bookings, None)
+    count = 0
+    
+    month = date(start.year, start.month, 1)
+    while month <= end:
+        month_end = month.replace(day=cal_module.monthrange(month.year, month.month)[1])
+        month_end_str = month_end.strftime("%Y-%m-%d")
+        
+        # Buchungen dieses Monats puffern
+        by_slot = {}
+        while pending is not None and pending.get('slot_date', '') <= month_end_str:
+            if pending.get('slot_date', '') >= start_str:
+                key = (pending['slot_date'], pending.get('slot_time', '')[:5])
+                by_slot.setdefault(key, []).append(pending.get('user_name', 'N/A'))
+                h = helpers.setdefault(pending.get('user_email', ''), [pending.get('user_name', 'N/A'), 0, pending['slot_date'], ''])
+                h[1] += 1
+                h[3] = pending['slot_date']
+                count += 1
+            pending = next(bookings, None)
+        
+        ws = wb.create_sheet(f"{MONATSNAMEN[month.month - 1]} {month.year}")
+        ws.column_dimensions['A'].width = 12
+        ws.column_dimensions['B'].width = 12
+        for i in range(len(columns)):
+            ws.column_dimensions[get_column_letter(3 + i)].width = 26
+        ws.append(header_row(ws, ['Datum', 'Wochentag'] + slot_labels))
+        
+        d = max(month, start)
+        while d <= min(month_end, end):
+            sd = d.strftime("%Y-%m-%d")
+            day_slots = slots_by_day.get(sd)
+            if day_slots:
+                cells = [''] * len(columns)
+                for key, sc, blocked, reason in day_slots:
+                    names = by_slot.get((sd, sc['start']))
+                    if names:
+                        cells[slot_column[key]] = ', '.join(names)
+                    elif blocked:
+                        cells[slot_column[key]] = f"🚫 {reason}"
+                    else:
+                        cells[slot_column[key]] = 'frei'
+                ws.append([fmt_de(d), WOCHENTAGE_KURZ[d.weekday()]] + cells)
+            d += timedelta(days=1)
+        
+        month = month_end + timedelta(days=1)
+    
+    summary_ws.append(header_row(summary_ws, ['Name', 'E-Mail', 'Dienste', 'Erster Dienst', 'Letzter Dienst']))
+    for email_addr, (name, n, first, last) in sorted(helpers.items(), key=lambda x: x[1][1], reverse=True):
+        summary_ws.append([name, email_addr, n, fmt_de(first), fmt_de(last)])
+    
+    wb.save(out)
+    return count
+
+def benchmark_roster_xlsx(n_bookings=10000, years=5):
+    """Excel-Export mit synthetischen Buchungen über mehrere Jahre messen - Returns: (sekunden, bytes)"""
+    start = date(2020, 1, 1)
+    end = date(2020 + years - 1, 12, 31)
+    cal = slot_calendar(start, end)
+    occurrences = list(zip(cal['slot_date'], cal['slot_time']))
+    
+    def _synthetic():
+        # Gleichmäßig verteilt und nach Datum sortiert
+        for i in range(n_bookings):
+            sd, slot_time = occurrences[i * len(occurrences) // n_bookings]
+            yield {'slot_date': sd, 'slot_time': slot_time,
+                   'user_email': f"helfer{i % 300}@example.org", 'user_name': f"Helfer {i % 300}"}
+    
+    t0 = time.perf_counter()
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_MEMORY, mode='w+b') as out:
+        write_roster_xlsx(_synthetic(), start, end, out)
+        size = out.tell()
+    return time.perf_counter() - t0, size
+
+# ===== BACKUP (VOLL / DELTA) =====
+BACKUP_COLLECTIONS = ['bookings', 'archive', 'archive_bundles', 'users', 'deletions']
+BACKUP_DROP_FIELDS = {'users': ('password_hash',)}
+BACKUP_FULL_INTERVAL_DAYS = 7
+BACKUP_WATERMARK_OVERLAP = timedelta(minutes=5)  # Server-Zeitstempel können verspätet sichtbar werden
+
+def backup_plan(mode='auto'):
+    """
+    Voll- oder Delta-Backup bestimmen: wöchentlich voll, dazwischen nur Änderungen seit dem Watermark
+    Das Delta überlappt um BACKUP_WATERMARK_OVERLAP - doppelt exportierte Dokumente sind beim Upsert harmlos
+    Returns: (mode, since) - since ist None bei Vollbackup
+    """
+    watermark = ww_db.get_setting('backup_watermark', '')
+    last_full = ww_db.get_setting('backup_last_full', '')
+    if mode == 'auto':
+        full_due = not last_full or (
+            datetime.now(TZ) - datetime.fromisoformat(last_full)
+        ).days >= BACKUP_FULL_INTERVAL_DAYS
+        mode = 'full' if full_due else 'delta'
+    if mode == 'delta' and not watermark:
+        # Ohne Watermark gibt es keine Basis für ein Delta
+        mode = 'full'
+    return mode, (datetime.fromisoformat(watermark) - BACKUP_WATERMARK_OVERLAP if mode == 'delta' else None)
+
+def write_backup_zip(out, mode, since, compresslevel=6):
+    """
+    Collections als NDJSON-Einträge in ein ZIP streamen
+    Delta: nur Dokumente mit updated_at > since (inkl. Tombstones aus 'deletions')
+    Returns: Manifest (Modus, Zeitraum, Watermark, Anzahl Dokumente pro Collection)
+    """
+    until = datetime.now(TZ)
+    counts, watermark = {}, None
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zf:
+        for collection in BACKUP_COLLECTIONS:
+            query, order_by = db.collection(collection), None
+            if since is not None:
+                query, order_by = query.where('updated_at', '>', since), 'updated_at'
+            elif collection == 'deletions':
+                continue
+            counter = {}
+            with zf.open(f"{collection}.ndjson", 'w') as entry:
+                for chunk in iter_ndjson(query, BACKUP_DROP_FIELDS.get(collection, ()), counter, order_by):
+                    entry.write(chunk)
+            counts[collection] = counter.get('docs', 0)
+            # Watermark = größtes tatsächlich exportiertes updated_at (Server-Zeit, nicht die App-Uhr)
+            if counter.get('max_updated_at') and (watermark is None or counter['max_updated_at'] > watermark):
+                watermark = counter['max_updated_at']
+        
+        manifest = {
+            'mode': mode,
+            'since': since.isoformat() if since else None,
+            'until': until.isoformat(),
+            'watermark': watermark.isoformat() if watermark else None,
+            'base_full': ww_db.get_setting('backup_last_full', '') if mode == 'delta' else until.isoformat(),
+            'counts': counts,
+        }
+        zf.writestr('manifest.json', json.dumps(manifest, indent=2))
+    return manifest
+
+def commit_backup(manifest):
+    """Watermark erst nach erfolgreichem Versand fortschreiben (leeres Delta -> bisheriger Watermark bleibt)"""
+    if manifest['watermark']:
+        ww_db.set_setting('backup_watermark', manifest['watermark'])
+    if manifest['mode'] == 'full':
+        ww_db.set_setting('backup_last_full', manifest['until'])
+
+# ===== BACKUP-JOB (APSCHEDULER) =====
+BACKUP_DEFAULT_HOUR = 2
+BACKUP_DEFAULT_RETENTION = 14
+BACKUP_DEFAULT_COMPRESSION = 6
+_backup_lock = threading.Lock()
+
+def backup_dir():
+    path = st.secrets.get("BACKUP_DIR", "backups") if hasattr(st, 'secrets') else "backups"
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def apply_backup_retention(path, keep):
+    """Nur die neuesten `keep` Backup-Dateien behalten"""
+    files = sorted(f for f in os.listdir(path) if f.startswith('backup_') and f.endswith('.zip'))
+    removed = 0
+    for name in files[:-keep] if keep > 0 else []:
+        os.remove(os.path.join(path, name))
+        removed += 1
+    return removed
+
+def run_backup(mode='auto'):
+    """
+    Backup außerhalb des Request-Pfads: ZIP in SpooledTemporaryFile (RAM bis 5 MB, dann Platte),
+    Ablage im Backup-Verzeichnis mit Aufbewahrungsregel, optional E-Mail an den Admin.
+    Ergebnis (Dauer, Bytes, Dokumente) landet in settings/backup_last_report.
+    """
+    if not _backup_lock.acquire(blocking=False):
+        print("⚠️ Backup läuft bereits - übersprungen")
+        return None
+    t0 = time.perf_counter()
+    report = {'started': datetime.now(TZ).isoformat(), 'status': 'error'}
+    try:
+        mode, since = backup_plan(mode)
+        level = int(ww_db.get_setting('backup_compression_level', BACKUP_DEFAULT_COMPRESSION) or BACKUP_DEFAULT_COMPRESSION)
+        keep = int(ww_db.get_setting('backup_retention', BACKUP_DEFAULT_RETENTION) or BACKUP_DEFAULT_RETENTION)
+        filename = f"backup_{datetime.now(TZ).strftime('%Y%m%d_%H%M%S')}_{mode}.zip"
+        
+        with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_MEMORY, mode='w+b') as spool:
+            manifest = write_backup_zip(spool, mode, since, compresslevel=level)
+            size = spool.tell()
+            
+            # Ablage auf Platte (blockweise kopieren)
+            path = backup_dir()
+            spool.seek(0)
+            with open(os.path.join(path, filename), 'wb') as f:
+                while True:
+                    chunk = spool.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            removed = apply_backup_retention(path, keep)
+            
+            mail_status = 'nicht konfiguriert'
+            if mailer.admin_receiver:
+                spool.seek(0)
+                counts = manifest['counts']
+                success, msg = mailer.send(
+                    mailer.admin_receiver,
+                    f"Dienstplan {'Vollbackup' if mode == 'full' else 'Delta-Backup'} - {datetime.now(TZ).strftime('%d.%m.%Y')}",
+                    f"Automatisches Backup ({mode})\n\n" + "\n".join(f"{k}: {v}" for k, v in counts.items()),
+                    attachments=[(filename, spool.read())]
+                )
+                mail_status = 'gesendet' if success else msg
+        
+        commit_backup(manifest)
+        report.update({
+            'status': 'ok',
+            'mode': mode,
+            'file': filename,
+            'bytes': size,
+            'documents': sum(manifest['counts'].values()),
+            'counts': manifest['counts'],
+            'compression_level': level,
+            'removed_old': removed,
+            'mail': mail_status,
+        })
+        print(f"✅ Backup ({mode}): {report['documents']} Dokumente, {size} Bytes")
+    except Exception as e:
+        report['error'] = str(e)
+        print(f"❌ Backup Fehler: {e}")
+    finally:
+        report['duration_s'] = round(time.perf_counter() - t0, 2)
+        ww_db.set_setting('backup_last_report', json.dumps(report))
+        _backup_lock.release()
+    return report
+
+@st.cache_resource
+def get_scheduler():
+    """Prozessweiter BackgroundScheduler mit täglichem Backup-Job und Wartelisten-Sweep"""
+    scheduler = BackgroundScheduler(timezone=TZ)
+    enabled = True
+    hour = BACKUP_DEFAULT_HOUR
+    if hasattr(st, 'secrets'):
+        enabled = str(st.secrets.get("ENABLE_AUTO_BACKUP", "true")).lower() == "true"
+        hour = int(st.secrets.get("BACKUP_HOUR", BACKUP_DEFAULT_HOUR))
+    if enabled:
+        scheduler.add_job(run_backup, CronTrigger(hour=hour, minute=30, timezone=TZ),
+                          id='backup', replace_existing=True, max_instances=1, coalesce=True)
+    scheduler.add_job(sweep_waitlists, 'interval', minutes=WAITLIST_SWEEP_MINUTES,
+                      id='waitlist_sweep', replace_existing=True, max_instances=1, coalesce=True)
+    scheduler.start()
+    print(f"✅ Scheduler gestartet (Backup {'täglich ' + str(hour) + ':30' if enabled else 'deaktiviert'})")
+    return scheduler
+
+def last_backup_report():
+    try:
+        return json.loads(ww_db.get_setting('backup_last_report', '') or 'null')
+    except ValueError:
+        return None
+
+# ===== WARTELISTE & OUTBOX (HINTERGRUND) =====
+WAITLIST_SWEEP_MINUTES = 5
+OUTBOX_CLAIM_MINUTES = 10  # Danach gilt ein 'sending'-Eintrag als liegengeblieben
+
+def deliver_outbox(item, send):
+    """
+    Empfänger eines Outbox-Eintrags einzeln zustellen: bereits zugestellte (delivered) werden
+    übersprungen, jeder Erfolg sofort vermerkt - ein erneuter Versuch erzeugt keine Duplikate
+    send: Callback(recipient) -> bool
+    """
+    delivered = set(item.get('delivered', []))
+    recipients = item.get('recipients', [])
+    for r in recipients:
+        if r['email'] in delivered:
+            continue
+        if send(r):
+            ww_db.mark_outbox_delivered(item['id'], r['email'])
+            delivered.add(r['email'])
+    done = sum(1 for r in recipients if r['email'] in delivered)
+    return done == len(recipients), f"{done}/{len(recipients)} E-Mails"
+
+def notify_waitlist_promoted(item):
+    """Outbox-Handler: nachgerückte Helfer per E-Mail (und SMS, falls gewünscht) informieren"""
+    def send(r):
+        success = mailer.send_waitlist_promotion(r['email'], r.get('name', ''), item['slot_date'], item['slot_time'])[0]
+        if success and r.get('sms') and r.get('phone'):
+            sms_client.send_booking_confirmation(r['phone'], r.get('name', ''), item['slot_date'], item['slot_time'])
+        return success
+    return deliver_outbox(item, send)
+
+def notify_rebooking(item):
+    """Outbox-Handler: alle von einer Umbuchung/einem Tausch betroffenen User informieren"""
+    def shift(s):
+        return (s['slot_date'], s['slot_time']) if s else None
+    return deliver_outbox(item, lambda r: mailer.send_rebooking(
+        r['email'], r.get('name', ''), shift(r.get('old')), shift(r.get('new')), item.get('comment', ''))[0])
+
+OUTBOX_HANDLERS = {
+    'waitlist_promoted': notify_waitlist_promoted,
+    'rebooking': notify_rebooking,
+}
+
+def dispatch_outbox(limit=50):
+    """Vorgemerkte Benachrichtigungen versenden (läuft im Scheduler, nie im Request-Pfad)"""
+    sent = 0
+    for pending in ww_db.get_outbox_pending(limit):
+        # Nur versenden, was dieser Lauf transaktional übernommen hat
+        item = ww_db.claim_outbox(pending['id'], OUTBOX_CLAIM_MINUTES)
+        if item is None:
+            continue
+        handler = OUTBOX_HANDLERS.get(item.get('type'))
+        if handler is None:
+            ww_db.mark_outbox(item['id'], False, f"Unbekannter Typ: {item.get('type')}", max_attempts=1)
+            continue
+        try:
+            success, msg = handler(item)
+        except Exception as e:
+            success, msg = False, str(e)
+        ww_db.mark_outbox(item['id'], success, msg)
+        sent += success
+    return sent
+
+def schedule_outbox_dispatch():
+    """Outbox-Versand als einmaligen Scheduler-Job anstoßen - der Request wartet nicht auf SMTP"""
+    try:
+        get_scheduler().add_job(dispatch_outbox, id='outbox_dispatch', replace_existing=True)
+    except Exception as e:
+        # Eintrag bleibt 'pending' - der Sweep-Job versendet ihn
+        print(f"❌ schedule_outbox_dispatch Fehler: {e}")
+
+def process_waitlist(slot_date, slot_time):
+    """Job: freie Plätze an Wartende vergeben, danach Benachrichtigungen versenden"""
+    if ww_db.promote_waitlist(slot_date, slot_time):
+        dispatch_outbox()
+
+def schedule_waitlist_promotion(slot_date, slot_time):
+    """Nachrücken als einmaligen Scheduler-Job anstoßen - kehrt sofort zurück"""
+    try:
+        get_scheduler().add_job(process_waitlist, args=(slot_date, slot_time),
+                                id=f"waitlist_{slot_date}_{slot_time[:5]}", replace_existing=True)
+    except Exception as e:
+        # Slot bleibt als promote_pending markiert - der Sweep-Job holt es nach
+        print(f"❌ schedule_waitlist_promotion Fehler: {e}")
+
+def sweep_waitlists():
+    """Periodisch: liegengebliebene Nachrück-Vorgänge und Outbox-Einträge abarbeiten"""
+    for slot_date, slot_time in ww_db.get_pending_promotions():
+        ww_db.promote_waitlist(slot_date, slot_time)
+    dispatch_outbox()
+
+# ===== WIEDERHERSTELLUNG / IMPORT =====
+RESTORE_COLLECTIONS = ['bookings', 'archive', 'archive_bundles', 'users', 'deletions']
+RESTORE_BATCH_SIZE = 400
+RESTORE_MAX_PARALLEL = 4
+RESTORE_TIMESTAMP_FIELDS = ('created_at', 'updated_at', 'cancelled_at', 'deleted_at', 'password_reset_at')
+
+def iter_backup_records(fileobj, filename, ndjson_collection=None):
+    """
+    Datensätze aus Backup-ZIP (collection.ndjson-Einträge) oder einzelner NDJSON-Datei streamen
+    Yields: (collection, record, zeilennummer) - nicht lesbare Zeilen als {'_parse_error': ...},
+    damit validate_backup_record sie mit Zeilennummer meldet statt den Import abzubrechen
+    """
+    def _parse(line):
+        try:
+            return json.loads(line)
+        except ValueError as e:
+            return {'_parse_error': f"ungültiges JSON ({e})"}
+    
+    if filename.endswith('.zip'):
+        with zipfile.ZipFile(fileobj) as zf:
+            names = set(zf.namelist())
+            for collection in RESTORE_COLLECTIONS:
+                if f"{collection}.ndjson" not in names:
+                    continue
+                with zf.open(f"{collection}.ndjson") as raw:
+                    for line_no, line in enumerate(raw, 1):
+                        if line.strip():
+                            yield collection, _parse(line), line_no
+    else:
+        # Byte-Zeilen direkt lesen (json.loads dekodiert UTF-8) - kein TextIOWrapper, der beim
+        # Aufräumen die hochgeladene Datei schließt und den zweiten Durchlauf (Schreiben) verhindert
+        for line_no, line in enumerate(fileobj, 1):
+            if line.strip():
+                yield ndjson_collection, _parse(line), line_no
+
+def backup_manifest(fileobj, filename):
+    """Manifest eines Backup-ZIPs lesen (None bei NDJSON oder altem Format)"""
+    if not filename.endswith('.zip'):
+        return None
+    with zipfile.ZipFile(fileobj) as zf:
+        if 'manifest.json' not in zf.namelist():
+            return None
+        return json.loads(zf.read('manifest.json'))
+
+def validate_backup_record(collection, record):
+    """Prüft einen Datensatz - Returns: Fehlertext oder None"""
+    if not isinstance(record, dict):
+        return "kein JSON-Objekt"
+    if '_parse_error' in record:
+        return record['_parse_error']
+    if not record.get('id') and collection != 'deletions':
+        return "keine ID"
+    if collection in ('bookings', 'archive'):
+        if not re.match(r'^\d{4}-\d{2}-\d{2}$', str(record.get('slot_date', ''))):
+            return f"ungültiges slot_date: {record.get('slot_date')}"
+        if not record.get('slot_time') or not record.get('user_email'):
+            return "slot_time oder user_email fehlt"
+        if record.get('status') not in ('confirmed', 'cancelled'):
+            return f"unbekannter Status: {record.get('status')}"
+    elif collection == 'archive_bundles':
+        if not re.match(r'^\d{4}-\d{2}$', str(record.get('month', ''))):
+            return f"ungültiger Bundle-Monat: {record.get('month')}"
+        # created/cancelled fehlen in älteren Bundles
+        if len({len(record.get(f, [])) for f in ('ids', 'day', 'slot', 'member', 'status', 'created', 'cancelled')
+                if f in record or f not in ('created', 'cancelled')}) != 1:
+            return "Bundle-Arrays unterschiedlich lang"
+    elif collection == 'users':
+        if not record.get('email') or not record.get('name'):
+            return "email oder name fehlt"
+    elif collection == 'deletions':
+        if record.get('collection') not in RESTORE_COLLECTIONS or not record.get('doc_id'):
+            return "ungültiger Tombstone"
+    return None
+
+def decode_backup_record(record):
+    """ISO-Zeitstempel wieder in datetime umwandeln, ID abtrennen"""
+    data = dict(record)
+    doc_id = data.pop('id', None)
+    for field in RESTORE_TIMESTAMP_FIELDS:
+        if isinstance(data.get(field), str):
+            try:
+                data[field] = datetime.fromisoformat(data[field])
+            except ValueError:
+                pass
+    return doc_id, data
+
+def restore_records(records, preserve_ids=True, dry_run=False, progress=None):
+    """
+    Datensätze per Batch-Writes upserten (max. RESTORE_MAX_PARALLEL Commits gleichzeitig)
+    records: Iterable von (collection, record, zeilennummer)
+    progress: optionaler Callback(verarbeitet, counts)
+    Returns: (counts pro Collection, Fehlerliste, wiederhergestellte User ohne Passwort)
+    """
+    counts, errors = Counter(), []
+    user_refs = []
+    processed = 0
+    executor = None if dry_run else ThreadPoolExecutor(max_workers=RESTORE_MAX_PARALLEL)
+    pending = set()
+    deletions_started = False
+    batch, ops = (None, 0) if dry_run else (db.batch(), 0)
+    
+    def _submit(batch):
+        # Begrenzte Parallelität: warten, bis ein Commit-Slot frei ist
+        while len(pending) >= RESTORE_MAX_PARALLEL:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                pending.discard(f)
+                f.result()
+        pending.add(executor.submit(batch.commit))
+    
+    try:
+        for collection, record, line_no in records:
+            processed += 1
+            error = validate_backup_record(collection, record)
+            if error:
+                errors.append(f"{collection} Zeile {line_no}: {error}")
+                continue
+            counts[collection] += 1
+            if progress and processed % 200 == 0:
+                progress(processed, counts)
+            if dry_run:
+                continue
+            
+            if collection == 'deletions' and not deletions_started:
+                # Tombstones erst nach allen Upserts anwenden (sonst überholt ein Delete ein paralleles Set)
+                deletions_started = True
+                if ops:
+                    _submit(batch)
+                    batch, ops = db.batch(), 0
+                for f in pending:
+                    f.result()
+                pending.clear()
+            
+            if collection == 'deletions':
+                # Tombstone nachspielen
+                batch.delete(db.collection(record['collection']).document(record['doc_id']))
+            else:
+                doc_id, data = decode_backup_record(record)
+                ref = db.collection(collection).document(doc_id if preserve_ids else None)
+                # merge=True: vorhandene Felder (z.B. password_hash) bleiben erhalten
+                batch.set(ref, data, merge=True)
+                if collection == 'users':
+                    user_refs.append(ref)
+            ops += 1
+            if ops >= RESTORE_BATCH_SIZE:
+                _submit(batch)
+                batch, ops = db.batch(), 0
+        
+        if not dry_run:
+            if ops:
+                _submit(batch)
+            for f in pending:
+                f.result()
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
+    
+    if progress:
+        progress(processed, counts)
+    if not dry_run and counts:
+        # Abgeleitete Daten neu aufbauen
+        if counts['bookings'] or counts['archive'] or counts['archive_bundles'] or counts['deletions']:
+            ww_db.rebuild_stats()
+            ww_db.rebuild_member_counters()
+            # Belegung neu zählen - Wartelisten bleiben erhalten
+            ww_db.rebuild_slot_occupancy(datetime.now().strftime("%Y-%m-%d"))
+        if counts['users'] or counts['deletions']:
+            load_user_directory.clear()
+    
+    # Backups enthalten kein password_hash - neu angelegte User können sich erst nach einem Reset anmelden
+    no_password = []
+    for i in range(0, len(user_refs), RESTORE_BATCH_SIZE):
+        for snap in db.get_all(user_refs[i:i + RESTORE_BATCH_SIZE]):
+            data = snap.to_dict() or {}
+            if snap.exists and not data.get('password_hash'):
+                no_password.append(f"{data.get('name', '')} ({data.get('email', '')})")
+    return counts, errors, no_password
+
 # ===== EXPORT (ADMIN) =====
 def export_page():
     st.title("💾 Export & Backup")
@@ -2651,40 +6539,32 @@ def export_page():
     with col1:
         st.subheader("📥 Daten exportieren")
         
-        if st.button("📄 Buchungen exportieren (JSON)", use_container_width=True):
+        if st.button("📄 Buchungen exportieren (NDJSON)", use_container_width=True):
             try:
-                bookings = []
-                for doc in db.collection('bookings').stream():
-                    b = doc.to_dict()
-                    b['id'] = doc.id
-                    # Firestore Timestamps zu Strings
-                    for key in b:
-                        if hasattr(b[key], 'strftime'):
-                            b[key] = b[key].strftime('%Y-%m-%d %H:%M:%S')
-                    bookings.append(b)
-                
-                json_str = json.dumps(bookings, indent=2, ensure_ascii=False)
-                st.download_button(
-                    "⬇️ Download Buchungen",
-                    json_str,
-                    file_name=f"buchungen_{datetime.now().strftime('%Y%m%d')}.json",
-                    mime="application/json"
-                )
+                spool, count, size = spool_ndjson(db.collection('bookings'))
+                with spool:
+                    st.caption(f"{count} Buchungen | {size / 1024:.0f} KB")
+                    st.download_button(
+                        "⬇️ Download Buchungen",
+                        spool.read(),
+                        file_name=f"buchungen_{datetime.now().strftime('%Y%m%d')}.ndjson",
+                        mime="application/x-ndjson"
+                    )
             except Exception as e:
                 st.error(f"Fehler: {e}")
         
-        if st.button("📄 Benutzer exportieren (JSON)", use_container_width=True):
+        if st.button("📄 Benutzer exportieren (NDJSON)", use_container_width=True):
             try:
-                users = ww_db.get_all_users()
                 # Passwörter entfernen
-                users_export = [{k: v for k, v in u.items() if k != 'password_hash'} for u in users]
-                json_str = json.dumps(users_export, indent=2, ensure_ascii=False)
-                st.download_button(
-                    "⬇️ Download Benutzer",
-                    json_str,
-                    file_name=f"benutzer_{datetime.now().strftime('%Y%m%d')}.json",
-                    mime="application/json"
-                )
+                spool, count, size = spool_ndjson(db.collection('users'), drop_fields=('password_hash',))
+                with spool:
+                    st.caption(f"{count} Benutzer | {size / 1024:.0f} KB")
+                    st.download_button(
+                        "⬇️ Download Benutzer",
+                        spool.read(),
+                        file_name=f"benutzer_{datetime.now().strftime('%Y%m%d')}.ndjson",
+                        mime="application/x-ndjson"
+                    )
             except Exception as e:
                 st.error(f"Fehler: {e}")
         
@@ -2708,59 +6588,154 @@ def export_page():
             except Exception as e:
                 st.error(f"Fehler: {e}")
     
-    with col2:
-        st.subheader("📧 E-Mail Backup")
-        
-        if st.button("📧 Backup per E-Mail senden", use_container_width=True):
-            if mailer.admin_receiver:
+        st.divider()
+        st.markdown("**📗 Dienstplan als Excel**")
+        season_start, season_end = season_bounds()
+        xlsx_range = st.date_input(
+            "Zeitraum", value=(season_start, season_end), format="DD.MM.YYYY", key="xlsx_range"
+        )
+        if st.button("📗 Dienstplan exportieren (Excel)", use_container_width=True):
+            if not isinstance(xlsx_range, (tuple, list)) or len(xlsx_range) != 2:
+                st.warning("Bitte Start- und Enddatum wählen")
+            else:
                 try:
-                    # Lade Daten
-                    bookings = []
-                    for doc in db.collection('bookings').stream():
-                        b = doc.to_dict()
-                        for key in b:
-                            if hasattr(b[key], 'strftime'):
-                                b[key] = b[key].strftime('%Y-%m-%d %H:%M:%S')
-                        bookings.append(b)
-                    
-                    users = ww_db.get_all_users()
-                    users_export = [{k: v for k, v in u.items() if k != 'password_hash'} for u in users]
-                    
-                    # ZIP erstellen
-                    zip_buffer = io.BytesIO()
-                    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-                        zf.writestr('buchungen.json', json.dumps(bookings, indent=2, ensure_ascii=False))
-                        zf.writestr('benutzer.json', json.dumps(users_export, indent=2, ensure_ascii=False))
-                    
-                    zip_buffer.seek(0)
-                    
-                    # E-Mail senden
-                    subject = f"Dienstplan Backup - {datetime.now().strftime('%d.%m.%Y')}"
-                    body = f"""
-                    <html><body>
-                    <h2 style="color:{COLORS['rot']};">🌊 Automatisches Backup</h2>
-                    <p><strong>Datum:</strong> {datetime.now().strftime('%d.%m.%Y %H:%M')}</p>
-                    <p><strong>Buchungen:</strong> {len(bookings)}</p>
-                    <p><strong>Benutzer:</strong> {len(users)}</p>
-                    </body></html>
-                    """
-                    
-                    success, msg = mailer.send(
-                        mailer.admin_receiver,
-                        subject,
-                        body,
-                        attachments=[(f"backup_{datetime.now().strftime('%Y%m%d')}.zip", zip_buffer.getvalue())]
+                    with st.spinner("Erstelle Excel-Datei..."):
+                        t0 = time.perf_counter()
+                        with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_MEMORY, mode='w+b') as out:
+                            count = write_roster_xlsx(iter_roster_bookings(*xlsx_range), xlsx_range[0], xlsx_range[1], out)
+                            out.seek(0)
+                            xlsx_bytes = out.read()
+                    st.caption(f"{count} Buchungen | {len(xlsx_bytes) / 1024:.0f} KB | {time.perf_counter() - t0:.1f} s")
+                    st.download_button(
+                        "⬇️ Download Excel",
+                        xlsx_bytes,
+                        file_name=f"dienstplan_{xlsx_range[0].strftime('%Y%m%d')}_{xlsx_range[1].strftime('%Y%m%d')}.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                     )
-                    
-                    if success:
-                        st.success(msg)
-                    else:
-                        st.error(msg)
-                
                 except Exception as e:
                     st.error(f"Fehler: {e}")
+    
+    with col2:
+        st.subheader("💾 Backup")
+        
+        backup_modes = {
+            "🔁 Automatisch (wöchentlich voll, sonst Delta)": 'auto',
+            "📦 Vollbackup": 'full',
+            "➕ Nur Änderungen (Delta)": 'delta',
+        }
+        backup_mode_label = st.radio("Backup-Art", list(backup_modes.keys()))
+        watermark = ww_db.get_setting('backup_watermark', '')
+        if watermark:
+            st.caption(f"Letztes Backup bis: {datetime.fromisoformat(watermark).astimezone(TZ).strftime('%d.%m.%Y %H:%M')}")
+        
+        if st.button("💾 Backup jetzt starten (Hintergrund)", use_container_width=True):
+            get_scheduler().add_job(run_backup, args=[backup_modes[backup_mode_label]], id='backup_manual',
+                                    replace_existing=True, max_instances=1)
+            st.success("✅ Backup gestartet - Ergebnis erscheint unten nach Abschluss")
+        
+        with st.expander("⚙️ Backup-Einstellungen"):
+            with st.form("backup_settings"):
+                level = st.slider("Kompressionsstufe", 0, 9,
+                                  int(ww_db.get_setting('backup_compression_level', BACKUP_DEFAULT_COMPRESSION) or BACKUP_DEFAULT_COMPRESSION),
+                                  help="0 = schnell/groß, 9 = langsam/klein")
+                keep = st.number_input("Aufbewahren (Anzahl Dateien)", 1, 365,
+                                       int(ww_db.get_setting('backup_retention', BACKUP_DEFAULT_RETENTION) or BACKUP_DEFAULT_RETENTION))
+                if st.form_submit_button("💾 Speichern"):
+                    ww_db.set_setting('backup_compression_level', int(level))
+                    ww_db.set_setting('backup_retention', int(keep))
+                    st.success("✅ Gespeichert")
+        
+        job = get_scheduler().get_job('backup')
+        if job and job.next_run_time:
+            st.caption(f"⏰ Nächstes automatisches Backup: {job.next_run_time.strftime('%d.%m.%Y %H:%M')}")
+        
+        report = last_backup_report()
+        if report:
+            st.markdown("**Letztes Backup:**")
+            if report.get('status') == 'ok':
+                st.code(
+                    f"Start:      {report['started'][:19]}\n"
+                    f"Modus:      {report.get('mode')}\n"
+                    f"Dauer:      {report.get('duration_s')} s\n"
+                    f"Größe:      {report.get('bytes', 0) / 1024:.0f} KB (Stufe {report.get('compression_level')})\n"
+                    f"Dokumente:  {report.get('documents')} {report.get('counts')}\n"
+                    f"Datei:      {report.get('file')}\n"
+                    f"E-Mail:     {report.get('mail')}"
+                )
             else:
-                st.error("❌ Keine Admin-E-Mail konfiguriert")
+                st.error(f"❌ Backup fehlgeschlagen ({report['started'][:19]}): {report.get('error')}")
+
+    # ===== WIEDERHERSTELLUNG =====
+    st.divider()
+    st.subheader("♻️ Wiederherstellen / Import")
+    st.caption("Backup-ZIPs (voll + Deltas) oder NDJSON-Exporte einspielen. Mehrere Dateien werden in zeitlicher Reihenfolge angewendet. "
+               "Passwörter sind nicht enthalten - neu angelegte Benutzer brauchen einen Passwort-Reset.")
+    
+    uploads = st.file_uploader("Backup-Dateien", type=['zip', 'ndjson'], accept_multiple_files=True)
+    ndjson_target = st.selectbox(
+        "Ziel-Collection für NDJSON-Dateien", ['bookings', 'users', 'archive'],
+        format_func=lambda c: {'bookings': 'Buchungen', 'users': 'Benutzer', 'archive': 'Archiv'}[c]
+    )
+    col_a, col_b = st.columns(2)
+    with col_a:
+        preserve_ids = st.checkbox("Dokument-IDs beibehalten (Upsert)", value=True)
+    with col_b:
+        dry_run = st.checkbox("Nur prüfen (Dry-Run)", value=True)
+    
+    if uploads and st.button("♻️ Wiederherstellung starten" if not dry_run else "🔍 Backup prüfen", type="primary"):
+        # Kette sortieren: Vollbackup vor Deltas, nach Zeitstempel
+        ordered = []
+        for upload in uploads:
+            manifest = backup_manifest(upload, upload.name)
+            upload.seek(0)
+            ordered.append(((manifest or {}).get('until', ''), manifest, upload))
+        ordered.sort(key=lambda x: x[0])
+        
+        progress_bar = st.progress(0.0)
+        status = st.empty()
+        total = sum(sum((m or {}).get('counts', {}).values()) for _, m, _ in ordered) or None
+        t0 = time.perf_counter()
+        
+        def _run(write):
+            all_counts, all_errors, no_password = Counter(), [], []
+            for _, manifest, upload in ordered:
+                upload.seek(0)
+                done_before = sum(all_counts.values())
+                
+                def _progress(processed, counts, name=upload.name, offset=done_before):
+                    if total:
+                        progress_bar.progress(min((offset + processed) / total, 1.0))
+                    status.caption(f"{name}: {processed} Datensätze {'geschrieben' if write else 'geprüft'}")
+                
+                counts, errors, users = restore_records(
+                    iter_backup_records(upload, upload.name, ndjson_target),
+                    preserve_ids=preserve_ids, dry_run=not write, progress=_progress
+                )
+                all_counts.update(counts)
+                all_errors += [f"{upload.name}: {e}" for e in errors]
+                no_password += users
+            progress_bar.progress(1.0)
+            return all_counts, all_errors, list(dict.fromkeys(no_password))
+        
+        # Immer erst alle Dateien komplett prüfen - geschrieben wird nur ein fehlerfreies Backup
+        all_counts, all_errors, _ = _run(write=False)
+        summary = ", ".join(f"{c}: {n}" for c, n in all_counts.items()) or "keine Datensätze"
+        if dry_run:
+            st.info(f"🔍 Prüfung abgeschlossen ({time.perf_counter() - t0:.1f} s) - gültig: {summary}")
+        elif all_errors:
+            st.error("❌ Backup enthält ungültige Datensätze - es wurde nichts geschrieben")
+        else:
+            all_counts, _, no_password = _run(write=True)
+            summary = ", ".join(f"{c}: {n}" for c, n in all_counts.items()) or "keine Datensätze"
+            st.success(f"✅ Wiederhergestellt in {time.perf_counter() - t0:.1f} s - {summary}")
+            if no_password:
+                # Passwörter werden nie mitgesichert
+                st.warning(f"🔑 {len(no_password)} Benutzer ohne Passwort - Anmeldung erst nach "
+                           "'Passwort zurücksetzen' in der Benutzerverwaltung möglich")
+                st.code("\n".join(no_password[:50]))
+        if all_errors:
+            st.warning(f"⚠️ {len(all_errors)} ungültige Datensätze")
+            st.code("\n".join(all_errors[:50]))
 
 # ===== DEBUG-PANEL (ADMIN) =====
 def debug_page():
@@ -2830,8 +6805,21 @@ Client: {'✅ OK' if sms_client.client else '❌ FEHLER'}
         st.code(f"Verbindung: {'✅ OK' if db else '❌ FEHLER'}")
         
         st.markdown("**Benutzer in DB:**")
-        users_count = len(ww_db.get_all_users())
+        users_count = ww_db.count_users()
         st.code(f"Anzahl: {users_count}")
+        
+        st.markdown("**Excel-Export Benchmark:**")
+        if st.button("⏱️ Excel mit 10.000 Buchungen messen"):
+            with st.spinner("Erstelle Test-Datei..."):
+                seconds, size = benchmark_roster_xlsx(10000, years=5)
+            st.code(f"10.000 Buchungen / 5 Jahre: {seconds:.2f} s | {size / 1024:.0f} KB")
+        
+        st.markdown("**Request-Coalescing (prozessweit):**")
+        flight_report = ww_db.flight.report()
+        if flight_report:
+            st.dataframe(pd.DataFrame(flight_report), use_container_width=True, hide_index=True)
+        else:
+            st.caption("Noch keine Reads gezählt")
 
 # ===== HANDBUCH (MIT EDIT-FUNKTION) =====
 def handbuch_page():
@@ -3113,6 +7101,70 @@ Bei Fragen erreichst du uns unter {org_email}.
 
 Viele Grüße,
 Dein {org_name} Team"""
+        },
+        'email_booking_summary': {
+            'name': '✉️ E-Mail - Sammel-Bestätigung (mehrere Dienste)',
+            'type': 'email',
+            'default_subject': 'Deine Dienste ({count})',
+            'default_body': """Hallo {name},
+
+für dich wurden {count} Dienste eingetragen:
+
+{shifts}
+
+Bei Fragen melde dich gerne unter {org_email}.
+
+Viele Grüße,
+Dein {org_name} Team 🌊"""
+        },
+        'email_free_slot_alert': {
+            'name': '✉️ E-Mail - Offene Dienste (an verfügbare Helfer)',
+            'type': 'email',
+            'default_subject': 'Helfer gesucht: {count} offene Dienste',
+            'default_body': """Hallo {name},
+
+für folgende Dienste werden noch Helfer gesucht - laut deinem Profil hättest du Zeit:
+
+{shifts}
+
+Buchen kannst du direkt im Dienstplan. Danke für deine Unterstützung!
+
+Viele Grüße,
+Dein {org_name} Team 🌊"""
+        },
+        'email_waitlist_promoted': {
+            'name': '✉️ E-Mail - Von Warteliste nachgerückt',
+            'type': 'email',
+            'default_subject': 'Nachgerückt: Dienst am {date}',
+            'default_body': """Hallo {name},
+
+gute Nachricht: Auf der Warteliste bist du nachgerückt und jetzt fest eingetragen!
+
+📅 Datum: {date}
+⏰ Zeit: {time}
+
+Falls du doch nicht kannst, storniere bitte im Dienstplan, damit der Nächste nachrücken kann.
+
+Viele Grüße,
+Dein {org_name} Team 🌊"""
+        },
+        'email_rebooking': {
+            'name': '✉️ E-Mail - Umbuchung / Tausch durch Admin',
+            'type': 'email',
+            'default_subject': 'Änderung deiner Dienste',
+            'default_body': """Hallo {name},
+
+deine Einteilung wurde von der Dienstplanung geändert:
+
+Bisher: {old_shift}
+Neu: {new_shift}
+
+{comment}
+
+Bei Fragen melde dich gerne unter {org_email}.
+
+Viele Grüße,
+Dein {org_name} Team 🌊"""
         },
         'email_admin_notification': {
             'name': '✉️ E-Mail - Admin-Benachrichtigung (neue Buchung)',
@@ -3292,6 +7344,12 @@ Gesendet am {current_date}"""
 
 # ===== MAIN =====
 def main():
+    # Rollups und Limit-Zähler müssen vor der ersten Buchung/Stornierung stehen
+    ensure_stats_rollups()
+    ensure_member_counters()
+    # Hintergrund-Jobs (Backup, Wartelisten-Sweep) einmal pro Prozess starten - cache_resource
+    get_scheduler()
+    
     # CSS injizieren
     inject_css(dark=st.session_state.dark_mode)
     